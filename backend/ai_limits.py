@@ -0,0 +1,234 @@
+"""
+Admission control for AI-backed requests.
+
+Every endpoint that calls the model holds one slot for as long as it runs.
+Slots are bounded globally (upstream capacity) and per user (one user can't
+occupy the whole pool). Requests over the global limit wait in a bounded
+queue; instead of letting them time out, the service sheds load early:
+
+- 429 + Retry-After when the user already has their maximum in flight;
+- 503 + Retry-After when the wait queue is full, or a queued request hasn't
+  got a slot within AI_QUEUE_TIMEOUT.
+
+    AI_MAX_CONCURRENCY=32
+    AI_MAX_CONCURRENCY_PER_USER=2
+    AI_MAX_QUEUE=64
+    AI_QUEUE_TIMEOUT=15
+    AI_RETRY_AFTER=5        # Retry-After hint until there's latency data
+"""
+import os
+import math
+import asyncio
+import threading
+import contextlib
+from collections import deque
+
+import model_routing
+
+AI_MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "32"))
+AI_MAX_CONCURRENCY_PER_USER = int(os.getenv("AI_MAX_CONCURRENCY_PER_USER", "2"))
+AI_MAX_QUEUE = int(os.getenv("AI_MAX_QUEUE", "64"))
+AI_QUEUE_TIMEOUT = float(os.getenv("AI_QUEUE_TIMEOUT", "15"))
+AI_RETRY_AFTER = int(os.getenv("AI_RETRY_AFTER", "5"))
+
+
+class Overloaded(Exception):
+    """
+    Raised instead of admitting a request. `status` is 429 (this user) or
+    503 (the service); `retry_after` is in seconds.
+    """
+
+    def __init__(self, status, detail, retry_after):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(True)
+
+
+def retry_after():
+    # About one typical AI request from now, when slots start freeing up
+    median = model_routing.recent_percentile(model_routing.DEFAULT_TIER, 0.5, min_samples=5)
+    return max(1, math.ceil(median if median is not None else AI_RETRY_AFTER))
+
+
+class _Waiter:
+    __slots__ = ("loop", "future", "granted")
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+
+
+class Lease:
+    """
+    One admitted request. release() is idempotent; a lease dropped without
+    being released (e.g. a stream that never started) is released when it
+    is garbage collected. The collector can run while this thread already
+    holds the limiter's lock, so that path never waits for it.
+    """
+
+    def __init__(self, limiter, user_id):
+        self._limiter = limiter
+        self._user_id = user_id
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release(self._user_id)
+
+    def __del__(self):
+        if not self._released:
+            self._released = True
+            self._limiter._release_later(self._user_id)
+
+
+class Limiter:
+    def __init__(self, max_concurrency, per_user, max_queue, queue_timeout):
+        self.max_concurrency = max_concurrency
+        self.per_user = per_user
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        # Users of leases collected without release(), freed by the next lock holder
+        self._orphans = deque()
+        self._active = 0
+        self._users = {}
+        self._waiters = deque()
+        self._stats = {"admitted": 0, "queued": 0, "rejected_user": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self._lock:
+            try:
+                yield
+            finally:
+                self._release_orphans()
+
+    def _release_orphans(self):
+        while self._orphans:
+            self._drop_user(self._orphans.popleft())
+            self._release_slot()
+
+    def _release_later(self, user_id):
+        # Never blocks: deque.append is atomic, and the lock is only taken if it's free right now
+        self._orphans.append(user_id)
+        if self._lock.acquire(blocking=False):
+            try:
+                self._release_orphans()
+            finally:
+                self._lock.release()
+
+    def _release_slot(self):
+        # Hand the slot straight to the next waiter, or free it
+        if self._waiters:
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+        else:
+            self._active -= 1
+
+    def _drop_user(self, user_id):
+        remaining = self._users.get(user_id, 0) - 1
+        if remaining > 0:
+            self._users[user_id] = remaining
+        else:
+            self._users.pop(user_id, None)
+
+    def _release(self, user_id):
+        with self._locked():
+            self._drop_user(user_id)
+            self._release_slot()
+
+    async def acquire(self, user_id):
+        """
+        Returns a Lease once the request may call the model; raises Overloaded.
+        """
+        user_id = user_id or "anonymous"
+        with self._locked():
+            if self.per_user and self._users.get(user_id, 0) >= self.per_user:
+                self._stats["rejected_user"] += 1
+                raise Overloaded(429, "Too many AI requests in progress for this user", retry_after())
+            if self._active < self.max_concurrency:
+                self._active += 1
+                self._users[user_id] = self._users.get(user_id, 0) + 1
+                self._stats["admitted"] += 1
+                return Lease(self, user_id)
+            if len(self._waiters) >= self.max_queue:
+                self._stats["rejected_queue_full"] += 1
+                raise Overloaded(503, "AI service is at capacity", retry_after())
+            waiter = _Waiter()
+            self._waiters.append(waiter)
+            self._users[user_id] = self._users.get(user_id, 0) + 1
+            self._stats["queued"] += 1
+
+        try:
+            await asyncio.wait_for(waiter.future, self.queue_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._locked():
+                if waiter.granted:
+                    if isinstance(e, asyncio.TimeoutError):
+                        # The slot arrived just as we gave up on it: use it
+                        self._stats["admitted"] += 1
+                        return Lease(self, user_id)
+                    self._drop_user(user_id)
+                    self._release_slot()
+                else:
+                    self._waiters.remove(waiter)
+                    self._drop_user(user_id)
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._stats["rejected_timeout"] += 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise Overloaded(503, "Timed out waiting for AI capacity", retry_after())
+            raise
+        with self._locked():
+            self._stats["admitted"] += 1
+        return Lease(self, user_id)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, user_id):
+        lease = await self.acquire(user_id)
+        try:
+            yield lease
+        finally:
+            lease.release()
+
+    def stats(self):
+        with self._locked():
+            snapshot = dict(self._stats)
+            snapshot.update({
+                "active": self._active,
+                "waiting": len(self._waiters),
+                "users_in_flight": len(self._users),
+            })
+        snapshot.update({
+            "max_concurrency": self.max_concurrency,
+            "max_per_user": self.per_user,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+        })
+        return snapshot
+
+
+limiter = Limiter(AI_MAX_CONCURRENCY, AI_MAX_CONCURRENCY_PER_USER, AI_MAX_QUEUE, AI_QUEUE_TIMEOUT)
+
+
+def slot(user_id):
+    """
+    `async with ai_limits.slot(user_id):` around an AI-backed request.
+    """
+    return limiter.slot(user_id)
+
+
+async def acquire(user_id):
+    return await limiter.acquire(user_id)
+
+
+def stats():
+    return limiter.stats()
@@ -7,6 +7,7 @@ from jose import jwt, JWTError
 import json
 import requests
 import time
+import llm_usage
 
 security = HTTPBearer()
 
@@ -104,6 +105,8 @@ def get_current_user_claims(credentials: HTTPAuthorizationCredentials = Depends(
                 }
             )
             
+        # Attribute any AI calls made by this request to the user
+        llm_usage.set_user(payload.get("sub"))
         return payload
 
     except jwt.ExpiredSignatureError:
@@ -0,0 +1,103 @@
+"""
+Benchmark: the old regex `extract_json` vs the single-pass extractor in
+json_stream, on a corpus of real-looking (often malformed) LLM outputs.
+
+    python bench_json_extract.py --repeat 200
+
+bench_json_corpus.jsonl holds the hand-written cases (`expected` is the value
+a caller should get, null if none). Large roadmaps and a pathological
+"many unclosed braces" reply are generated on top to show how each extractor
+scales with response size.
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import json_stream
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_json_corpus.jsonl")
+
+
+def legacy_extract_json(text):
+    # The extractor ai_service used before json_stream.extract_json
+    if not text:
+        return None
+    json_match = re.search(r'\{.*\}', text, re.DOTALL)
+    if json_match:
+        try:
+            return json.loads(json_match.group())
+        except json.JSONDecodeError:
+            pass
+    try:
+        return json.loads(text)
+    except Exception:
+        return None
+
+
+def load_corpus():
+    with open(CORPUS) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def big_roadmap(tasks):
+    roadmap = {"title": "Your Personalized Python Roadmap", "phases": []}
+    for p in range(max(1, tasks // 40)):
+        modules = []
+        for m in range(4):
+            modules.append({"name": f"Module {p}.{m}", "tasks": [
+                {"title": f"Lesson {p}.{m}.{t}", "description": "Practice {dict} and [list] comprehensions", "estimated_time": 45,
+                 "output_deliverable": "A script", "resource_type": "Mixed"}
+                for t in range(10)
+            ]})
+        roadmap["phases"].append({"name": f"Phase {p}", "modules": modules})
+    return "Here is your roadmap:\n```json\n" + json.dumps(roadmap, indent=2) + "\n```\nGood luck {and have fun}!", roadmap
+
+
+def generated_cases():
+    cases = []
+    for tasks in (40, 400, 4000):
+        text, expected = big_roadmap(tasks)
+        cases.append({"name": f"roadmap_{len(text) // 1024}kb", "text": text, "expected": expected})
+    # Prose full of opening braces and no closing one: the greedy DOTALL regex
+    # retries from every "{" to the end of the text.
+    cases.append({"name": "unclosed_braces_8k", "text": "Use {x " * 8000, "expected": None})
+    return cases
+
+
+def time_per_call(fn, text, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn(text)
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    correct = {"legacy": 0, "single_pass": 0}
+    print(f"{'case':<28}{'legacy':>10}{'single-pass':>13}")
+    for case in corpus:
+        legacy_ok = legacy_extract_json(case["text"]) == case["expected"]
+        new_ok = json_stream.extract_json(case["text"]) == case["expected"]
+        correct["legacy"] += legacy_ok
+        correct["single_pass"] += new_ok
+        print(f"{case['name']:<28}{'ok' if legacy_ok else 'WRONG':>10}{'ok' if new_ok else 'WRONG':>13}")
+    print(f"\ncorrect: legacy {correct['legacy']}/{len(corpus)}, single-pass {correct['single_pass']}/{len(corpus)}\n")
+
+    print(f"{'case':<28}{'legacy ms':>12}{'single-pass ms':>16}")
+    for case in corpus + generated_cases():
+        repeat = args.repeat if len(case["text"]) < 100_000 else max(1, args.repeat // 50)
+        if case["name"].startswith("unclosed"):
+            repeat = 1
+        legacy_ms = time_per_call(legacy_extract_json, case["text"], repeat)
+        new_ms = time_per_call(json_stream.extract_json, case["text"], repeat)
+        print(f"{case['name']:<28}{legacy_ms:>12.3f}{new_ms:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
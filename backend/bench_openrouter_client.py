@@ -0,0 +1,133 @@
+"""
+Benchmark: per-call overhead of the old `requests.post` path vs the pooled
+httpx clients in openrouter_client.
+
+Runs a local OpenAI-compatible stub so no OpenRouter credits are used:
+
+    python bench_openrouter_client.py --calls 200 --concurrency 10
+
+Note: the stub is plain HTTP on localhost, so the numbers only show the TCP
+connect + request setup saved by keep-alive. Against openrouter.ai every
+fresh connection also pays DNS and a TLS handshake, so real savings are larger.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import openrouter_client
+
+COMPLETION = json.dumps({
+    "id": "bench",
+    "object": "chat.completion",
+    "model": "stub",
+    "choices": [{"index": 0, "message": {"role": "assistant", "content": "{\"level\": \"Beginner\", \"message\": \"ok\"}"}, "finish_reason": "stop"}],
+    "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+}).encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True  # headers and body are separate writes
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(COMPLETION)))
+        self.end_headers()
+        self.wfile.write(COMPLETION)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions"
+
+
+HEADERS = {"Authorization": "Bearer bench", "Content-Type": "application/json"}
+PAYLOAD = {"model": "stub", "messages": [{"role": "user", "content": "hello"}]}
+
+
+def bench_requests(url, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        response = requests.post(url, headers=HEADERS, json=PAYLOAD, timeout=120)
+        response.json()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_pooled(url, calls):
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        response = openrouter_client.post(url, HEADERS, PAYLOAD)
+        response.json()
+        timings.append(time.perf_counter() - start)
+    openrouter_client.close_client()
+    return timings
+
+
+async def bench_async(url, calls, concurrency):
+    timings = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            response = await openrouter_client.apost(url, HEADERS, PAYLOAD)
+            response.json()
+            timings.append(time.perf_counter() - start)
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    wall = time.perf_counter() - wall
+    await openrouter_client.aclose_client()
+    return timings, wall
+
+
+def report(name, timings, wall=None):
+    ordered = sorted(timings)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    line = (f"{name:<34} mean {statistics.mean(timings) * 1000:7.2f} ms"
+            f"  p50 {statistics.median(timings) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms")
+    if wall is not None:
+        line += f"  ({len(timings) / wall:,.0f} calls/s)"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    server, url = start_stub()
+    print(f"Stub listening on {url} (http2 client support: {openrouter_client.OPENROUTER_HTTP2})")
+
+    # Warm-up so imports / first-connection costs don't skew either side
+    bench_requests(url, 5)
+    bench_pooled(url, 5)
+
+    report("requests.post (new conn per call)", bench_requests(url, args.calls))
+    report("pooled httpx.Client", bench_pooled(url, args.calls))
+    report("pooled httpx.AsyncClient (serial)", *asyncio.run(bench_async(url, args.calls, 1)))
+    report(f"pooled httpx.AsyncClient (x{args.concurrency})", *asyncio.run(bench_async(url, args.calls, args.concurrency)))
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Per-(user, task) conversation memory for /chat.
+
+Each thread keeps its recent messages verbatim; once CHAT_MEMORY_COMPACT_BATCH
+messages have piled up beyond the newest CHAT_MEMORY_RECENT_MESSAGES, the
+older ones are folded into the thread's running summary by a background
+worker (one short "fast"-tier call) and deleted. The request path only reads:
+the summary and the recent messages go into the prompt, each clipped to its
+prompt_builder budget ("chat_summary", "history"), so the prompt stays the
+same size however long the conversation gets, also while a compaction is
+pending or has failed.
+
+    CHAT_MEMORY_ENABLED=true
+    CHAT_MEMORY_RECENT_MESSAGES=6     # kept verbatim (3 exchanges)
+    CHAT_MEMORY_COMPACT_BATCH=4       # older messages folded into the summary at a time
+"""
+import os
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import ai_service
+import llm_usage
+import prompt_builder
+from database import SessionLocal
+from models import ChatMessage, ChatThread
+
+logger = logging.getLogger(__name__)
+
+CHAT_MEMORY_ENABLED = os.getenv("CHAT_MEMORY_ENABLED", "true").lower() in ("1", "true", "yes")
+CHAT_MEMORY_RECENT_MESSAGES = int(os.getenv("CHAT_MEMORY_RECENT_MESSAGES", "6"))
+CHAT_MEMORY_COMPACT_BATCH = int(os.getenv("CHAT_MEMORY_COMPACT_BATCH", "4"))
+
+_lock = threading.Lock()
+_stats = {"turns": 0, "scheduled": 0, "compactions": 0, "compacted_messages": 0, "failed": 0}
+# thread ids with a compaction queued or running
+_inflight = set()
+_executor = None
+
+
+def _count(field, delta=1):
+    with _lock:
+        _stats[field] += delta
+
+
+def _ensure_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-memory")
+        return _executor
+
+
+def _thread(db, user_id, task_id):
+    return db.query(ChatThread).filter(ChatThread.user_id == user_id, ChatThread.task_id == task_id).first()
+
+
+def _pending(db, thread):
+    # Messages not folded into the summary yet, oldest first
+    return db.query(ChatMessage).filter(
+        ChatMessage.thread_id == thread.id, ChatMessage.id > (thread.summarized_through or 0)
+    ).order_by(ChatMessage.id).all()
+
+
+def _transcript(messages):
+    return "\n".join(f"{'Student' if m.role == 'user' else 'Mentor'}: {m.content.strip()}" for m in messages)
+
+
+def load(db, user_id, task_id):
+    """
+    (summary, recent messages as "Student:/Mentor:" lines) for the prompt, or
+    None when there is no conversation yet. Recent messages are the newest
+    that fit the "history" budget.
+    """
+    if not CHAT_MEMORY_ENABLED:
+        return None
+    thread = _thread(db, user_id, task_id)
+    if thread is None:
+        return None
+    limit = prompt_builder.budget("history") * prompt_builder.CHARS_PER_TOKEN
+    recent = []
+    used = 0
+    for message in reversed(_pending(db, thread)[-(CHAT_MEMORY_RECENT_MESSAGES + CHAT_MEMORY_COMPACT_BATCH):]):
+        used += len(message.content) + 10
+        if recent and used > limit:
+            break
+        recent.append(message)
+    if not recent and not thread.summary:
+        return None
+    return thread.summary, _transcript(reversed(recent))
+
+
+def record(db, user_id, task_id, question, answer):
+    """
+    Appends one exchange to the user's thread for the task and, if enough
+    older messages have piled up, queues their compaction.
+    """
+    if not CHAT_MEMORY_ENABLED or not answer:
+        return
+    thread = _thread(db, user_id, task_id)
+    if thread is None:
+        thread = ChatThread(user_id=user_id, task_id=task_id, summarized_through=0)
+        db.add(thread)
+        db.flush()
+    db.add(ChatMessage(thread_id=thread.id, role="user", content=question))
+    db.add(ChatMessage(thread_id=thread.id, role="assistant", content=answer))
+    thread.updated_at = datetime.utcnow()
+    db.commit()
+    _count("turns")
+    if len(_pending(db, thread)) >= CHAT_MEMORY_RECENT_MESSAGES + CHAT_MEMORY_COMPACT_BATCH:
+        _schedule(thread.id)
+
+
+def _schedule(thread_id):
+    with _lock:
+        if thread_id in _inflight:
+            return
+        _inflight.add(thread_id)
+        _stats["scheduled"] += 1
+    endpoint, user_id = llm_usage.current()
+    _ensure_executor().submit(_compact, thread_id, endpoint, user_id)
+
+
+def compact(thread_id):
+    """
+    Folds all but the newest CHAT_MEMORY_RECENT_MESSAGES into the thread's
+    summary. Blocking; returns whether anything was folded.
+    """
+    db = SessionLocal()
+    try:
+        thread = db.query(ChatThread).filter(ChatThread.id == thread_id).first()
+        if thread is None:
+            return False
+        pending = _pending(db, thread)
+        fold = pending[:max(0, len(pending) - CHAT_MEMORY_RECENT_MESSAGES)]
+        if not fold:
+            return False
+        previous, through, last = thread.summary, thread.summarized_through or 0, fold[-1].id
+        turns = _transcript(fold)
+    finally:
+        # Nothing held open across the model call
+        db.close()
+
+    summary = ai_service.summarize_conversation(previous, turns)
+    if not summary:
+        _count("failed")
+        return False
+
+    db = SessionLocal()
+    try:
+        # Only if nobody folded these meanwhile
+        updated = db.query(ChatThread).filter(
+            ChatThread.id == thread_id, ChatThread.summarized_through == through
+        ).update({"summary": summary.strip(), "summarized_through": last, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        if updated:
+            db.query(ChatMessage).filter(ChatMessage.thread_id == thread_id, ChatMessage.id <= last).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+    if updated:
+        _count("compactions")
+        _count("compacted_messages", len(fold))
+    return bool(updated)
+
+
+def _compact(thread_id, endpoint, user_id):
+    # Attributed to the chat request that filled the window
+    llm_usage.begin(endpoint)
+    llm_usage.set_user(user_id)
+    try:
+        compact(thread_id)
+    except Exception as e:
+        _count("failed")
+        logger.warning("Compacting chat thread %s failed: %s", thread_id, e)
+    finally:
+        with _lock:
+            _inflight.discard(thread_id)
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["in_flight"] = len(_inflight)
+    snapshot["enabled"] = CHAT_MEMORY_ENABLED
+    snapshot["recent_messages"] = CHAT_MEMORY_RECENT_MESSAGES
+    return snapshot
@@ -0,0 +1,73 @@
+"""
+Shared setup for the backend tests.
+
+Every test runs against a fresh SQLite database of its own, so whatever one
+test stores (templates, catalog entries, cached replies) never reaches
+another. Tests that talk to a model start a local OpenRouter stand-in with
+`openrouter_stub(Handler)`; it is shut down and ai_service restored after the
+test.
+"""
+import os
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer
+
+# Before anything imports database.py, so no test ever touches the dev database
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/zuno_test.db"
+os.environ["SUPABASE_JWT_SECRET"] = "test-secret"
+
+import pytest
+from jose import jwt
+from sqlalchemy import create_engine
+
+import database
+import models  # noqa: F401 - registers every table on Base
+
+
+@pytest.fixture(autouse=True)
+def fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/zuno_test.db", connect_args={"check_same_thread": False})
+    database.Base.metadata.create_all(bind=engine)
+    # Modules hold on to the SessionLocal factory, so it is rebound in place
+    saved = database.engine
+    database.engine = engine
+    database.SessionLocal.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        database.SessionLocal.configure(bind=saved)
+        database.engine = saved
+        engine.dispose()
+
+
+@pytest.fixture
+def openrouter_stub(monkeypatch):
+    """
+    start(Handler) serves Handler (an OpenAI-compatible BaseHTTPRequestHandler)
+    on a free local port and points ai_service at it. Returns the server.
+    """
+    import ai_service
+    servers = []
+
+    def start(handler):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(ai_service, "OPENROUTER_URL", f"http://127.0.0.1:{server.server_address[1]}/v1/chat/completions")
+        monkeypatch.setattr(ai_service, "OPENROUTER_API_KEY", "test")
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+@pytest.fixture
+def auth_headers():
+    """
+    auth_headers(user_id) -> Authorization header with a valid token for that user.
+    """
+    def headers(user_id, email=None):
+        claims = {"sub": user_id, "email": email or f"{user_id}@example.com", "exp": 4102444800}
+        return {"Authorization": f"Bearer {jwt.encode(claims, 'test-secret', algorithm='HS256')}"}
+    return headers
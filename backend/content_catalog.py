@@ -0,0 +1,157 @@
+"""
+Shared catalog of enriched daily task content.
+
+Users on similar roadmaps reach the same topics, and each of them used to get
+a fresh YouTube search and LLM description for it. Every successful
+generation is now kept under its normalized (subject, topic, level, time
+bucket); the next user to reach that topic is served the stored description
+and resources, and the generators only run on a miss.
+
+- A key keeps up to CONTENT_CATALOG_VARIANTS variants, the best ones by
+  quality. "Regenerate resources" asks for variety: it is served a variant
+  the task doesn't have yet, and only generates (adding a variant) when none
+  is left.
+- Quality is the share of resources that are verified videos or curated
+  links, so content generated while YouTube search was failing (search-link
+  fallback only) is never kept.
+- Entries older than CONTENT_CATALOG_MAX_AGE_DAYS are not served: videos get
+  taken down or made private, and a new generation re-validates them.
+
+    CONTENT_CATALOG_ENABLED=true
+    CONTENT_CATALOG_MAX_AGE_DAYS=14
+    CONTENT_CATALOG_VARIANTS=3
+    CONTENT_CATALOG_MIN_QUALITY=0.6
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timedelta
+from models import ContentCatalogEntry
+from roadmap_templates import normalize
+
+logger = logging.getLogger(__name__)
+
+CONTENT_CATALOG_ENABLED = os.getenv("CONTENT_CATALOG_ENABLED", "true").lower() in ("1", "true", "yes")
+CONTENT_CATALOG_MAX_AGE_DAYS = int(os.getenv("CONTENT_CATALOG_MAX_AGE_DAYS", "14"))
+CONTENT_CATALOG_VARIANTS = int(os.getenv("CONTENT_CATALOG_VARIANTS", "3"))
+CONTENT_CATALOG_MIN_QUALITY = float(os.getenv("CONTENT_CATALOG_MIN_QUALITY", "0.6"))
+
+# Per-resource weights for quality()
+_VERIFIED_VIDEO = 1.0
+_CURATED_LINK = 0.75
+_SEARCH_FALLBACK = 0.25
+
+_lock = threading.Lock()
+_stats = {"served": 0, "misses": 0, "exhausted": 0, "stored": 0, "rejected": 0, "errors": 0}
+
+
+def _count(field):
+    with _lock:
+        _stats[field] += 1
+
+
+def time_bucket(minutes):
+    # Matches the daily task prompt's split between a basics-only and an exercise session
+    minutes = minutes or 45
+    if minutes < 45:
+        return "short"
+    return "standard" if minutes < 90 else "long"
+
+
+def catalog_key(subject, topic, level, minutes):
+    return "|".join((normalize(subject), normalize(topic), normalize(level), time_bucket(minutes)))
+
+
+def quality(resources):
+    if not resources:
+        return 0.0
+    total = 0.0
+    for res in resources:
+        if res.get("video_confidence") == "fallback":
+            total += _SEARCH_FALLBACK
+        elif res.get("platform") == "YouTube":
+            total += _VERIFIED_VIDEO if res.get("is_embeddable") else _SEARCH_FALLBACK
+        else:
+            total += _CURATED_LINK
+    return round(total / len(resources), 3)
+
+
+def _urls(resources):
+    return {res.get("url") for res in resources if res.get("url")}
+
+
+def find(db, subject, topic, level, minutes, exclude_urls=None):
+    """
+    Catalog content {"description", "resources"} for this task, or None.
+    With `exclude_urls` (the task's current resources), only a variant that
+    offers something new is returned. Counts the use on the caller's
+    session; the caller commits.
+    """
+    if not CONTENT_CATALOG_ENABLED:
+        return None
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=CONTENT_CATALOG_MAX_AGE_DAYS)
+        variants = db.query(ContentCatalogEntry).filter(
+            ContentCatalogEntry.key == catalog_key(subject, topic, level, minutes),
+            ContentCatalogEntry.created_at >= cutoff,
+        ).order_by(ContentCatalogEntry.quality.desc(), ContentCatalogEntry.uses).all()
+        exclude = set(exclude_urls or ())
+        entry = next((v for v in variants if not _urls(json.loads(v.resources)) <= exclude), None) if exclude else (
+            variants[0] if variants else None
+        )
+    except Exception as e:
+        _count("errors")
+        logger.warning("Content catalog lookup failed: %s", e)
+        return None
+
+    if entry is None:
+        _count("exhausted" if exclude and variants else "misses")
+        return None
+    entry.uses = (entry.uses or 0) + 1
+    _count("served")
+    return {"description": entry.description, "resources": json.loads(entry.resources)}
+
+
+def remember(db, subject, topic, level, minutes, description, resources):
+    """
+    Adds freshly generated content as a variant for its key, keeping the
+    best CONTENT_CATALOG_VARIANTS. Adds to the caller's session; the caller
+    commits.
+    """
+    if not CONTENT_CATALOG_ENABLED or not description or not resources:
+        return
+    score = quality(resources)
+    if score < CONTENT_CATALOG_MIN_QUALITY:
+        _count("rejected")
+        return
+    key = catalog_key(subject, topic, level, minutes)
+    try:
+        variants = db.query(ContentCatalogEntry).filter(ContentCatalogEntry.key == key).all()
+        if any(_urls(json.loads(v.resources)) == _urls(resources) for v in variants):
+            # The same resources again (e.g. an LLM cache hit)
+            return
+        db.add(ContentCatalogEntry(
+            key=key, subject=normalize(subject), topic=normalize(topic), level=normalize(level),
+            time_bucket=time_bucket(minutes), description=description, resources=json.dumps(resources),
+            quality=score, uses=0, created_at=datetime.utcnow(),
+        ))
+        # Fresh beats stale, then the best quality
+        cutoff = datetime.utcnow() - timedelta(days=CONTENT_CATALOG_MAX_AGE_DAYS)
+        ranked = sorted(variants, key=lambda v: (v.created_at >= cutoff, v.quality, v.created_at), reverse=True)
+        for stale in ranked[max(0, CONTENT_CATALOG_VARIANTS - 1):]:
+            db.delete(stale)
+        db.flush()
+        _count("stored")
+    except Exception as e:
+        _count("errors")
+        logger.warning("Could not store catalog content for %s: %s", key, e)
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+    snapshot["enabled"] = CONTENT_CATALOG_ENABLED
+    lookups = snapshot["served"] + snapshot["misses"]
+    snapshot["hit_rate"] = round(snapshot["served"] / lookups, 3) if lookups else 0.0
+    return snapshot
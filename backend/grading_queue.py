@@ -0,0 +1,173 @@
+"""
+Micro-batched submission grading.
+
+Submissions that arrive within a short window of each other (deadline bursts)
+are graded with one multi-item prompt instead of one LLM call each, which
+shares the system prompt and grading criteria across the batch. Callers wait
+until their own result is ready (grade blocks its thread, agrade awaits). A
+submission is graded on its own when it arrives alone, or when the batch
+reply is unusable or leaves it out.
+
+    GRADING_BATCH_ENABLED=true
+    GRADING_BATCH_WINDOW_MS=150   # how long the first submission waits for company
+    GRADING_BATCH_MAX=8           # submissions per prompt
+    GRADING_BATCH_CONCURRENCY=4   # batch calls in flight at once
+"""
+import os
+import time
+import asyncio
+import queue
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ai_service
+import llm_usage
+
+logger = logging.getLogger(__name__)
+
+GRADING_BATCH_ENABLED = os.getenv("GRADING_BATCH_ENABLED", "true").lower() in ("1", "true", "yes")
+GRADING_BATCH_WINDOW = int(os.getenv("GRADING_BATCH_WINDOW_MS", "150")) / 1000
+GRADING_BATCH_MAX = int(os.getenv("GRADING_BATCH_MAX", "8"))
+GRADING_BATCH_CONCURRENCY = int(os.getenv("GRADING_BATCH_CONCURRENCY", "4"))
+
+_lock = threading.Lock()
+_stats = {"submissions": 0, "batches": 0, "batched": 0, "single": 0, "fallbacks": 0, "batch_errors": 0, "max_batch": 0}
+_queue = queue.Queue()
+_collector = None
+_executor = None
+
+
+class _Pending:
+    def __init__(self, task_description, user_text, level, endpoint, loop=None):
+        self.args = (task_description, user_text, level)
+        self.endpoint = endpoint
+        self.event = threading.Event()
+        # Async callers wait on a future on their own loop instead of a thread
+        self.loop = loop
+        self.future = loop.create_future() if loop else None
+        self.result = None
+        self.graded = False
+
+    def done(self):
+        self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def _count(**deltas):
+    with _lock:
+        for field, delta in deltas.items():
+            _stats[field] += delta
+
+
+def _ensure_collector():
+    global _collector, _executor
+    with _lock:
+        if _collector is None or not _collector.is_alive():
+            _executor = ThreadPoolExecutor(max_workers=GRADING_BATCH_CONCURRENCY, thread_name_prefix="grading-batch")
+            _collector = threading.Thread(target=_collect_loop, name="grading-queue", daemon=True)
+            _collector.start()
+
+
+def _collect_loop():
+    while True:
+        batch = [_queue.get()]
+        deadline = time.monotonic() + GRADING_BATCH_WINDOW
+        while len(batch) < GRADING_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        if len(batch) == 1:
+            # Nobody to share a prompt with: the caller grades it itself
+            batch[0].done()
+            continue
+        _executor.submit(_grade_batch, batch)
+
+
+def _grade_batch(batch):
+    # The call is shared by several users, so it's attributed to the endpoint only
+    llm_usage.begin(batch[0].endpoint)
+    results = [None] * len(batch)
+    try:
+        results = ai_service.evaluate_submissions_batch([item.args for item in batch])
+    except Exception as e:
+        _count(batch_errors=1)
+        logger.warning("Batched grading of %d submissions failed: %s", len(batch), e)
+    finally:
+        graded = 0
+        for item, result in zip(batch, results):
+            if result is not None:
+                item.result, item.graded = result, True
+                graded += 1
+            item.done()
+        _count(batches=1, batched=graded, fallbacks=len(batch) - graded)
+        with _lock:
+            _stats["max_batch"] = max(_stats["max_batch"], len(batch))
+
+
+def grade(task_description, user_text, level="Beginner"):
+    """
+    Drop-in for ai_service.evaluate_submission_content: returns the same JSON
+    string (or None), possibly graded together with concurrent submissions.
+    Blocks the calling thread for up to GRADING_BATCH_WINDOW plus the call.
+    """
+    _count(submissions=1)
+    if not GRADING_BATCH_ENABLED or GRADING_BATCH_MAX < 2:
+        _count(single=1)
+        return ai_service.evaluate_submission_content(task_description, user_text, level)
+
+    endpoint, _ = llm_usage.current()
+    item = _Pending(task_description, user_text, level, endpoint)
+    _ensure_collector()
+    _queue.put(item)
+    item.event.wait()
+    if item.graded:
+        return item.result
+
+    # Graded alone, in the caller's thread so usage is attributed to its user
+    _count(single=1)
+    return ai_service.evaluate_submission_content(task_description, user_text, level)
+
+
+async def agrade(task_description, user_text, level="Beginner"):
+    """
+    Async variant of grade: waits for the batch without holding a thread.
+    """
+    _count(submissions=1)
+    if not GRADING_BATCH_ENABLED or GRADING_BATCH_MAX < 2:
+        _count(single=1)
+        return await ai_service.aevaluate_submission_content(task_description, user_text, level)
+
+    endpoint, _ = llm_usage.current()
+    item = _Pending(task_description, user_text, level, endpoint, asyncio.get_running_loop())
+    _ensure_collector()
+    _queue.put(item)
+    await item.future
+    if item.graded:
+        return item.result
+
+    _count(single=1)
+    return await ai_service.aevaluate_submission_content(task_description, user_text, level)
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+    snapshot["enabled"] = GRADING_BATCH_ENABLED and GRADING_BATCH_MAX > 1
+    snapshot["window_ms"] = int(GRADING_BATCH_WINDOW * 1000)
+    snapshot["max_batch_size"] = GRADING_BATCH_MAX
+    snapshot["avg_batch"] = round((snapshot["batched"] + snapshot["fallbacks"]) / snapshot["batches"], 2) if snapshot["batches"] else 0.0
+    # Upstream grading calls per submission; 1.0 means no batching benefit
+    calls = snapshot["batches"] + snapshot["single"]
+    snapshot["calls_per_submission"] = round(calls / snapshot["submissions"], 3) if snapshot["submissions"] else 0.0
+    return snapshot
@@ -0,0 +1,301 @@
+"""
+JSON parsing for LLM completions.
+
+`IncrementalJSONParser` is fed text chunks as they arrive and reports every
+string, object or array whose path matches one of the watched patterns as
+soon as that value is complete, e.g. each task of a roadmap while later phases
+are still being generated. Each character is scanned once.
+
+`iter_json_values` / `extract_json` pull the top-level JSON values out of a
+complete reply that may wrap them in prose or markdown code fences, also in a
+single pass.
+"""
+import re
+import json
+
+WILDCARD = "*"
+
+
+class _Frame:
+    __slots__ = ("kind", "start", "path", "key", "index", "expect_key")
+
+    def __init__(self, kind, start, path):
+        self.kind = kind  # "object" | "array"
+        self.start = start
+        self.path = path
+        self.key = None
+        self.index = 0
+        self.expect_key = kind == "object"
+
+    def child_path(self):
+        return self.path + ((self.key,) if self.kind == "object" else (self.index,))
+
+
+def path_matches(path, pattern):
+    if len(path) != len(pattern):
+        return False
+    return all(p == WILDCARD or p == part for part, p in zip(path, pattern))
+
+
+class IncrementalJSONParser:
+    """
+    Usage:
+        parser = IncrementalJSONParser(patterns=[("phases", "*", "name")])
+        for chunk in stream:
+            for path, value in parser.feed(chunk):
+                ...
+        data = parser.result()
+
+    Leading prose or a ```json fence before the first `{`/`[` is skipped,
+    and anything after the top-level value is ignored.
+    """
+
+    def __init__(self, patterns=()):
+        self.patterns = [tuple(p) for p in patterns]
+        self.buffer = ""
+        self.done = False
+        self._pos = 0
+        self._root_start = None
+        self._root_end = None
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+
+    def _watched(self, path):
+        return any(path_matches(path, pattern) for pattern in self.patterns)
+
+    def feed(self, chunk):
+        """
+        Consumes `chunk` and returns a list of (path, value) for every
+        watched value completed by it.
+        """
+        events = []
+        if self.done or not chunk:
+            return events
+
+        self.buffer += chunk
+        buffer = self.buffer
+        pos = self._pos
+        end = len(buffer)
+        stack = self._stack
+
+        while pos < end:
+            char = buffer[pos]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._close_string(pos, events)
+                pos += 1
+                continue
+
+            if self._root_start is None:
+                if char == "{" or char == "[":
+                    self._root_start = pos
+                else:
+                    pos += 1
+                    continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_start = pos
+                top = stack[-1] if stack else None
+                self._string_is_key = bool(top and top.kind == "object" and top.expect_key)
+            elif char == "{" or char == "[":
+                path = stack[-1].child_path() if stack else ()
+                stack.append(_Frame("object" if char == "{" else "array", pos, path))
+            elif char == "}" or char == "]":
+                if not stack:
+                    break
+                frame = stack.pop()
+                if self.patterns and self._watched(frame.path):
+                    try:
+                        events.append((frame.path, json.loads(buffer[frame.start:pos + 1])))
+                    except json.JSONDecodeError:
+                        pass
+                if not stack:
+                    self.done = True
+                    self._root_end = pos + 1
+                    pos += 1
+                    break
+            elif char == ",":
+                top = stack[-1] if stack else None
+                if top is not None:
+                    if top.kind == "object":
+                        top.expect_key = True
+                    else:
+                        top.index += 1
+            pos += 1
+
+        self._pos = pos
+        return events
+
+    def _close_string(self, pos, events):
+        stack = self._stack
+        if not stack:
+            return
+        top = stack[-1]
+        raw = self.buffer[self._string_start:pos + 1]
+        if self._string_is_key:
+            try:
+                top.key = json.loads(raw)
+            except json.JSONDecodeError:
+                top.key = raw[1:-1]
+            top.expect_key = False
+            return
+
+        path = top.child_path()
+        if self.patterns and self._watched(path):
+            try:
+                events.append((path, json.loads(raw)))
+            except json.JSONDecodeError:
+                pass
+
+    def result(self):
+        """
+        The complete top-level value, or None if it never finished / is invalid.
+        """
+        if self._root_end is None:
+            return None
+        try:
+            return json.loads(self.buffer[self._root_start:self._root_end])
+        except json.JSONDecodeError:
+            return None
+
+
+# A value can only start with `{"`/`{}` or `[` followed by something JSON-ish,
+# which keeps prose like "use {x} here" from opening a candidate.
+_CANDIDATE = re.compile(r'\{(?=\s*["}])|\[(?=\s*[\[{"\d\-tfn\]])|```')
+# Inside a value only these matter; string contents are skipped by the regex engine
+_STRUCTURE = re.compile(r'["{}\[\]]|```')
+_STRING_END = re.compile(r'["\\]')
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_CLOSERS = {"}": "{", "]": "["}
+_DECODER = json.JSONDecoder()
+# Fenced blocks with any other language tag are code samples, not the answer
+_JSON_FENCE_TAGS = {"", "json", "jsonc", "json5"}
+
+
+def _loads(candidate):
+    try:
+        return json.loads(candidate), True
+    except (json.JSONDecodeError, RecursionError):
+        pass
+    # Trailing commas are the most common hand-written-JSON slip models make
+    repaired = _TRAILING_COMMA.sub(r"\1", candidate)
+    if repaired != candidate:
+        try:
+            return json.loads(repaired), True
+        except (json.JSONDecodeError, RecursionError):
+            pass
+    return None, False
+
+
+def _scan_value(text, start):
+    """
+    Returns the end index (exclusive) of the balanced value starting at
+    `start`, or a negative "resume at" position (-pos - 1) if the brackets
+    don't match or a code fence / end of text cuts it off.
+    """
+    stack = [text[start]]
+    pos = start + 1
+    while True:
+        match = _STRUCTURE.search(text, pos)
+        if match is None:
+            return -len(text) - 1
+        char = match.group()
+        pos = match.end()
+        if char == '"':
+            while True:
+                end = _STRING_END.search(text, pos)
+                if end is None:
+                    return -len(text) - 1
+                if end.group() == "\\":
+                    pos = end.end() + 1
+                    continue
+                pos = end.end()
+                break
+        elif char == "{" or char == "[":
+            stack.append(char)
+        elif char == "```":
+            return -match.start() - 1
+        elif stack.pop() != _CLOSERS[char]:
+            return -match.start() - 1
+        elif not stack:
+            return pos
+
+
+def iter_json_values(text):
+    """
+    Yields every top-level JSON object/array in `text`, in order.
+    Linear time: a candidate is first decoded in place; only if that fails is
+    it bracket-matched (strings and fences respected) so the scan can resume
+    after it, and re-parsed once with trailing commas removed. Scanning never
+    re-enters a candidate it has moved past.
+    """
+    if not text:
+        return
+    pos = 0
+    length = len(text)
+    found = False
+    skipped = []  # (start, end) of code blocks with a non-JSON language tag
+    while pos < length:
+        match = _CANDIDATE.search(text, pos)
+        if match is None:
+            return
+        if match.group() == "```":
+            line_end = text.find("\n", match.end())
+            line_end = length if line_end == -1 else line_end
+            tag = text[match.end():line_end].strip().lower()
+            if tag in _JSON_FENCE_TAGS:
+                pos = line_end
+            else:
+                closing = text.find("```", line_end)
+                skipped.append((line_end, length if closing == -1 else closing))
+                pos = length if closing == -1 else closing + 3
+            continue
+
+        start = match.start()
+        # Fast path: well-formed values are parsed straight from the text in C
+        try:
+            value, end = _DECODER.raw_decode(text, start)
+        except (json.JSONDecodeError, RecursionError):
+            pass
+        else:
+            found = True
+            yield value
+            pos = end
+            continue
+
+        end = _scan_value(text, start)
+        if end < 0:
+            pos = max(-end - 1, start + 1)
+            continue
+        value, ok = _loads(text[start:end])
+        if ok:
+            found = True
+            yield value
+        pos = end
+
+    if not found:
+        # Nothing outside code samples - the model may have labelled its
+        # answer ```javascript or similar
+        for block_start, block_end in skipped:
+            yield from iter_json_values(text[block_start:block_end])
+
+
+def extract_json(text, kind=None):
+    """
+    The first JSON value in `text` (optionally the first of `kind`, dict or
+    list), or None.
+    """
+    for value in iter_json_values(text):
+        if kind is None or isinstance(value, kind):
+            return value
+    return None
@@ -0,0 +1,177 @@
+"""
+Persistent, content-addressed cache for LLM responses.
+
+Entries live in the `llm_cache` table so they survive restarts and are shared
+by every worker. Keys are a sha256 over the model and the whitespace-normalized
+messages, so two prompts that only differ in indentation hit the same entry.
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from models import LLMCacheEntry
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+
+# TTL in seconds per prompt type. 0 disables caching for that prompt
+# (user-specific answers such as grading or chat must never be shared).
+DEFAULT_TTLS = {
+    "detect_level": 7 * 24 * 3600,
+    "roadmap": 7 * 24 * 3600,
+    "roadmap_skeleton": 7 * 24 * 3600,
+    "roadmap_module": 7 * 24 * 3600,
+    "curated_resources": 24 * 3600,
+    "daily_task": 24 * 3600,
+    "evaluation": 0,
+    "evaluation_batch": 0,
+    "week_summary": 0,
+    "chat": 0,
+    "chat_summary": 0,
+}
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "bypassed": 0, "evictions": 0, "errors": 0, "by_prompt": {}}
+
+
+def ttl_for(prompt_type):
+    env_value = os.getenv(f"LLM_CACHE_TTL_{prompt_type.upper()}") if prompt_type else None
+    if env_value is not None:
+        return int(env_value)
+    return DEFAULT_TTLS.get(prompt_type, 0)
+
+
+def is_cacheable(prompt_type, use_cache=True):
+    return LLM_CACHE_ENABLED and use_cache and ttl_for(prompt_type) > 0
+
+
+def normalize_messages(messages):
+    return [[m.get("role", ""), " ".join((m.get("content") or "").split())] for m in messages]
+
+
+def cache_key(model, messages):
+    payload = json.dumps({"model": model, "messages": normalize_messages(messages)}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _count(field, prompt_type=None):
+    with _lock:
+        _stats[field] += 1
+        if prompt_type:
+            per_prompt = _stats["by_prompt"].setdefault(prompt_type, {"hits": 0, "misses": 0, "bypassed": 0})
+            if field in per_prompt:
+                per_prompt[field] += 1
+
+
+def get(model, messages, prompt_type, use_cache=True):
+    """
+    Returns the cached response text, or None on a miss / bypass.
+    """
+    if not is_cacheable(prompt_type, use_cache):
+        _count("bypassed", prompt_type)
+        return None
+
+    key = cache_key(model, messages)
+    db = SessionLocal()
+    try:
+        entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+        now = datetime.utcnow()
+        if not entry or entry.expires_at <= now:
+            _count("misses", prompt_type)
+            return None
+
+        entry.last_accessed_at = now
+        entry.hit_count = (entry.hit_count or 0) + 1
+        db.commit()
+        _count("hits", prompt_type)
+        return entry.response
+    except Exception as e:
+        logger.error(f"LLM cache read failed: {e}")
+        _count("errors")
+        return None
+    finally:
+        db.close()
+
+
+def put(model, messages, prompt_type, response, use_cache=True):
+    if not response or not is_cacheable(prompt_type, use_cache):
+        return
+
+    key = cache_key(model, messages)
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        entry = db.query(LLMCacheEntry).filter(LLMCacheEntry.key == key).first()
+        if not entry:
+            entry = LLMCacheEntry(key=key)
+            db.add(entry)
+        entry.prompt_type = prompt_type
+        entry.model = model
+        entry.response = response
+        entry.created_at = now
+        entry.expires_at = now + timedelta(seconds=ttl_for(prompt_type))
+        entry.last_accessed_at = now
+        entry.hit_count = 0
+        db.commit()
+        _count("stores")
+        _evict(db)
+    except IntegrityError:
+        # Another worker stored the same key first - their copy is as good as ours
+        db.rollback()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"LLM cache write failed: {e}")
+        _count("errors")
+    finally:
+        db.close()
+
+
+def _evict(db):
+    """
+    Drops expired rows, then the least recently used rows above the size limit.
+    """
+    now = datetime.utcnow()
+    evicted = db.query(LLMCacheEntry).filter(LLMCacheEntry.expires_at <= now).delete(synchronize_session=False)
+
+    overflow = db.query(LLMCacheEntry).count() - LLM_CACHE_MAX_ENTRIES
+    if overflow > 0:
+        stale_keys = [
+            row.key for row in db.query(LLMCacheEntry.key)
+            .order_by(LLMCacheEntry.last_accessed_at.asc())
+            .limit(overflow)
+        ]
+        evicted += db.query(LLMCacheEntry).filter(LLMCacheEntry.key.in_(stale_keys)).delete(synchronize_session=False)
+
+    db.commit()
+    if evicted:
+        with _lock:
+            _stats["evictions"] += evicted
+
+
+def clear(prompt_type=None):
+    db = SessionLocal()
+    try:
+        query = db.query(LLMCacheEntry)
+        if prompt_type:
+            query = query.filter(LLMCacheEntry.prompt_type == prompt_type)
+        removed = query.delete(synchronize_session=False)
+        db.commit()
+        return removed
+    finally:
+        db.close()
+
+
+def stats():
+    with _lock:
+        snapshot = json.loads(json.dumps(_stats))
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = round(snapshot["hits"] / lookups, 3) if lookups else 0.0
+    snapshot["enabled"] = LLM_CACHE_ENABLED
+    snapshot["max_entries"] = LLM_CACHE_MAX_ENTRIES
+    return snapshot
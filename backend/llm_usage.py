@@ -0,0 +1,213 @@
+"""
+Token, cost and latency accounting for every LLM call.
+
+Each call is attributed to the HTTP endpoint (route template, e.g.
+`/task/{task_id}/regenerate-resources`) and user that triggered it. The
+request scope is a context variable set once per request, so it follows the
+call into worker threads and background tasks without threading arguments
+through ai_service.
+
+Rows go to the `llm_usage` table through a batching writer thread, so
+recording never adds a database round-trip to the request path. In-memory
+counters back `/ai/metrics`; `summary()` runs the grouped queries behind
+`/ai/usage`.
+"""
+import os
+import json
+import queue
+import logging
+import threading
+import contextvars
+from datetime import datetime, timedelta
+from sqlalchemy import func, case
+from database import SessionLocal
+from models import LLMUsage
+
+logger = logging.getLogger(__name__)
+
+LLM_USAGE_ENABLED = os.getenv("LLM_USAGE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_USAGE_FLUSH_INTERVAL = float(os.getenv("LLM_USAGE_FLUSH_INTERVAL", "2"))
+LLM_USAGE_BATCH_SIZE = int(os.getenv("LLM_USAGE_BATCH_SIZE", "100"))
+
+GROUP_COLUMNS = {
+    "endpoint": LLMUsage.endpoint,
+    "user_id": LLMUsage.user_id,
+    "prompt_type": LLMUsage.prompt_type,
+    "model": LLMUsage.model,
+    "tier": LLMUsage.tier,
+}
+
+# Mutable dict so a user resolved later in the request (auth dependency runs
+# in a worker thread with a copied context) is still visible to the caller.
+_scope = contextvars.ContextVar("llm_usage_scope", default=None)
+
+_lock = threading.Lock()
+_totals = {"endpoint": {}, "prompt_type": {}, "model": {}}
+_dropped = 0
+_queue = queue.Queue()
+_writer = None
+
+
+def begin(endpoint):
+    """
+    Starts attribution for the current request.
+    """
+    _scope.set({"endpoint": endpoint, "user_id": None})
+
+
+def set_user(user_id):
+    scope = _scope.get()
+    if scope is not None:
+        scope["user_id"] = user_id
+
+
+def current():
+    scope = _scope.get()
+    if scope is None:
+        return None, None
+    return scope["endpoint"], scope["user_id"]
+
+
+def _bump(group, name, row):
+    bucket = _totals[group].setdefault(name or "unknown", {
+        "calls": 0, "cached": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "latency_ms": 0.0,
+    })
+    bucket["calls"] += 1
+    bucket["cached"] += int(row["cached"])
+    bucket["errors"] += int(not row["ok"])
+    bucket["prompt_tokens"] += row["prompt_tokens"]
+    bucket["completion_tokens"] += row["completion_tokens"]
+    bucket["cost"] += row["cost"] or 0.0
+    bucket["latency_ms"] += row["latency_ms"]
+
+
+def record(prompt_type, tier, model, usage=None, seconds=0.0, cached=False, ok=True):
+    """
+    Records one LLM call. `usage` is the provider's `usage` object (may be
+    missing, e.g. for cache hits or providers that don't report it).
+    """
+    if not LLM_USAGE_ENABLED:
+        return
+    usage = usage or {}
+    endpoint, user_id = current()
+    row = {
+        "created_at": datetime.utcnow(),
+        "endpoint": endpoint,
+        "user_id": user_id,
+        "prompt_type": prompt_type,
+        "tier": tier,
+        "model": model,
+        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0),
+        "cost": usage.get("cost"),
+        "latency_ms": round(seconds * 1000, 1),
+        "cached": cached,
+        "ok": ok,
+    }
+    with _lock:
+        _bump("endpoint", endpoint, row)
+        _bump("prompt_type", prompt_type, row)
+        _bump("model", model, row)
+    _ensure_writer()
+    _queue.put(row)
+
+
+def _ensure_writer():
+    global _writer
+    if _writer is None or not _writer.is_alive():
+        with _lock:
+            if _writer is None or not _writer.is_alive():
+                _writer = threading.Thread(target=_write_loop, name="llm-usage-writer", daemon=True)
+                _writer.start()
+
+
+def _drain(block):
+    rows = []
+    try:
+        rows.append(_queue.get(timeout=LLM_USAGE_FLUSH_INTERVAL) if block else _queue.get_nowait())
+        while len(rows) < LLM_USAGE_BATCH_SIZE:
+            rows.append(_queue.get_nowait())
+    except queue.Empty:
+        pass
+    return rows
+
+
+def _write(rows):
+    global _dropped
+    if not rows:
+        return
+    db = SessionLocal()
+    try:
+        db.bulk_insert_mappings(LLMUsage, rows)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        with _lock:
+            _dropped += len(rows)
+        logger.warning("Dropped %d LLM usage rows: %s", len(rows), e)
+    finally:
+        db.close()
+        for _ in rows:
+            _queue.task_done()
+
+
+def _write_loop():
+    while True:
+        _write(_drain(block=True))
+
+
+def flush():
+    """
+    Writes every queued row now (shutdown, tests).
+    """
+    while not _queue.empty():
+        _write(_drain(block=False))
+    # Wait for a batch the writer thread may have taken off the queue already
+    _queue.join()
+
+
+def stats():
+    with _lock:
+        snapshot = json.loads(json.dumps(_totals))
+        dropped = _dropped
+    for groups in snapshot.values():
+        for bucket in groups.values():
+            bucket["cost"] = round(bucket["cost"], 6)
+            bucket["avg_latency_ms"] = round(bucket.pop("latency_ms") / bucket["calls"], 1) if bucket["calls"] else None
+    return {"enabled": LLM_USAGE_ENABLED, "pending": _queue.qsize(), "dropped": dropped, **snapshot}
+
+
+def summary(db, group_by="endpoint", since_hours=24, user_id=None, limit=50):
+    """
+    Aggregates stored usage per `group_by` column, biggest token spenders first.
+    """
+    column = GROUP_COLUMNS[group_by]
+    total_tokens = func.sum(LLMUsage.prompt_tokens + LLMUsage.completion_tokens)
+    query = db.query(
+        column.label("key"),
+        func.count(LLMUsage.id).label("calls"),
+        func.sum(case((LLMUsage.cached.is_(True), 1), else_=0)).label("cached"),
+        func.sum(LLMUsage.prompt_tokens).label("prompt_tokens"),
+        func.sum(LLMUsage.completion_tokens).label("completion_tokens"),
+        total_tokens.label("total_tokens"),
+        func.sum(func.coalesce(LLMUsage.cost, 0.0)).label("cost"),
+        func.avg(LLMUsage.latency_ms).label("avg_latency_ms"),
+        func.max(LLMUsage.latency_ms).label("max_latency_ms"),
+    ).filter(LLMUsage.created_at >= datetime.utcnow() - timedelta(hours=since_hours))
+    if user_id:
+        query = query.filter(LLMUsage.user_id == user_id)
+    rows = query.group_by(column).order_by(total_tokens.desc()).limit(limit).all()
+    return [
+        {
+            group_by: row.key,
+            "calls": row.calls,
+            "cached": int(row.cached or 0),
+            "prompt_tokens": int(row.prompt_tokens or 0),
+            "completion_tokens": int(row.completion_tokens or 0),
+            "total_tokens": int(row.total_tokens or 0),
+            "cost": round(float(row.cost or 0.0), 6),
+            "avg_latency_ms": round(float(row.avg_latency_ms), 1) if row.avg_latency_ms is not None else None,
+            "max_latency_ms": row.max_latency_ms,
+        }
+        for row in rows
+    ]
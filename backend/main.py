@@ -1,22 +1,68 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Header
 from dotenv import load_dotenv
 load_dotenv()
 from sqlalchemy.orm import Session
-from database import engine, get_db, Base
+from database import engine, get_db, Base, SessionLocal
 from models import User, Goal, DailyTask, Submission, Roadmap, RoadmapTask, TaskResource
 from auth import get_current_user_id, get_current_user_claims
 import ai_service
+import openrouter_client
+import llm_cache
+import singleflight
+import model_routing
+import resilience
+import llm_usage
+import prompt_builder
+import structured_output
+import grading_queue
+import semantic_cache
+import roadmap_templates
+import ai_limits
+import onboarding_jobs
+import task_pregen
+import content_catalog
+import chat_memory
+import nightly_precompute
+import weekly_summary
 import json
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import date, datetime, timedelta
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
 import re
+import asyncio
 
 # Create DB Tables
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Zuno Backend")
+async def _usage_scope(request: Request):
+    # Attribute AI usage to the route template (not the raw path with ids);
+    # the auth dependency fills in the user.
+    route = request.scope.get("route")
+    llm_usage.begin(getattr(route, "path", request.url.path))
+
+app = FastAPI(title="Zuno Backend", dependencies=[Depends(_usage_scope)])
+
+@app.exception_handler(ai_limits.Overloaded)
+async def ai_overloaded(request: Request, exc: ai_limits.Overloaded):
+    # Shed load with a retry hint rather than letting requests queue until they time out
+    return JSONResponse(status_code=exc.status, content={"detail": exc.detail}, headers={"Retry-After": str(exc.retry_after)})
+
+@app.on_event("startup")
+async def start_background_workers():
+    onboarding_jobs.start(_run_onboarding_job)
+    nightly_precompute.start()
+
+@app.on_event("shutdown")
+async def close_ai_clients():
+    # Hand running onboarding jobs back to the queue, then release pooled OpenRouter connections
+    await onboarding_jobs.stop()
+    nightly_precompute.stop()
+    openrouter_client.close_client()
+    await openrouter_client.aclose_client()
+    await run_in_threadpool(llm_usage.flush)
 
 import os
 
@@ -76,6 +122,9 @@ class UserProfileUpdate(BaseModel):
 
 # --- Endpoints ---
 
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.get("/")
 def health_check():
     return {"status": "ok", "message": "Zuno Backend is running"}
@@ -88,152 +137,588 @@ def debug_cors():
         "ver": "1.0.1"
     }
 
-@app.post("/onboarding")
-def onboarding(req: OnboardingRequest, claims: dict = Depends(get_current_user_claims), db: Session = Depends(get_db)):
-    user_id = claims.get("sub")
-    email = claims.get("email", "")
-    
-    if not user_id:
-        raise HTTPException(status_code=401, detail="Invalid token: missing sub")
+@app.get("/ai/metrics")
+def ai_metrics():
+    return {
+        "cache": llm_cache.stats(),
+        "singleflight": singleflight.stats(),
+        "routing": model_routing.stats(),
+        "resilience": resilience.stats(),
+        "usage": llm_usage.stats(),
+        "prompts": prompt_builder.stats(),
+        "structured_output": structured_output.stats(),
+        "grading": grading_queue.stats(),
+        "semantic_cache": semantic_cache.stats(),
+        "roadmap_templates": roadmap_templates.stats(),
+        "limits": ai_limits.stats(),
+        "onboarding_jobs": onboarding_jobs.stats(),
+        "task_pregen": task_pregen.stats(),
+        "content_catalog": content_catalog.stats(),
+        "chat_memory": chat_memory.stats(),
+        "nightly_precompute": nightly_precompute.stats(),
+        "weekly_summary": weekly_summary.stats(),
+        "breaker": ai_service.openrouter_breaker.status()
+    }
 
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_API_TOKEN or x_admin_token != ADMIN_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+@app.get("/ai/usage", dependencies=[Depends(require_admin)])
+def ai_usage(group_by: str = "endpoint", since_hours: int = 24, user_id: Optional[str] = None, limit: int = 50, db: Session = Depends(get_db)):
+    """
+    Token, cost and latency per endpoint / user_id / prompt_type / model / tier,
+    biggest spenders first.
+    """
+    if group_by not in llm_usage.GROUP_COLUMNS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {sorted(llm_usage.GROUP_COLUMNS)}")
+    return {
+        "group_by": group_by,
+        "since_hours": since_hours,
+        "rows": llm_usage.summary(db, group_by, since_hours, user_id, limit)
+    }
+
+@app.post("/admin/precompute", dependencies=[Depends(require_admin)], status_code=202)
+def run_precompute(day: Optional[date] = None):
+    """
+    Runs the nightly daily-plan precompute now (for `day`, default the coming
+    morning). Does nothing if a run holds the lease or the day is done.
+    """
+    day = day or nightly_precompute.plan_day()
+    nightly_precompute.trigger(day)
+    return {"message": "Precompute started", "day": day}
+
+@app.get("/ai/status")
+def ai_status():
+    breaker = ai_service.openrouter_breaker.status()
+    return {
+        "status": "degraded" if breaker["state"] != "closed" else "ok",
+        "breaker": breaker,
+        **resilience.stats()
+    }
+
+def _ensure_user(db: Session, user_id: str, email: str, full_name: Optional[str]):
     # Check if user exists, create if not
     user = db.query(User).filter(User.id == user_id).first()
     if not user:
-        user = User(id=user_id, email=email, full_name=req.full_name)
+        user = User(id=user_id, email=email, full_name=full_name)
         db.add(user)
         db.commit()
         db.refresh(user)
     else:
-        if req.full_name:
-            user.full_name = req.full_name
+        if full_name:
+            user.full_name = full_name
             db.add(user)
+    return user
+
+def _update_existing_goal(existing_goal: Goal, req: OnboardingRequest, db: Session):
+    # Optionally update other fields if they changed
+    existing_goal.exam_or_skill = req.exam_or_skill
+    existing_goal.daily_time_minutes = req.daily_time_minutes
+    existing_goal.target_date = req.target_date
+    db.add(existing_goal) # Mark for update
+    return {"subject": existing_goal.subject, "detected_level": existing_goal.detected_level, "message": "Goal already exists and updated."}
+
+def _parse_level_response(ai_response_str: Optional[str]):
+    detected_level = "Beginner"
+    message = "Welcome to Zuno."
     
-    # We'll replace existing goals for simplicity in MVP, or just add. 
-    # Let's add new ones and avoid duplicates.
-    existing_goals = db.query(Goal).filter(Goal.user_id == user_id).all()
+    if ai_response_str:
+        try:
+            ai_data = json.loads(ai_response_str)
+            detected_level = ai_data.get("level", "Beginner")
+            message = ai_data.get("message", message)
+        except json.JSONDecodeError as e:
+            print(f"JSON Decode Error: {e}")
+            print(f"Raw AI Response: {ai_response_str}")
+            pass # Fallback to defaults
+    return detected_level, message
+
+def _create_goal(db: Session, user_id: str, subject: str, req: OnboardingRequest, detected_level: str):
+    new_goal = Goal(
+        user_id=user_id,
+        subject=subject,
+        exam_or_skill=req.exam_or_skill,
+        daily_time_minutes=req.daily_time_minutes,
+        target_date=req.target_date,
+        detected_level=detected_level,
+        target_goal=req.target_goal,
+        learning_style=req.learning_style
+    )
+    db.add(new_goal)
+    db.flush() # Get goal ID
+    return new_goal
+
+def _fallback_roadmap(subject: str):
+    return {
+        "title": f"{subject} Fundamentals (Fallback)",
+        "phases": [
+            {
+                "name": "Getting Started",
+                "modules": [
+                    {
+                        "name": "Introduction",
+                        "tasks": [
+                            {
+                                "title": f"Introduction to {subject}",
+                                "description": f"Start your journey by exploring the core concepts of {subject}. Research the basics and set up your learning environment.",
+                                "estimated_time": 30,
+                                "output_deliverable": "A brief summary of what you learned and your setup.",
+                                "resource_type": "research"
+                            }
+                        ]
+                    }
+                ]
+            }
+        ]
+    }
+
+def _template_roadmap(db: Session, subject: str, level: str, req: OnboardingRequest, exact: bool = True):
+    # Roadmap from the template library, scaled to this user's schedule
+    template = roadmap_templates.find(db, subject, level, req.target_goal, req.learning_style, exact=exact)
+    if template is None:
+        return None
+    print(f"DEBUG: Using roadmap template '{template.key}' for {subject}.")
+    return roadmap_templates.instantiate(template, req.target_date, req.daily_time_minutes)
+
+def _new_roadmap_task(roadmap_id: int, phase_name: str, module_name: str, task: dict, order: int):
+    new_rt = RoadmapTask(
+        roadmap_id=roadmap_id,
+        phase=phase_name or "Basics",
+        module=module_name or "Module",
+        title=task.get("title", "Lesson"),
+        description=task.get("description", ""),
+        estimated_time_minutes=task.get("estimated_time", 30),
+        output_deliverable=task.get("output_deliverable", ""),
+        order_index=order
+    )
+    if order == 0:
+        new_rt.status = "active"
+        new_rt.scheduled_date = date.today()
+    return new_rt
+
+def _save_roadmap_tasks(db: Session, roadmap_id: int, roadmap_data: dict, start_order: int = 0):
+    order = start_order
+    for phase in roadmap_data.get("phases", []):
+        for module in phase.get("modules", []):
+            for task in module.get("tasks", []):
+                db.add(_new_roadmap_task(roadmap_id, phase.get("name", "Basics"), module.get("name", "Module"), task, order))
+                order += 1
+    return order
+
+def _save_onboarding(db: Session, req: OnboardingRequest, user_id: str, existing_goals: list, plans: dict):
+    """
+    Saves an onboarding request in a single transaction: subjects with a goal
+    already are updated, every other one gets its goal, roadmap and tasks from
+    `plans` (subject -> (detected_level, message, roadmap_data, generated)).
+    Returns (responses, tasks saved per subject, new roadmap ids).
+    """
+    responses, saved, roadmap_ids = [], {}, []
     existing_subjects = {g.subject for g in existing_goals}
-    
-    responses = []
     for subject in req.subjects:
+        if subject in saved:
+            continue
         if subject in existing_subjects:
             # If a goal for this subject already exists, we might update it or skip.
             # For now, let's skip to avoid re-generating AI level for existing subjects.
             # A more robust solution would update if other parameters (exam_or_skill, time, target_date) changed.
             existing_goal = next((g for g in existing_goals if g.subject == subject), None)
-            if existing_goal:
-                responses.append({"subject": subject, "detected_level": existing_goal.detected_level, "message": "Goal already exists and updated."})
-                # Optionally update other fields if they changed
-                existing_goal.exam_or_skill = req.exam_or_skill
-                existing_goal.daily_time_minutes = req.daily_time_minutes
-                existing_goal.target_date = req.target_date
-                db.add(existing_goal) # Mark for update
-                continue
-            
-        ai_response_str = ai_service.detect_level_and_confirm(
-            subject, req.exam_or_skill, req.daily_time_minutes, req.target_date
-        )
-        
-        detected_level = "Beginner"
-        message = "Welcome to Zuno."
-        
-        if ai_response_str:
-            try:
-                ai_data = json.loads(ai_response_str)
-                detected_level = ai_data.get("level", "Beginner")
-                message = ai_data.get("message", message)
-            except json.JSONDecodeError as e:
-                print(f"JSON Decode Error: {e}")
-                print(f"Raw AI Response: {ai_response_str}")
-                pass # Fallback to defaults
-
-        new_goal = Goal(
+            responses.append(_update_existing_goal(existing_goal, req, db))
+            saved[subject] = 0
+            continue
+
+        detected_level, message, roadmap_data, generated = plans[subject]
+        if generated:
+            roadmap_templates.remember(
+                db, subject, detected_level, req.target_goal, req.learning_style, roadmap_data, req.daily_time_minutes
+            )
+        new_goal = _create_goal(db, user_id, subject, req, detected_level)
+        new_roadmap = Roadmap(
             user_id=user_id,
-            subject=subject,
-            exam_or_skill=req.exam_or_skill,
-            daily_time_minutes=req.daily_time_minutes,
-            target_date=req.target_date,
-            detected_level=detected_level,
-            target_goal=req.target_goal,
-            learning_style=req.learning_style
+            goal_id=new_goal.id,
+            title=roadmap_data.get("title", f"{subject} Roadmap")
         )
-        db.add(new_goal)
-        db.flush() # Get goal ID
+        db.add(new_roadmap)
+        db.flush()
+        roadmap_ids.append(new_roadmap.id)
+        print(f"DEBUG: Roadmap generated successfully. Title: {roadmap_data.get('title')}")
+        saved[subject] = _save_roadmap_tasks(db, new_roadmap.id, roadmap_data)
+        print(f"DEBUG: Saved {saved[subject]} roadmap tasks.")
+        responses.append({"subject": subject, "detected_level": detected_level, "message": message})
+    db.commit() # Commit all new goals, roadmaps, and tasks
+    return responses, saved, roadmap_ids
 
-        # --- Generate Roadmap via AI ---
-        print(f"DEBUG: Generating roadmap for {subject}...")
-        try:
-            roadmap_data = ai_service.generate_full_roadmap(
-                subject, detected_level, req.target_goal, req.daily_time_minutes, req.target_date, req.learning_style
-            )
-        except Exception as e:
-            print(f"ERROR: AI Roadmap generation failed: {e}")
-            roadmap_data = None
+# Subjects of one onboarding request whose AI calls run at the same time
+ONBOARDING_SUBJECT_CONCURRENCY = max(1, int(os.getenv("ONBOARDING_SUBJECT_CONCURRENCY", "4")))
 
+def _db_turns(db: Session):
+    # The session isn't thread-safe: concurrent subjects take turns with it
+    db_lock = asyncio.Lock()
 
-        if not roadmap_data:
-            print("WARNING: AI Roadmap generation failed or returned None. Using fallback roadmap.")
-            roadmap_data = {
-                "title": f"{subject} Fundamentals (Fallback)",
-                "phases": [
-                    {
-                        "name": "Getting Started",
-                        "modules": [
-                            {
-                                "name": "Introduction",
-                                "tasks": [
-                                    {
-                                        "title": f"Introduction to {subject}",
-                                        "description": f"Start your journey by exploring the core concepts of {subject}. Research the basics and set up your learning environment.",
-                                        "estimated_time": 30,
-                                        "output_deliverable": "A brief summary of what you learned and your setup.",
-                                        "resource_type": "research"
-                                    }
-                                ]
-                            }
-                        ]
-                    }
-                ]
-            }
+    async def with_db(func, *args):
+        async with db_lock:
+            return await run_in_threadpool(func, *args)
+
+    return with_db
+
+def _new_subjects(req: OnboardingRequest, existing_subjects):
+    subjects = []
+    for subject in req.subjects:
+        if subject not in existing_subjects and subject not in subjects:
+            subjects.append(subject)
+    return subjects
 
-        if roadmap_data:
-            print(f"DEBUG: Roadmap generated successfully. Title: {roadmap_data.get('title')}")
-            new_roadmap = Roadmap(
-                user_id=user_id,
-                goal_id=new_goal.id,
-                title=roadmap_data.get("title", f"{subject} Roadmap")
+async def _stream_roadmap(subject: str, level: str, req: OnboardingRequest, on_event):
+    """
+    Generates a roadmap with astream_full_roadmap, awaiting `on_event(event)`
+    for each `title`, `task` and `module_done` event as it comes in. Returns
+    (roadmap_data, generated): the roadmap as streamed (or as parsed, if no
+    task streamed), or None if generation failed.
+    """
+    title, phases, roadmap_data = None, [], None
+    try:
+        async for event in ai_service.astream_full_roadmap(
+            subject, level, req.target_goal, req.daily_time_minutes, req.target_date, req.learning_style
+        ):
+            kind = event[0]
+            if kind == "title":
+                title = event[1]
+            elif kind == "task":
+                _, phase_name, module_name, task = event
+                if not phases or phases[-1]["name"] != phase_name:
+                    phases.append({"name": phase_name, "modules": []})
+                modules = phases[-1]["modules"]
+                if not modules or modules[-1]["name"] != module_name:
+                    modules.append({"name": module_name, "tasks": []})
+                modules[-1]["tasks"].append(task)
+            elif kind == "done":
+                roadmap_data = event[1]
+                continue
+            await on_event(event)
+    except Exception as e:
+        print(f"ERROR: AI Roadmap generation failed: {e}")
+        if not phases:
+            return None, False
+
+    # Modules that fell back to their outline aren't worth keeping as a template
+    generated = bool(roadmap_data) and not roadmap_data.get("incomplete_modules")
+    if phases:
+        return {"title": title or f"{subject} Roadmap", "phases": phases}, generated
+    if roadmap_data and roadmap_data.get("phases"):
+        return roadmap_data, generated
+    return None, False
+
+async def _plan_subjects(req: OnboardingRequest, db: Session, with_db, subjects: list, report, on_event=None, on_planned=None):
+    """
+    Level detection and roadmap (template, generated, closest template or
+    fallback) for each new subject. Subjects are planned concurrently (up to
+    ONBOARDING_SUBJECT_CONCURRENCY at a time), so one subject's roadmap
+    generation overlaps another's level detection. Returns subject ->
+    (detected_level, message, roadmap_data, generated).
+
+    `report(subject, status, **state)` is awaited as each subject moves
+    through detecting_level, generating_roadmap and roadmap_ready. With
+    `on_event(subject, event)` roadmaps are streamed and each title, task and
+    module_done event handed over as it arrives (see _stream_roadmap).
+    `on_planned(subject, plan)` is awaited once a subject is planned.
+    """
+    limit = asyncio.Semaphore(ONBOARDING_SUBJECT_CONCURRENCY)
+
+    async def plan_subject(subject):
+        async with limit:
+            await report(subject, "detecting_level")
+            ai_response_str = await ai_service.adetect_level_and_confirm(
+                subject, req.exam_or_skill, req.daily_time_minutes, req.target_date
             )
-            db.add(new_roadmap)
-            db.flush()
-
-            order = 0
-            for phase in roadmap_data.get("phases", []):
-                for module in phase.get("modules", []):
-                    for task in module.get("tasks", []):
-                        new_rt = RoadmapTask(
-                            roadmap_id=new_roadmap.id,
-                            phase=phase.get("name", "Basics"),
-                            module=module.get("name", "Module"),
-                            title=task.get("title", "Lesson"),
-                            description=task.get("description", ""),
-                            estimated_time_minutes=task.get("estimated_time", 30),
-                            output_deliverable=task.get("output_deliverable", ""),
-                            order_index=order
+            detected_level, message = _parse_level_response(ai_response_str)
+
+            # --- Reuse a template for this combination, else generate via AI ---
+            await report(subject, "generating_roadmap", detected_level=detected_level, message=message)
+            roadmap_data = await with_db(_template_roadmap, db, subject, detected_level, req)
+            generated = False
+            if not roadmap_data:
+                print(f"DEBUG: Generating roadmap for {subject}...")
+                if on_event:
+                    roadmap_data, generated = await _stream_roadmap(
+                        subject, detected_level, req, lambda event: on_event(subject, event)
+                    )
+                else:
+                    try:
+                        roadmap_data = await ai_service.agenerate_full_roadmap(
+                            subject, detected_level, req.target_goal, req.daily_time_minutes, req.target_date, req.learning_style
                         )
-                        if order == 0:
-                            new_rt.status = "active"
-                            new_rt.scheduled_date = date.today()
-                        
-                        db.add(new_rt)
-                        order += 1
-            print(f"DEBUG: Saved {order} roadmap tasks.")
-        else:
-            print("WARNING: No roadmap data returned from AI service. User will have a goal but no roadmap.")
-        
-        responses.append({"subject": subject, "detected_level": detected_level, "message": message})
+                        # Modules that fell back to their outline aren't worth keeping as a template
+                        generated = bool(roadmap_data) and not roadmap_data.get("incomplete_modules")
+                    except Exception as e:
+                        print(f"ERROR: AI Roadmap generation failed: {e}")
+                        roadmap_data = None
+
+                if not roadmap_data:
+                    roadmap_data = await with_db(_template_roadmap, db, subject, detected_level, req, False)
+
+            if not roadmap_data:
+                print("WARNING: AI Roadmap generation failed or returned None. Using fallback roadmap.")
+                roadmap_data = _fallback_roadmap(subject)
+            await report(subject, "roadmap_ready", detected_level=detected_level)
+            plan = (detected_level, message, roadmap_data, generated)
+            if on_planned:
+                await on_planned(subject, plan)
+            return plan
+
+    return dict(zip(subjects, await asyncio.gather(*(plan_subject(s) for s in subjects))))
+
+async def _onboard_subjects(req: OnboardingRequest, user_id: str, email: str, db: Session, progress=None):
+    """
+    The onboarding pipeline: level detection, roadmap (template or generated)
+    and its tasks for each new subject, planned concurrently by
+    _plan_subjects. Nothing is written while the AI calls run; every goal,
+    roadmap and task is then saved in a single transaction.
+
+    With `progress(subject, **state)` (background jobs), each subject's state
+    is reported as it moves through detecting_level, generating_roadmap,
+    roadmap_ready and done.
+    """
+    async def report(subject, status, **state):
+        if progress:
+            await run_in_threadpool(progress, subject, status=status, **state)
+
+    def prepare():
+        _ensure_user(db, user_id, email, req.full_name)
+        # We'll replace existing goals for simplicity in MVP, or just add. 
+        # Let's add new ones and avoid duplicates.
+        return db.query(Goal).filter(Goal.user_id == user_id).all()
+
+    existing_goals = await run_in_threadpool(prepare)
+    new_subjects = _new_subjects(req, {g.subject for g in existing_goals})
+    plans = await _plan_subjects(req, db, _db_turns(db), new_subjects, report)
+
+    responses, saved, roadmap_ids = await run_in_threadpool(_save_onboarding, db, req, user_id, existing_goals, plans)
+    for roadmap_id in roadmap_ids:
+        task_pregen.schedule(roadmap_id, 0)
+    for response in responses:
+        await report(
+            response["subject"], "done", detected_level=response["detected_level"],
+            tasks_saved=saved[response["subject"]], message=response["message"]
+        )
+    return responses
+
+@app.post("/onboarding")
+async def onboarding(req: OnboardingRequest, claims: dict = Depends(get_current_user_claims), db: Session = Depends(get_db)):
+    user_id = claims.get("sub")
+    email = claims.get("email", "")
     
-    db.commit() # Commit all new goals, roadmaps, and tasks
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token: missing sub")
+
+    async with ai_limits.slot(user_id):
+        responses = await _onboard_subjects(req, user_id, email, db)
     return {"message": "Onboarding complete", "goals": responses}
 
+async def _run_onboarding_job(job_id: str, user_id: str, email: str, request: dict, progress):
+    # Worker side of POST /onboarding/jobs; the job queue bounds concurrency
+    llm_usage.begin("/onboarding/jobs")
+    llm_usage.set_user(user_id)
+    db = SessionLocal()
+    try:
+        responses = await _onboard_subjects(OnboardingRequest(**request), user_id, email, db, progress)
+        return {"message": "Onboarding complete", "goals": responses}
+    except BaseException:
+        await run_in_threadpool(db.rollback)
+        raise
+    finally:
+        await run_in_threadpool(db.close)
+
+@app.post("/onboarding/jobs", status_code=202)
+async def create_onboarding_job(req: OnboardingRequest, claims: dict = Depends(get_current_user_claims), db: Session = Depends(get_db)):
+    """
+    Background variant of /onboarding: queues the request and returns 202
+    with a job id right away. Poll GET /onboarding/jobs/{job_id} for
+    per-subject progress and, once it has succeeded, the /onboarding payload.
+    """
+    user_id = claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token: missing sub")
+
+    def queue():
+        # The job row points at the user, so a first-time user is created now rather than by the worker
+        _ensure_user(db, user_id, claims.get("email", ""), req.full_name)
+        return onboarding_jobs.enqueue(db, user_id, claims.get("email", ""), req.model_dump(mode="json"))
+
+    job, _ = await run_in_threadpool(queue)
+    # Workers normally start with the app; this covers servers run without startup events
+    onboarding_jobs.start(_run_onboarding_job)
+    return {"job_id": job.id, "status": job.status, "status_url": f"/onboarding/jobs/{job.id}"}
+
+@app.get("/onboarding/jobs/{job_id}")
+def get_onboarding_job(job_id: str, user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    job = onboarding_jobs.get(db, job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Onboarding job not found")
+    return onboarding_jobs.to_dict(job)
+
+# Keeps streaming onboarding runs alive if the client disconnects mid-stream
+_background_runs = set()
+
+async def _run_streaming_onboarding(req: OnboardingRequest, user_id: str, email: str, emit, lease=None):
+    """
+    Same planner as /onboarding (_plan_subjects), but roadmaps are streamed
+    and each task is saved as soon as it has streamed in. A subject's first task is
+    committed immediately, and `ready` sent, so the user can start it while
+    the rest is generated; later tasks are committed as each module completes.
+    """
+    db = SessionLocal()
+    responses = {}
+    ready_goals = {}
+    try:
+        def prepare():
+            _ensure_user(db, user_id, email, req.full_name)
+            existing_goals = {g.subject: g for g in db.query(Goal).filter(Goal.user_id == user_id).all()}
+            updated = {s: _update_existing_goal(g, req, db) for s, g in existing_goals.items() if s in req.subjects}
+            db.commit()
+            return updated
+
+        updated = await run_in_threadpool(prepare)
+        for subject in dict.fromkeys(req.subjects):
+            if subject in updated:
+                responses[subject] = ready_goals[subject] = updated[subject]
+                emit("subject_started", {"subject": subject})
+                emit("subject_done", {**updated[subject], "tasks_saved": 0})
+
+        with_db = _db_turns(db)
+        ready_sent = False
+
+        def send_ready(response):
+            # Once, as soon as any task is saved: the user can start it now
+            nonlocal ready_sent
+            if response is not None:
+                ready_goals[response["subject"]] = response
+            if not ready_sent:
+                ready_sent = True
+                emit("ready", {"goals": list(ready_goals.values())})
+
+        # Per subject: its response, roadmap row, tasks seen so far and the current module's tasks
+        levels, roadmap_ids, orders, module_tasks = {}, {}, {}, {}
+
+        def create_roadmap(subject, detected_level):
+            goal = _create_goal(db, user_id, subject, req, detected_level)
+            roadmap = Roadmap(user_id=user_id, goal_id=goal.id, title=f"{subject} Roadmap")
+            db.add(roadmap)
+            db.commit()
+            return roadmap.id
+
+        def set_title(roadmap_id, title):
+            db.query(Roadmap).filter(Roadmap.id == roadmap_id).update({"title": title})
+            db.commit()
+
+        def save_tasks(roadmap_id, tasks):
+            # Kept short: the other subjects write to the database too
+            db.add_all(_new_roadmap_task(roadmap_id, *task) for task in tasks)
+            db.commit()
+
+        async def report(subject, status, detected_level=None, message=None):
+            if status == "detecting_level":
+                emit("subject_started", {"subject": subject})
+            elif status == "generating_roadmap":
+                levels[subject] = {"subject": subject, "detected_level": detected_level, "message": message}
+                roadmap_ids[subject] = await with_db(create_roadmap, subject, detected_level)
+                orders[subject], module_tasks[subject] = 0, []
+                emit("level", {**levels[subject], "roadmap_id": roadmap_ids[subject]})
+
+        async def on_event(subject, event):
+            roadmap_id, order, kind = roadmap_ids[subject], orders[subject], event[0]
+            if kind == "title":
+                await with_db(set_title, roadmap_id, event[1])
+            elif kind == "task":
+                _, phase_name, module_name, task = event
+                if order == 0:
+                    await with_db(save_tasks, roadmap_id, [(phase_name, module_name, task, order)])
+                else:
+                    module_tasks[subject].append((phase_name, module_name, task, order))
+                emit("task", {"subject": subject, "order_index": order, "phase": phase_name, "module": module_name, "title": task.get("title", "Lesson")})
+                if order == 0:
+                    send_ready(levels[subject])
+                orders[subject] = order + 1
+            elif kind == "module_done":
+                await with_db(save_tasks, roadmap_id, module_tasks[subject][:])
+                module_tasks[subject].clear()
+                emit("module_done", {"subject": subject, "phase": event[1], "module": event[2]})
+
+        async def on_planned(subject, plan):
+            detected_level, _, roadmap_data, generated = plan
+            roadmap_id, response = roadmap_ids[subject], levels[subject]
+            if orders[subject] == 0:
+                # Nothing streamed in: the whole roadmap is saved in one go
+                await with_db(set_title, roadmap_id, roadmap_data.get("title", f"{subject} Roadmap"))
+                orders[subject] = await with_db(_save_roadmap_tasks, db, roadmap_id, roadmap_data)
+            elif module_tasks[subject]:
+                # Generation stopped part-way through a module
+                await with_db(save_tasks, roadmap_id, module_tasks[subject])
+            emit("roadmap_ready", {"subject": subject, "detected_level": detected_level, "tasks": orders[subject]})
+            if generated:
+                await with_db(
+                    roadmap_templates.remember, db, subject, detected_level, req.target_goal, req.learning_style,
+                    roadmap_data, req.daily_time_minutes
+                )
+            await with_db(db.commit)
+            print(f"DEBUG: Saved {orders[subject]} roadmap tasks.")
+            task_pregen.schedule(roadmap_id, 0)
+            send_ready(response)
+            responses[subject] = response
+            emit("subject_done", {**response, "tasks_saved": orders[subject]})
+
+        await _plan_subjects(req, db, with_db, _new_subjects(req, responses), report, on_event, on_planned)
+
+        goals = [responses[s] for s in dict.fromkeys(req.subjects)]
+        send_ready(None)
+        emit("done", {"message": "Onboarding complete", "goals": goals})
+    except Exception as e:
+        print(f"ERROR: Streaming onboarding failed: {e}")
+        await run_in_threadpool(db.rollback)
+        emit("error", {"detail": "Onboarding failed"})
+    finally:
+        await run_in_threadpool(db.close)
+        if lease:
+            lease.release()
+        emit(None, None)
+
+@app.post("/onboarding/stream")
+async def onboarding_stream(req: OnboardingRequest, claims: dict = Depends(get_current_user_claims)):
+    """
+    Streaming variant of /onboarding (Server-Sent Events). Emits progress
+    events (`subject_started`, `level`, `task`, `module_done`,
+    `roadmap_ready`, `subject_done`) per subject while roadmaps are
+    generated and saved, `ready` once the first task can be started, then
+    `done` with the same payload /onboarding returns.
+    """
+    user_id = claims.get("sub")
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid token: missing sub")
+
+    # Admit before the stream starts so overload is a plain 429/503
+    lease = await ai_limits.acquire(user_id)
+    queue: asyncio.Queue = asyncio.Queue()
+    run = asyncio.create_task(_run_streaming_onboarding(
+        req, user_id, claims.get("email", ""), lambda event, data: queue.put_nowait((event, data)), lease
+    ))
+    _background_runs.add(run)
+    run.add_done_callback(_background_runs.discard)
+
+    async def events():
+        yield ": stream open\n\n"
+        while True:
+            event, data = await queue.get()
+            if event is None:
+                break
+            yield _sse(event, data)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/roadmap")
 def get_roadmap(user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
     roadmap = db.query(Roadmap).filter(Roadmap.user_id == user_id, Roadmap.is_active == True).first()
@@ -292,115 +777,145 @@ def complete_roadmap_task(task_id: int, user_id: str = Depends(get_current_user_
         next_task.scheduled_date = date.today() # Bring forward to today
         
     db.commit()
+    if next_task:
+        # Have its content (and the next few) ready before the dashboard asks for it
+        task_pregen.schedule(next_task.roadmap_id, next_task.order_index)
     return {"message": "Task completed"}
 
+def _save_task_resources(db: Session, task_id: int, resources_data: list, roadmap_task_id: Optional[int] = None):
+    # Rows that also carry the roadmap task are reused if it carries over to another day
+    for res in resources_data:
+        db.add(task_pregen.new_task_resource(res, daily_task_id=task_id, roadmap_task_id=roadmap_task_id))
+
 @app.get("/daily-plan")
-def get_daily_plan(user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+async def get_daily_plan(user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
     print(f"DEBUG: get_daily_plan called for user {user_id}")
     today = date.today()
     results = []
     
-    try:
-        # Check for active roadmap tasks first
-        active_roadmap_task = db.query(RoadmapTask).join(Roadmap).filter(
-            Roadmap.user_id == user_id,
-            RoadmapTask.status == "active"
-        ).first()
-        print(f"DEBUG: active_roadmap_task: {active_roadmap_task}")
-    except Exception as e:
-        print(f"ERROR in get_daily_plan query: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+    def find_task():
+        try:
+            # Check for active roadmap tasks first
+            # Oldest first, the same task the nightly precompute prepares
+            active_roadmap_task = db.query(RoadmapTask).join(Roadmap).filter(
+                Roadmap.user_id == user_id,
+                RoadmapTask.status == "active"
+            ).order_by(RoadmapTask.id).first()
+            print(f"DEBUG: active_roadmap_task: {active_roadmap_task}")
+        except Exception as e:
+            print(f"ERROR in get_daily_plan query: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+        if not active_roadmap_task:
+            return None, None, None
 
-    if active_roadmap_task:
         # Check if already converted to daily task for today
         task = db.query(DailyTask).filter(
             DailyTask.user_id == user_id,
             DailyTask.roadmap_task_id == active_roadmap_task.id,
             DailyTask.date == today
         ).first()
+        goal = active_roadmap_task.roadmap.goal if active_roadmap_task.roadmap else None
+        return active_roadmap_task, task, goal
 
+    active_roadmap_task, task, goal = await run_in_threadpool(find_task)
+
+    if active_roadmap_task:
         if not task:
-            # Generate enriched content via AI
-            if not active_roadmap_task.roadmap or not active_roadmap_task.roadmap.goal:
+            if not goal:
                 print(f"ERROR: Roadmap or Goal missing for task {active_roadmap_task.id}")
                 return [] # Or handle gracefully
 
-            subject = active_roadmap_task.roadmap.goal.subject
-            exam = active_roadmap_task.roadmap.goal.exam_or_skill
-            level = active_roadmap_task.roadmap.goal.detected_level or "Beginner"
-            minutes = active_roadmap_task.roadmap.goal.daily_time_minutes
-
-            print(f"DEBUG: Generating enriched content for task: {active_roadmap_task.title}")
-            ai_data_str = ai_service.generate_daily_task_content(
-                subject, exam, level, active_roadmap_task.title, minutes
-            )
-
+            # Content is normally pre-generated when the task unlocked (see task_pregen)
+            pregenerated = await run_in_threadpool(task_pregen.load, db, active_roadmap_task)
             resources_data = []
             task_description = active_roadmap_task.description
 
-            if ai_data_str:
-                try:
-                    ai_data = json.loads(ai_data_str)
-                    resources_data = ai_data.get("resources", [])
-                    task_description = ai_data.get("description", task_description)
-                except Exception as e:
-                    print(f"Error parsing AI task data: {e}")
-
-            task = DailyTask(
-                user_id=user_id,
-                goal_id=active_roadmap_task.roadmap.goal_id,
-                roadmap_task_id=active_roadmap_task.id,
-                topic=active_roadmap_task.title,
-                description=task_description,
-                date=today
-            )
-            db.add(task)
-            db.commit()
-            db.refresh(task)
+            catalog_args = (goal.subject, active_roadmap_task.title, goal.detected_level or "Beginner", goal.daily_time_minutes)
+            generated = False
+            if pregenerated:
+                task_description = pregenerated["description"]
+            else:
+                # Another user's generation for the same topic, if there is one
+                cataloged = await run_in_threadpool(content_catalog.find, db, *catalog_args)
+                if cataloged:
+                    resources_data = cataloged["resources"]
+                    task_description = cataloged["description"]
+                else:
+                    # Generate enriched content via AI
+                    subject = goal.subject
+                    exam = goal.exam_or_skill
+                    level = goal.detected_level or "Beginner"
+                    minutes = goal.daily_time_minutes
 
-            # Save resources
-            for res in resources_data:
-                url = res.get("url", "")
-                confidence = res.get("video_confidence", "fallback")
-                
-                new_res = TaskResource(
-                    daily_task_id=task.id,
-                    title=res.get("title"),
-                    url=url,
-                    platform=res.get("platform"),
-                    resource_type=res.get("resource_type"),
-                    rationale=res.get("rationale"),
-                    video_confidence=confidence,
-                    validated=res.get("is_embeddable", False),
-                    fallback_used=(confidence == "fallback"),
-                    video_id=res.get("video_id"),
-                    validated_at=datetime.fromisoformat(res["validated_at"]) if res.get("validated_at") else None,
-                    is_embeddable=res.get("is_embeddable", False)
+                    print(f"DEBUG: Generating enriched content for task: {active_roadmap_task.title}")
+                    async with ai_limits.slot(user_id):
+                        ai_data_str = await ai_service.agenerate_daily_task_content(
+                            subject, exam, level, active_roadmap_task.title, minutes
+                        )
+
+                    if ai_data_str:
+                        try:
+                            ai_data = json.loads(ai_data_str)
+                            resources_data = ai_data.get("resources", [])
+                            task_description = ai_data.get("description", task_description)
+                            generated = True
+                        except Exception as e:
+                            print(f"Error parsing AI task data: {e}")
+
+            def save_task():
+                task = DailyTask(
+                    user_id=user_id,
+                    goal_id=active_roadmap_task.roadmap.goal_id,
+                    roadmap_task_id=active_roadmap_task.id,
+                    topic=active_roadmap_task.title,
+                    description=task_description,
+                    date=today
                 )
-                db.add(new_res)
-            db.commit()
-            db.refresh(task)
-
-        return [{
-            "id": task.id,
-            "goal_id": task.goal_id,
-            "subject": active_roadmap_task.roadmap.goal.subject,
-            "level": active_roadmap_task.roadmap.goal.detected_level,
-            "goal_description": active_roadmap_task.roadmap.goal.exam_or_skill,
-            "topic": task.topic,
-            "description": task.description,
-            "resources": [{
-                "id": r.id,
-                "title": r.title,
-                "url": r.url,
-                "platform": r.platform,
-                "type": r.resource_type,
-                "rationale": r.rationale
-            } for r in task.resources],
-            "date": task.date,
-            "is_completed": task.is_completed,
-            "roadmap_task_id": active_roadmap_task.id
-        }]
+                db.add(task)
+                db.commit()
+                db.refresh(task)
+
+                # Save resources
+                if pregenerated:
+                    task_pregen.attach(db, active_roadmap_task.id, task.id)
+                else:
+                    _save_task_resources(db, task.id, resources_data, active_roadmap_task.id)
+                    if resources_data and not active_roadmap_task.resource_links:
+                        # Generated here: don't let the look-ahead generate it again
+                        active_roadmap_task.resource_links = task_pregen.resource_links(task_description, resources_data)
+                    if generated:
+                        content_catalog.remember(db, *catalog_args, task_description, resources_data)
+                db.commit()
+                db.refresh(task)
+                return task
+
+            task = await run_in_threadpool(save_task)
+            # Keep the next few tasks ready too
+            task_pregen.schedule(active_roadmap_task.roadmap_id, active_roadmap_task.order_index + 1)
+
+        def plan():
+            return [{
+                "id": task.id,
+                "goal_id": task.goal_id,
+                "subject": active_roadmap_task.roadmap.goal.subject,
+                "level": active_roadmap_task.roadmap.goal.detected_level,
+                "goal_description": active_roadmap_task.roadmap.goal.exam_or_skill,
+                "topic": task.topic,
+                "description": task.description,
+                "resources": [{
+                    "id": r.id,
+                    "title": r.title,
+                    "url": r.url,
+                    "platform": r.platform,
+                    "type": r.resource_type,
+                    "rationale": r.rationale
+                } for r in task.resources],
+                "date": task.date,
+                "is_completed": task.is_completed,
+                "roadmap_task_id": active_roadmap_task.id
+            }]
+
+        return await run_in_threadpool(plan)
 
     return results
 
@@ -442,23 +957,27 @@ def get_task(task_id: int, user_id: str = Depends(get_current_user_id), db: Sess
     }
 
 @app.post("/submit-task")
-def submit_task(req: TaskSubmissionRequest, user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
-    task = db.query(DailyTask).filter(DailyTask.id == req.task_id, DailyTask.user_id == user_id).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+async def submit_task(req: TaskSubmissionRequest, user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    def load():
+        task = db.query(DailyTask).filter(DailyTask.id == req.task_id, DailyTask.user_id == user_id).first()
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        existing_sub = db.query(Submission).filter(Submission.task_id == req.task_id).first()
+        # Get the goal to determine level
+        level = "Beginner"
+        if task.goal:
+            level = task.goal.detected_level or "Beginner"
+        return task, existing_sub, level
+
+    task, existing_sub, level = await run_in_threadpool(load)
         
     # Check if already submitted
-    existing_sub = db.query(Submission).filter(Submission.task_id == req.task_id).first()
     if existing_sub:
          return {"message": "Task already submitted", "score": existing_sub.score, "ai_feedback": existing_sub.ai_feedback}
 
-    # Get the goal to determine level
-    level = "Beginner"
-    if task.goal:
-        level = task.goal.detected_level or "Beginner"
-
-    # Evaluate with AI
-    ai_response_str = ai_service.evaluate_submission_content(task.description, req.submission_text or "Image submitted", level)
+    # Evaluate with AI (batched with concurrent submissions, see grading_queue)
+    async with ai_limits.slot(user_id):
+        ai_response_str = await grading_queue.agrade(task.description, req.submission_text or "Image submitted", level)
     
     print(f"DEBUG: AI Score evaluation response: {ai_response_str}")
     
@@ -474,33 +993,40 @@ def submit_task(req: TaskSubmissionRequest, user_id: str = Depends(get_current_u
             print(f"ERROR: Failed to parse AI feedback JSON: {e}")
             pass
 
-    submission = Submission( # Renamed from new_submission
-        task_id=req.task_id,
-        text=req.submission_text,
-        image_url=req.submission_image_url,
-        ai_feedback=ai_feedback,
-        score=score
-    )
-    db.add(submission) # Changed from db.add(new_submission)
-    task.is_completed = True
-
-    # --- Sync with Roadmap ---
-    if task.roadmap_task_id:
-        roadmap_task = db.query(RoadmapTask).filter(RoadmapTask.id == task.roadmap_task_id).first()
-        if roadmap_task:
-            roadmap_task.status = "completed"
-            roadmap_task.completed_at = datetime.utcnow()
-            
-            # Unlock next roadmap task
-            next_rt = db.query(RoadmapTask).filter(
-                RoadmapTask.roadmap_id == roadmap_task.roadmap_id,
-                RoadmapTask.order_index == roadmap_task.order_index + 1
-            ).first()
-            if next_rt:
-                next_rt.status = "active"
-                next_rt.scheduled_date = date.today()
+    def save_submission():
+        next_rt = None
+        submission = Submission( # Renamed from new_submission
+            task_id=req.task_id,
+            text=req.submission_text,
+            image_url=req.submission_image_url,
+            ai_feedback=ai_feedback,
+            score=score
+        )
+        db.add(submission) # Changed from db.add(new_submission)
+        task.is_completed = True
 
-    db.commit()
+        # --- Sync with Roadmap ---
+        if task.roadmap_task_id:
+            roadmap_task = db.query(RoadmapTask).filter(RoadmapTask.id == task.roadmap_task_id).first()
+            if roadmap_task:
+                roadmap_task.status = "completed"
+                roadmap_task.completed_at = datetime.utcnow()
+                
+                # Unlock next roadmap task
+                next_rt = db.query(RoadmapTask).filter(
+                    RoadmapTask.roadmap_id == roadmap_task.roadmap_id,
+                    RoadmapTask.order_index == roadmap_task.order_index + 1
+                ).first()
+                if next_rt:
+                    next_rt.status = "active"
+                    next_rt.scheduled_date = date.today()
+
+        db.commit()
+        return next_rt
+
+    next_rt = await run_in_threadpool(save_submission)
+    if next_rt:
+        task_pregen.schedule(next_rt.roadmap_id, next_rt.order_index)
     print(f"DEBUG: Submission committed for task {req.task_id}. Score: {score}")
     return {"message": "Success", "score": score, "ai_feedback": ai_feedback}
 
@@ -552,52 +1078,50 @@ def get_progress(user_id: str = Depends(get_current_user_id), db: Session = Depe
     }
 
 @app.get("/weekly-summary")
-def get_weekly_summary(user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
-    # Simple logic: Get stats and ask AI
-    # In a real app, query last 7 days.
-    
-    completed_count = db.query(DailyTask).filter(DailyTask.user_id == user_id, DailyTask.is_completed == True).count()
-    
-    # Get average score again
-    submissions = db.query(Submission).join(DailyTask).filter(DailyTask.user_id == user_id).all()
-    avg_score = 0
-    if submissions:
-        total_score = sum([s.score for s in submissions if s.score is not None])
-        avg_score = total_score / len(submissions)
-        
-    # Get recent topics and level
-    recent_tasks = db.query(DailyTask).filter(DailyTask.user_id == user_id).order_by(DailyTask.date.desc()).limit(5).all()
-    topics_list = [t.topic for t in recent_tasks]
-    topics_str = ", ".join(topics_list)
-    
-    goal = db.query(Goal).filter(Goal.user_id == user_id).first()
-    level = goal.detected_level if goal else "Beginner"
+async def get_weekly_summary(user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    # Stats for the last 7 days; the summary is only rewritten when they change
+    def load():
+        week_stats = weekly_summary.compute(db, user_id, date.today())
+        return week_stats, weekly_summary.cached(db, user_id, week_stats)
 
-    summary_text = ai_service.generate_week_summary(completed_count, round(avg_score, 1), 7, level, topics_str)
+    week_stats, summary_text = await run_in_threadpool(load)
+    if summary_text is None:
+        async with ai_limits.slot(user_id):
+            summary_text = await ai_service.agenerate_week_summary(
+                week_stats["completed_count"], week_stats["avg_score"], weekly_summary.WINDOW_DAYS,
+                week_stats["level"], week_stats["topics"]
+            )
+        if summary_text:
+            await run_in_threadpool(weekly_summary.store, db, user_id, week_stats, summary_text)
     
     return {"mentor_summary_text": summary_text}
 
-@app.post("/chat")
-def chat(req: ChatRequest, user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+def _chat_context(req: ChatRequest, user_id: str, db: Session):
     goal_context = ""
     task_context = ""
     target_task = None
+    subject = None
 
     if req.goal_id:
         goal = db.query(Goal).filter(Goal.id == req.goal_id, Goal.user_id == user_id).first()
         if goal:
             goal_context = f"Subject: {goal.subject}, Goal: {goal.exam_or_skill}"
+            subject = goal.subject
     
     if req.task_id:
         target_task = db.query(DailyTask).filter(DailyTask.id == req.task_id, DailyTask.user_id == user_id).first()
         if target_task:
             task_context = f"Task: {target_task.topic}, Description: {target_task.description}, Current Resource: {target_task.resource_link}"
+            if subject is None and target_task.goal:
+                subject = target_task.goal.subject
 
-    ai_data = ai_service.answer_question(req.message, goal_context, task_context)
-    
-    if not ai_data:
-        return {"response": "I'm sorry, I'm having trouble thinking right now."}
+    # Answers are shared between students asking about the same subject/topic
+    cache_scope = semantic_cache.scope_key(subject, target_task.topic if target_task else None)
+    # The conversation so far about this task (or outside any task)
+    history = chat_memory.load(db, user_id, target_task.id if target_task else None)
+    return goal_context, task_context, target_task, cache_scope, history
 
+def _apply_chat_action(ai_data: dict, target_task: Optional[DailyTask], db: Session):
     # Process Action
     action = ai_data.get("action")
     if action and action.get("type") == "update_resource" and target_task:
@@ -613,6 +1137,81 @@ def chat(req: ChatRequest, user_id: str = Depends(get_current_user_id), db: Sess
         "task_updated": target_task.id if (action and target_task) else None
     }
 
+def _remember_chat(db: Session, user_id: str, target_task: Optional[DailyTask], message: str, ai_data: dict):
+    try:
+        chat_memory.record(db, user_id, target_task.id if target_task else None, message, ai_data.get("answer"))
+    except Exception as e:
+        # The answer is still returned; only the follow-up context is lost
+        db.rollback()
+        print(f"Could not save chat turn: {e}")
+
+@app.post("/chat")
+async def chat(req: ChatRequest, user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    goal_context, task_context, target_task, cache_scope, history = await run_in_threadpool(_chat_context, req, user_id, db)
+
+    async with ai_limits.slot(user_id):
+        ai_data = await ai_service.aanswer_question(req.message, goal_context, task_context, cache_scope, history)
+    
+    if not ai_data:
+        return {"response": "I'm sorry, I'm having trouble thinking right now."}
+
+    def finish_chat():
+        result = _apply_chat_action(ai_data, target_task, db)
+        _remember_chat(db, user_id, target_task, req.message, ai_data)
+        return result
+
+    return await run_in_threadpool(finish_chat)
+
+@app.post("/chat/stream")
+async def chat_stream(req: ChatRequest, user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    """
+    Server-Sent Events variant of /chat. Emits `token` events with answer text
+    as it streams in, then one `done` event with the same payload /chat returns.
+    """
+    goal_context, task_context, target_task, cache_scope, history = await run_in_threadpool(_chat_context, req, user_id, db)
+    target_task_id = target_task.id if target_task else None
+    # Admit before the stream starts so overload is a plain 429/503
+    lease = await ai_limits.acquire(user_id)
+
+    def finish_chat(ai_data):
+        # Runs after the stream ends, in a worker thread with its own session
+        session = SessionLocal()
+        try:
+            task = None
+            if target_task_id:
+                task = session.query(DailyTask).filter(DailyTask.id == target_task_id).first()
+            result = _apply_chat_action(ai_data, task, session)
+            _remember_chat(session, user_id, task, req.message, ai_data)
+            return result
+        finally:
+            session.close()
+
+    async def events():
+        # Flush headers straight away so the client sees the connection open
+        yield ": stream open\n\n"
+        ai_data = None
+        try:
+            async for kind, payload in ai_service.astream_answer_question(req.message, goal_context, task_context, cache_scope, history):
+                if kind == "token":
+                    yield _sse("token", {"text": payload})
+                else:
+                    ai_data = payload
+        finally:
+            lease.release()
+
+        if not ai_data:
+            yield _sse("done", {"response": "I'm sorry, I'm having trouble thinking right now."})
+            return
+
+        result = await run_in_threadpool(finish_chat, ai_data)
+        yield _sse("done", result)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/user/profile")
 def get_user_profile(user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
     user = db.query(User).filter(User.id == user_id).first()
@@ -667,10 +1266,14 @@ def update_user_settings(req: UserProfileUpdate, user_id: str = Depends(get_curr
     return {"message": "Settings updated successfully"}
 
 @app.post("/task/{task_id}/regenerate-resources")
-def regenerate_task_resources(task_id: int, user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
-    task = db.query(DailyTask).filter(DailyTask.id == task_id, DailyTask.user_id == user_id).first()
-    if not task:
-        raise HTTPException(status_code=404, detail="Task not found")
+async def regenerate_task_resources(task_id: int, user_id: str = Depends(get_current_user_id), db: Session = Depends(get_db)):
+    def load():
+        task = db.query(DailyTask).filter(DailyTask.id == task_id, DailyTask.user_id == user_id).first()
+        if not task:
+            raise HTTPException(status_code=404, detail="Task not found")
+        return task, task.goal, [r.url for r in task.resources]
+
+    task, goal, current_urls = await run_in_threadpool(load)
     
     # Get goal for AI context
     subject = "Learning"
@@ -678,64 +1281,60 @@ def regenerate_task_resources(task_id: int, user_id: str = Depends(get_current_u
     level = "Beginner"
     minutes = 60
     
-    if task.goal:
-        subject = task.goal.subject
-        exam = task.goal.exam_or_skill
-        level = task.goal.detected_level or "Beginner"
-        minutes = task.goal.daily_time_minutes
-    
-    # Generate new resources
-    ai_data_str = ai_service.generate_daily_task_content(
-        subject, exam, level, task.topic, minutes
-    )
+    if goal:
+        subject = goal.subject
+        exam = goal.exam_or_skill
+        level = goal.detected_level or "Beginner"
+        minutes = goal.daily_time_minutes
     
-    if not ai_data_str:
-        raise HTTPException(status_code=500, detail="Failed to generate new resources")
+    # A catalog variant with resources this task doesn't have yet, if one is left
+    catalog_args = (subject, task.topic, level, minutes)
+    cataloged = await run_in_threadpool(content_catalog.find, db, *catalog_args, current_urls)
+    if cataloged:
+        resources_data = cataloged["resources"]
+    else:
+        # Generate new resources - the user asked for something different, so skip the LLM cache
+        async with ai_limits.slot(user_id):
+            ai_data_str = await ai_service.agenerate_daily_task_content(
+                subject, exam, level, task.topic, minutes, use_cache=False
+            )
         
-    try:
-        ai_data = json.loads(ai_data_str)
-        resources_data = ai_data.get("resources", [])
-    except:
-        resources_data = []
+        if not ai_data_str:
+            raise HTTPException(status_code=500, detail="Failed to generate new resources")
+            
+        try:
+            ai_data = json.loads(ai_data_str)
+            resources_data = ai_data.get("resources", [])
+        except:
+            ai_data = {}
+            resources_data = []
 
-    # Clear old resources
-    db.query(TaskResource).filter(TaskResource.daily_task_id == task.id).delete()
-    
-    # Save new resources
-    for res in resources_data:
-        url = res.get("url", "")
-        confidence = res.get("video_confidence", "fallback")
-
-        new_res = TaskResource(
-            daily_task_id=task.id,
-            title=res.get("title"),
-            url=url,
-            platform=res.get("platform"),
-            resource_type=res.get("resource_type"),
-            rationale=res.get("rationale"),
-            video_confidence=confidence,
-            validated=res.get("is_embeddable", False),
-            fallback_used=(confidence == "fallback"),
-            video_id=res.get("video_id"),
-            validated_at=datetime.fromisoformat(res["validated_at"]) if res.get("validated_at") else None,
-            is_embeddable=res.get("is_embeddable", False)
-        )
-        db.add(new_res)
-    
-    db.commit()
-    db.refresh(task)
-    
-    return {
-        "message": "Resources regenerated",
-        "resources": [{
-            "id": r.id,
-            "title": r.title,
-            "url": r.url,
-            "platform": r.platform,
-            "type": r.resource_type,
-            "rationale": r.rationale
-        } for r in task.resources]
-    }
+    def replace_resources():
+        # Clear old resources
+        db.query(TaskResource).filter(TaskResource.daily_task_id == task.id).delete()
+        
+        # Save new resources
+        _save_task_resources(db, task.id, resources_data, task.roadmap_task_id)
+        if not cataloged:
+            # Another variant for the next user who asks
+            content_catalog.remember(db, *catalog_args, ai_data.get("description"), resources_data)
+        
+        db.commit()
+        db.refresh(task)
+        
+        return {
+            "message": "Resources regenerated",
+            "resources": [{
+                "id": r.id,
+                "title": r.title,
+                "url": r.url,
+                "platform": r.platform,
+                "type": r.resource_type,
+                "rationale": r.rationale
+            } for r in task.resources]
+        }
+
+    return await run_in_threadpool(replace_resources)
 
 # Server configuration for direct execution
 if __name__ == "__main__":
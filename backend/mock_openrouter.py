@@ -0,0 +1,342 @@
+"""
+Local OpenAI-compatible stand-in for OpenRouter, for load and latency testing
+without spending credits.
+
+Implements POST /api/v1/chat/completions (also /v1/chat/completions) with
+`stream: true` SSE, `usage` (tokens + cost) and canned replies shaped like
+each ai_service prompt expects (detected from the `response_format` schema
+name, or the prompt text). Run it and point the backend at it:
+
+    python mock_openrouter.py --port 8001 --latency lognormal:800:0.5 --error-rate 0.02
+    OPENROUTER_URL=http://127.0.0.1:8001/api/v1/chat/completions OPENROUTER_API_KEY=mock python main.py
+
+Configuration (flags override the environment):
+    MOCK_LLM_LATENCY=lognormal:800:0.5     time to first token, ms:
+                                           fixed:MS | uniform:MIN:MAX | normal:MEAN:SD | lognormal:MEDIAN:SIGMA
+    MOCK_LLM_LATENCY_ROADMAP=...           per prompt type override
+    MOCK_LLM_TOKENS_PER_SEC=120            generation speed after the first token (0 = instant)
+    MOCK_LLM_ERROR_RATE=0.0                fraction of requests that fail
+    MOCK_LLM_ERROR_STATUSES=429,500,503    picked at random for failures (429 carries Retry-After)
+    MOCK_LLM_MALFORMED_RATE=0.0            fraction of replies wrapped in prose / cut short (exercises repair)
+    MOCK_LLM_FAIL_MODELS=a/model,b/model   models that always answer 503 (exercises fallbacks)
+    MOCK_LLM_ROADMAP_TASKS=12              tasks in a canned roadmap
+    MOCK_LLM_PRICE_PER_1K=0.0006           reported cost per 1k tokens
+    MOCK_LLM_SEED=                         seed for reproducible runs
+
+GET /stats returns request counts per prompt type and status.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+def _env(name, default):
+    value = os.getenv(name)
+    return value if value not in (None, "") else default
+
+
+class MockConfig:
+    def __init__(self):
+        self.latency = _env("MOCK_LLM_LATENCY", "lognormal:800:0.5")
+        self.tokens_per_sec = float(_env("MOCK_LLM_TOKENS_PER_SEC", "120"))
+        self.error_rate = float(_env("MOCK_LLM_ERROR_RATE", "0"))
+        self.error_statuses = [int(s) for s in _env("MOCK_LLM_ERROR_STATUSES", "429,500,503").split(",") if s.strip()]
+        self.malformed_rate = float(_env("MOCK_LLM_MALFORMED_RATE", "0"))
+        self.fail_models = {m.strip() for m in _env("MOCK_LLM_FAIL_MODELS", "").split(",") if m.strip()}
+        self.roadmap_tasks = int(_env("MOCK_LLM_ROADMAP_TASKS", "12"))
+        self.price_per_1k = float(_env("MOCK_LLM_PRICE_PER_1K", "0.0006"))
+        seed = _env("MOCK_LLM_SEED", None)
+        self.random = random.Random(int(seed) if seed is not None else None)
+
+    def latency_for(self, prompt_type):
+        spec = _env(f"MOCK_LLM_LATENCY_{prompt_type.upper()}", self.latency) if prompt_type else self.latency
+        return sample_latency(spec, self.random)
+
+
+config = MockConfig()
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def sample_latency(spec, rng=random):
+    """
+    Seconds drawn from a distribution spec such as "lognormal:800:0.5" (ms).
+    """
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "fixed":
+        ms = params[0]
+    elif kind == "uniform":
+        ms = rng.uniform(params[0], params[1])
+    elif kind == "normal":
+        ms = rng.gauss(params[0], params[1])
+    elif kind == "lognormal":
+        ms = rng.lognormvariate(math.log(params[0]), params[1])
+    else:
+        raise ValueError(f"Unknown latency distribution: {spec}")
+    return max(0.0, ms) / 1000
+
+
+def estimate_tokens(text):
+    return max(1, math.ceil(len(text or "") / 4))
+
+
+# --- Canned replies ---
+
+def detect_prompt_type(body):
+    fmt = body.get("response_format") or {}
+    name = (fmt.get("json_schema") or {}).get("name")
+    if name:
+        return name
+    # Plain-text prompts (streamed chat, week summary) or response_format disabled
+    text = " ".join(m.get("content") or "" for m in body.get("messages", []) if m.get("role") == "user")
+    markers = [
+        ("Weekly Check-in", "week_summary"),
+        ("running summary of this conversation", "chat_summary"),
+        ("Plan the outline of a learning roadmap", "roadmap_skeleton"),
+        ("Write the lessons of one module", "roadmap_module"),
+        ("learning roadmap", "roadmap"),
+        ("starting level", "detect_level"),
+        ("NON-YOUTUBE", "curated_resources"),
+        ("Grade each of the", "evaluation_batch"),
+        ("Evaluate the submission", "evaluation"),
+        ("actionable study task", "daily_task"),
+        ("[[ACTION]]", "chat_stream"),
+        ("Student Question", "chat"),
+    ]
+    for marker, prompt_type in markers:
+        if marker in text:
+            return prompt_type
+    return "unknown"
+
+
+def _user_field(body, label, default):
+    text = " ".join(m.get("content") or "" for m in body.get("messages", []) if m.get("role") == "user")
+    for line in text.splitlines():
+        line = line.strip().lstrip("- ")
+        if line.startswith(label + ":"):
+            return line[len(label) + 1:].strip() or default
+    return default
+
+
+def canned_reply(prompt_type, body, rng):
+    subject = _user_field(body, "Subject", "the subject")
+    topic = _user_field(body, "Topic", "Fundamentals")
+    if prompt_type == "detect_level":
+        data = {"level": rng.choice(["Beginner", "Intermediate"]), "message": f"Welcome aboard - let's build a daily {subject} habit."}
+    elif prompt_type == "curated_resources":
+        data = {"resources": [
+            {"title": f"{topic} - Official Docs", "url": "https://docs.python.org/3/tutorial/", "platform": "Official Docs",
+             "resource_type": "docs", "rationale": "Authoritative reference."},
+            {"title": f"{topic} Exercises", "url": "https://github.com/topics/exercises", "platform": "GitHub",
+             "resource_type": "interactive", "rationale": "Hands-on practice."},
+        ]}
+    elif prompt_type == "daily_task":
+        data = {"topic": topic, "description": f"1. Watch the first resource on {topic}.\n2. Take notes.\n3. Solve two small exercises."}
+    elif prompt_type == "evaluation":
+        data = {"score": rng.randint(60, 95), "feedback": "Solid attempt. Explain your reasoning for the edge cases next time."}
+    elif prompt_type == "evaluation_batch":
+        text = " ".join(m.get("content") or "" for m in body.get("messages", []) if m.get("role") == "user")
+        ids = sorted({int(i) for i in re.findall(r'<submission id="(\d+)">', text)})
+        data = {"results": [
+            {"id": i, "score": rng.randint(60, 95), "feedback": "Solid attempt. Explain your reasoning for the edge cases next time."}
+            for i in ids
+        ]}
+    elif prompt_type == "roadmap":
+        data = _canned_roadmap(subject, config.roadmap_tasks)
+    elif prompt_type == "roadmap_skeleton":
+        roadmap = _canned_roadmap(subject, config.roadmap_tasks)
+        for phase in roadmap["phases"]:
+            phase["modules"] = [{"name": m["name"], "focus": "Learn the concept and practise it.", "task_count": len(m["tasks"])}
+                                for m in phase["modules"]]
+        data = roadmap
+    elif prompt_type == "roadmap_module":
+        module = _user_field(body, "Module", "Module")
+        count = int(_user_field(body, "Tasks", "3"))
+        data = {"tasks": [
+            {"title": f"{module}: lesson {t + 1}", "description": "Learn the concept and practise it.",
+             "estimated_time": 45, "output_deliverable": "Notes and a small exercise", "resource_type": "Mixed"}
+            for t in range(count)
+        ]}
+    elif prompt_type == "chat":
+        data = {"answer": "Break the problem into smaller steps and test each one.", "action": None}
+    elif prompt_type == "chat_stream":
+        return "Break the problem into smaller steps and test each one. Start with the simplest case, then add edge cases."
+    elif prompt_type == "chat_summary":
+        return "The student is working through the task and asked for clarifications; the mentor suggested smaller steps."
+    elif prompt_type == "week_summary":
+        return "Steady week: you showed up, covered new ground and kept your scores up. Next week, revisit the weakest topic before moving on."
+    else:
+        data = {"message": "ok"}
+    return json.dumps(data)
+
+
+def _canned_roadmap(subject, task_count):
+    phases = []
+    per_module = 3
+    modules_needed = max(1, math.ceil(task_count / per_module))
+    for m in range(modules_needed):
+        phase_index = m // 2
+        if phase_index == len(phases):
+            phases.append({"name": f"Phase {phase_index + 1}", "modules": []})
+        tasks = [
+            {"title": f"{subject} lesson {m * per_module + t + 1}", "description": "Learn the concept and practise it.",
+             "estimated_time": 45, "output_deliverable": "Notes and a small exercise", "resource_type": "Mixed"}
+            for t in range(min(per_module, task_count - m * per_module))
+        ]
+        phases[phase_index]["modules"].append({"name": f"Module {m + 1}", "tasks": tasks})
+    return {"title": f"Your Personalized {subject} Roadmap", "phases": phases}
+
+
+def malformed(text, rng):
+    if rng.random() < 0.5:
+        return "Sure! Here is the result:\n```json\n" + text + "\n```\nLet me know if you need anything else."
+    return text[: max(1, len(text) // 2)]
+
+
+# --- API ---
+
+app = FastAPI(title="Mock OpenRouter")
+
+
+def _count(*keys):
+    with _stats_lock:
+        for key in keys:
+            _stats[key] += 1
+
+
+def _error(status):
+    headers = {"Retry-After": "1"} if status == 429 else {}
+    return JSONResponse({"error": {"message": f"mock error {status}", "code": status}}, status_code=status, headers=headers)
+
+
+def _usage(body, content):
+    prompt_tokens = sum(estimate_tokens(m.get("content")) for m in body.get("messages", []))
+    completion_tokens = estimate_tokens(content)
+    total = prompt_tokens + completion_tokens
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total,
+        "cost": round(total / 1000 * config.price_per_1k, 8),
+    }
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+
+@app.get("/stats")
+def stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+@app.post("/api/v1/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt_type = detect_prompt_type(body)
+    model = body.get("model", "mock/model")
+    rng = config.random
+    _count("requests", f"prompt:{prompt_type}")
+
+    first_token = config.latency_for(prompt_type)
+    if model in config.fail_models or rng.random() < config.error_rate:
+        status = 503 if model in config.fail_models else rng.choice(config.error_statuses)
+        _count(f"status:{status}")
+        await asyncio.sleep(first_token / 4)
+        return _error(status)
+
+    content = canned_reply(prompt_type, body, rng)
+    if rng.random() < config.malformed_rate:
+        _count("malformed")
+        content = malformed(content, rng)
+    max_tokens = body.get("max_tokens")
+    if max_tokens and estimate_tokens(content) > max_tokens:
+        content = content[: max_tokens * 4]
+    usage = _usage(body, content)
+    _count("status:200")
+
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    generation = usage["completion_tokens"] / config.tokens_per_sec if config.tokens_per_sec > 0 else 0.0
+
+    if body.get("stream"):
+        return StreamingResponse(
+            _stream(completion_id, created, model, content, usage, first_token, generation),
+            media_type="text/event-stream",
+        )
+
+    await asyncio.sleep(first_token + generation)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": created,
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": usage,
+    }
+
+
+async def _stream(completion_id, created, model, content, usage, first_token, generation):
+    def chunk(delta=None, finish_reason=None, **extra):
+        choices = [{"index": 0, "delta": delta or {}, "finish_reason": finish_reason}]
+        return f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': choices, **extra})}\n\n"
+
+    await asyncio.sleep(first_token)
+    yield ": OPENROUTER PROCESSING\n\n"
+    pieces = [content[i:i + 16] for i in range(0, len(content), 16)] or [""]
+    pause = generation / len(pieces)
+    for index, piece in enumerate(pieces):
+        if index and pause:
+            await asyncio.sleep(pause)
+        yield chunk({"role": "assistant", "content": piece} if index == 0 else {"content": piece})
+    yield chunk(finish_reason="stop")
+    # OpenRouter sends usage in a final chunk with no choices
+    yield f"data: {json.dumps({'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': usage})}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", help="e.g. fixed:200, uniform:100:900, lognormal:800:0.5")
+    parser.add_argument("--tokens-per-sec", type=float)
+    parser.add_argument("--error-rate", type=float)
+    parser.add_argument("--malformed-rate", type=float)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    if args.latency:
+        sample_latency(args.latency)  # fail fast on a bad spec
+        config.latency = args.latency
+    if args.tokens_per_sec is not None:
+        config.tokens_per_sec = args.tokens_per_sec
+    if args.error_rate is not None:
+        config.error_rate = args.error_rate
+    if args.malformed_rate is not None:
+        config.malformed_rate = args.malformed_rate
+    if args.seed is not None:
+        config.random = random.Random(args.seed)
+
+    import uvicorn
+    print(f"Mock OpenRouter on http://{args.host}:{args.port}/api/v1/chat/completions (latency {config.latency})")
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Model routing: maps each ai_service prompt to a tier with its own model,
+max_tokens, timeout and ordered fallback models, and keeps per-tier latency.
+
+Everything can be overridden from the environment, e.g.
+    AI_TIER_FAST_MODEL=meta-llama/llama-3.1-8b-instruct
+    AI_TIER_FAST_MAX_TOKENS=400
+    AI_TIER_FAST_TIMEOUT=20
+    AI_TIER_FAST_FALLBACKS=mistralai/mistral-7b-instruct,meta-llama/llama-3.1-70b-instruct
+    AI_PROMPT_TIER_EVALUATION=standard
+"""
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+DEFAULT_TIERS = {
+    # Short, structured answers: level detection, grading, weekly blurb
+    "fast": {
+        "model": "meta-llama/llama-3.1-8b-instruct",
+        "max_tokens": 500,
+        "timeout": 20,
+        "fallbacks": ["meta-llama/llama-3.1-70b-instruct"],
+    },
+    # Conversational / medium JSON answers
+    "standard": {
+        "model": "meta-llama/llama-3.1-70b-instruct",
+        "max_tokens": 1500,
+        "timeout": 60,
+        "fallbacks": ["mistralai/mixtral-8x7b-instruct"],
+    },
+    # Whole-curriculum generation
+    "long": {
+        "model": "meta-llama/llama-3.1-70b-instruct",
+        "max_tokens": 8000,
+        "timeout": 120,
+        "fallbacks": ["mistralai/mixtral-8x7b-instruct"],
+    },
+}
+
+DEFAULT_PROMPT_TIERS = {
+    "detect_level": "fast",
+    "evaluation": "fast",
+    "week_summary": "fast",
+    "chat_summary": "fast",
+    # Several graded submissions per reply; needs the larger output budget
+    "evaluation_batch": "standard",
+    "curated_resources": "standard",
+    "daily_task": "standard",
+    "chat": "standard",
+    "roadmap_skeleton": "standard",
+    "roadmap_module": "standard",
+    # Single-completion roadmap, when no outline comes back
+    "roadmap": "long",
+}
+
+DEFAULT_TIER = "standard"
+LATENCY_WINDOW = int(os.getenv("AI_LATENCY_WINDOW", "500"))
+
+
+@dataclass
+class Route:
+    tier: str
+    model: str
+    max_tokens: Optional[int]
+    timeout: float
+    fallbacks: List[str] = field(default_factory=list)
+
+    @property
+    def models(self):
+        # Primary first, then fallbacks, without repeats
+        ordered = []
+        for model in [self.model] + self.fallbacks:
+            if model and model not in ordered:
+                ordered.append(model)
+        return ordered
+
+
+def _env(name, default):
+    value = os.getenv(name)
+    return value if value not in (None, "") else default
+
+
+def tier_config(tier):
+    defaults = DEFAULT_TIERS.get(tier, DEFAULT_TIERS[DEFAULT_TIER])
+    prefix = f"AI_TIER_{tier.upper()}_"
+    fallbacks = _env(prefix + "FALLBACKS", None)
+    return Route(
+        tier=tier,
+        model=_env(prefix + "MODEL", defaults["model"]),
+        max_tokens=int(_env(prefix + "MAX_TOKENS", defaults["max_tokens"])) or None,
+        timeout=float(_env(prefix + "TIMEOUT", defaults["timeout"])),
+        fallbacks=[m.strip() for m in fallbacks.split(",") if m.strip()] if fallbacks is not None else list(defaults["fallbacks"]),
+    )
+
+
+def tier_for(prompt_type):
+    if not prompt_type:
+        return DEFAULT_TIER
+    return _env(f"AI_PROMPT_TIER_{prompt_type.upper()}", DEFAULT_PROMPT_TIERS.get(prompt_type, DEFAULT_TIER))
+
+
+def route(prompt_type=None, model=None):
+    """
+    Returns the Route for a prompt. An explicit `model` pins the primary model
+    but keeps the tier's limits and fallbacks.
+    """
+    resolved = tier_config(tier_for(prompt_type))
+    if model:
+        resolved.model = model
+    return resolved
+
+
+_lock = threading.Lock()
+_latency = {}
+
+
+def _tier_stats(tier):
+    stats = _latency.get(tier)
+    if stats is None:
+        stats = {"calls": 0, "errors": 0, "fallbacks": 0, "samples": deque(maxlen=LATENCY_WINDOW), "models": {}}
+        _latency[tier] = stats
+    return stats
+
+
+def record(tier, model, seconds, ok=True, fallback=False):
+    with _lock:
+        stats = _tier_stats(tier)
+        stats["calls"] += 1
+        if not ok:
+            stats["errors"] += 1
+        if fallback:
+            stats["fallbacks"] += 1
+        if ok:
+            stats["samples"].append(seconds)
+        per_model = stats["models"].setdefault(model, {"calls": 0, "errors": 0})
+        per_model["calls"] += 1
+        if not ok:
+            per_model["errors"] += 1
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def recent_percentile(tier, fraction, min_samples=1):
+    """
+    Percentile (seconds) of recent successful call latency for a tier, or
+    None until there are at least `min_samples` samples.
+    """
+    with _lock:
+        samples = list(_latency[tier]["samples"]) if tier in _latency else []
+    if len(samples) < max(1, min_samples):
+        return None
+    return percentile(samples, fraction)
+
+
+def stats():
+    with _lock:
+        snapshot = {}
+        for tier, data in _latency.items():
+            samples = list(data["samples"])
+            snapshot[tier] = {
+                "calls": data["calls"],
+                "errors": data["errors"],
+                "fallbacks": data["fallbacks"],
+                "avg_ms": round(sum(samples) / len(samples) * 1000, 1) if samples else None,
+                "p50_ms": round(percentile(samples, 0.5) * 1000, 1) if samples else None,
+                "p95_ms": round(percentile(samples, 0.95) * 1000, 1) if samples else None,
+                "models": {m: dict(v) for m, v in data["models"].items()},
+            }
+    routes = {}
+    for tier in DEFAULT_TIERS:
+        config = tier_config(tier)
+        routes[tier] = {"model": config.model, "max_tokens": config.max_tokens, "timeout": config.timeout, "fallbacks": config.fallbacks}
+    prompts = {prompt: tier_for(prompt) for prompt in DEFAULT_PROMPT_TIERS}
+    return {"tiers": routes, "prompts": prompts, "latency": snapshot}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Date, Text
+from sqlalchemy import Column, String, Integer, DateTime, Boolean, ForeignKey, Date, Text, Float
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -129,3 +129,134 @@ class TaskResource(Base):
 
     daily_task = relationship("DailyTask", back_populates="resources")
     roadmap_task = relationship("RoadmapTask", back_populates="resources")
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+
+    key = Column(String(64), primary_key=True)  # sha256 of model + normalized messages
+    prompt_type = Column(String, nullable=False, index=True)
+    model = Column(String, nullable=False)
+    response = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False, index=True)
+    last_accessed_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    hit_count = Column(Integer, default=0)
+
+
+class LLMUsage(Base):
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    endpoint = Column(String, nullable=True, index=True)  # route template, e.g. /daily-plan
+    user_id = Column(String, nullable=True, index=True)
+    prompt_type = Column(String, nullable=True, index=True)
+    tier = Column(String, nullable=True)
+    model = Column(String, nullable=True)
+    prompt_tokens = Column(Integer, default=0)
+    completion_tokens = Column(Integer, default=0)
+    cost = Column(Float, nullable=True)  # provider-reported credits, when available
+    latency_ms = Column(Float, default=0.0)
+    cached = Column(Boolean, default=False)  # served from llm_cache, no provider call
+    ok = Column(Boolean, default=True)
+
+
+class RoadmapTemplate(Base):
+    __tablename__ = "roadmap_templates"
+
+    # Normalized "subject|level|target_goal|learning_style"
+    key = Column(String, primary_key=True)
+    subject = Column(String, nullable=False, index=True)
+    level = Column(String, nullable=False)
+    target_goal = Column(String, nullable=False)
+    learning_style = Column(String, nullable=False)
+    roadmap = Column(Text, nullable=False)  # validated roadmap JSON, as generated
+    task_count = Column(Integer, nullable=False)
+    daily_time_minutes = Column(Integer, nullable=True)  # what the source generation was sized for
+    generations = Column(Integer, default=1)  # LLM generations folded into this template
+    uses = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+
+class ContentCatalogEntry(Base):
+    __tablename__ = "content_catalog"
+
+    id = Column(Integer, primary_key=True, index=True)
+    # Normalized "subject|topic|level|time bucket"; a key holds a few variants
+    key = Column(String, nullable=False, index=True)
+    subject = Column(String, nullable=False)
+    topic = Column(String, nullable=False)
+    level = Column(String, nullable=False)
+    time_bucket = Column(String, nullable=False)
+    description = Column(Text, nullable=False)
+    resources = Column(Text, nullable=False)  # JSON list of resource dicts, as generated
+    quality = Column(Float, nullable=False)  # 0-1, see content_catalog.quality
+    uses = Column(Integer, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+class ChatThread(Base):
+    __tablename__ = "chat_threads"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False, index=True)
+    task_id = Column(Integer, ForeignKey("daily_tasks.id"), nullable=True)  # None: chat outside a task
+    summary = Column(Text, nullable=True)  # running summary of the turns compacted away
+    summarized_through = Column(Integer, default=0)  # last ChatMessage.id folded into the summary
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    messages = relationship("ChatMessage", back_populates="thread", cascade="all, delete-orphan", order_by="ChatMessage.id")
+
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    thread_id = Column(Integer, ForeignKey("chat_threads.id"), nullable=False, index=True)
+    role = Column(String, nullable=False)  # "user" | "assistant"
+    content = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    thread = relationship("ChatThread", back_populates="messages")
+
+class OnboardingJob(Base):
+    __tablename__ = "onboarding_jobs"
+
+    id = Column(String, primary_key=True)  # uuid4 hex
+    user_id = Column(String, ForeignKey("users.id"), nullable=True, index=True)
+    email = Column(String, nullable=True)
+    request = Column(Text, nullable=False)  # OnboardingRequest as JSON
+    request_hash = Column(String(64), nullable=False, index=True)  # dedupes client retries
+    status = Column(String, default="queued", index=True)  # queued, running, succeeded, failed
+    progress = Column(Text, nullable=True)  # JSON: {subject: {"status": ..., ...}}
+    result = Column(Text, nullable=True)  # JSON: same payload POST /onboarding returns
+    error = Column(Text, nullable=True)
+    attempts = Column(Integer, default=0)
+    worker = Column(String, nullable=True)
+    lease_expires_at = Column(DateTime, nullable=True, index=True)  # running job is retried after this
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class SchedulerLease(Base):
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String, primary_key=True)  # e.g. "nightly_precompute"
+    holder = Column(String, nullable=True)  # replica running it, None when idle
+    lease_expires_at = Column(DateTime, nullable=True)
+    last_completed_for = Column(Date, nullable=True)  # day the last full run prepared
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+class WeeklySummary(Base):
+    __tablename__ = "weekly_summaries"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    week = Column(String, primary_key=True)  # ISO week, e.g. "2026-W42"
+    fingerprint = Column(String(64), nullable=False)  # sha256 of the stats the text was written for
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
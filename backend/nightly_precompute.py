@@ -0,0 +1,306 @@
+"""
+Off-peak precompute of every active user's daily plan.
+
+Most users open the dashboard within the same morning hour, and each
+/daily-plan that finds no task for the day runs an AI enrichment. Once a
+night, inside a quiet window, an in-process scheduler creates the day's
+DailyTask (with its description and resources) for every active user whose
+current roadmap task has none yet, so the morning peak only reads.
+
+- Every replica runs the scheduler; a lease row in `scheduler_leases` lets
+  one of them do the run. The holder keeps extending the lease while it
+  works, so a replica that dies mid-run loses it and another takes over.
+- A run only looks at what is still missing, so a taken-over or restarted
+  run resumes where the last one stopped. The day is marked done once a
+  pass has been through every pending task; tasks whose generation failed
+  are left to /daily-plan.
+- Tasks are created by a bounded worker pool started at a capped rate.
+
+"Active" users have an active roadmap task and either a daily task or a new
+roadmap within NIGHTLY_PRECOMPUTE_ACTIVE_DAYS. The run prepares the day of
+the coming morning: a 03:00 run prepares today, a 23:00 run tomorrow.
+
+    NIGHTLY_PRECOMPUTE_ENABLED=true
+    NIGHTLY_PRECOMPUTE_HOUR=3           # local server hour the window opens
+    NIGHTLY_PRECOMPUTE_WINDOW_HOURS=4   # an interrupted run resumes until it closes
+    NIGHTLY_PRECOMPUTE_CONCURRENCY=4
+    NIGHTLY_PRECOMPUTE_RATE=60          # tasks started per minute, at most
+    NIGHTLY_PRECOMPUTE_ACTIVE_DAYS=7
+    NIGHTLY_PRECOMPUTE_LEASE=300        # seconds a silent replica keeps the run
+"""
+import os
+import time
+import uuid
+import socket
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import or_, and_, exists
+from sqlalchemy.exc import IntegrityError
+
+import llm_usage
+import task_pregen
+from database import SessionLocal
+from models import DailyTask, Roadmap, RoadmapTask, SchedulerLease
+
+logger = logging.getLogger(__name__)
+
+NIGHTLY_PRECOMPUTE_ENABLED = os.getenv("NIGHTLY_PRECOMPUTE_ENABLED", "true").lower() in ("1", "true", "yes")
+NIGHTLY_PRECOMPUTE_HOUR = int(os.getenv("NIGHTLY_PRECOMPUTE_HOUR", "3"))
+NIGHTLY_PRECOMPUTE_WINDOW_HOURS = int(os.getenv("NIGHTLY_PRECOMPUTE_WINDOW_HOURS", "4"))
+NIGHTLY_PRECOMPUTE_CONCURRENCY = int(os.getenv("NIGHTLY_PRECOMPUTE_CONCURRENCY", "4"))
+NIGHTLY_PRECOMPUTE_RATE = float(os.getenv("NIGHTLY_PRECOMPUTE_RATE", "60"))
+NIGHTLY_PRECOMPUTE_ACTIVE_DAYS = int(os.getenv("NIGHTLY_PRECOMPUTE_ACTIVE_DAYS", "7"))
+NIGHTLY_PRECOMPUTE_LEASE = int(os.getenv("NIGHTLY_PRECOMPUTE_LEASE", "300"))
+# How often each replica checks whether a run is due
+CHECK_INTERVAL = 300
+
+LEASE_NAME = "nightly_precompute"
+
+_lock = threading.Lock()
+_stats = {"runs": 0, "completed_runs": 0, "skipped_runs": 0, "planned": 0, "created": 0, "failed": 0, "skipped": 0}
+_last_run = None
+_stop = threading.Event()
+_scheduler = None
+
+
+def _count(field, delta=1):
+    with _lock:
+        _stats[field] += delta
+
+
+def plan_day(now=None):
+    """
+    The day whose morning comes next: what a run started at `now` prepares.
+    """
+    return ((now or datetime.now()) + timedelta(hours=12)).date()
+
+
+def in_window(now=None):
+    hours_in = ((now or datetime.now()).hour - NIGHTLY_PRECOMPUTE_HOUR) % 24
+    return hours_in < NIGHTLY_PRECOMPUTE_WINDOW_HOURS
+
+
+# --- Lease ---
+
+def _acquire(holder, day):
+    # Free (or abandoned) and the day not done yet: a conditional UPDATE, so one replica wins
+    db = SessionLocal()
+    try:
+        if db.query(SchedulerLease).filter(SchedulerLease.name == LEASE_NAME).first() is None:
+            try:
+                db.add(SchedulerLease(name=LEASE_NAME))
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+        now = datetime.utcnow()
+        acquired = db.query(SchedulerLease).filter(
+            SchedulerLease.name == LEASE_NAME,
+            or_(SchedulerLease.holder.is_(None), SchedulerLease.lease_expires_at < now),
+            or_(SchedulerLease.last_completed_for.is_(None), SchedulerLease.last_completed_for < day),
+        ).update({
+            "holder": holder, "lease_expires_at": now + timedelta(seconds=NIGHTLY_PRECOMPUTE_LEASE), "updated_at": now,
+        }, synchronize_session=False)
+        db.commit()
+        return acquired == 1
+    finally:
+        db.close()
+
+
+def _update_lease(holder, values):
+    db = SessionLocal()
+    try:
+        updated = db.query(SchedulerLease).filter(
+            SchedulerLease.name == LEASE_NAME, SchedulerLease.holder == holder
+        ).update({**values, "updated_at": datetime.utcnow()}, synchronize_session=False)
+        db.commit()
+        return updated == 1
+    finally:
+        db.close()
+
+
+def _renew(holder):
+    return _update_lease(holder, {"lease_expires_at": datetime.utcnow() + timedelta(seconds=NIGHTLY_PRECOMPUTE_LEASE)})
+
+
+# --- Work ---
+
+def pending_tasks(db, day):
+    """
+    (roadmap task id, user id) for each active user whose current roadmap
+    task (the one /daily-plan shows) has no DailyTask on `day` yet.
+    """
+    since = day - timedelta(days=NIGHTLY_PRECOMPUTE_ACTIVE_DAYS)
+    recently_active = or_(
+        exists().where(and_(DailyTask.user_id == Roadmap.user_id, DailyTask.date >= since)),
+        Roadmap.created_at >= datetime.combine(since, datetime.min.time()),
+    )
+    rows = db.query(RoadmapTask.id, Roadmap.user_id).join(Roadmap).filter(
+        RoadmapTask.status == "active",
+        Roadmap.is_active.isnot(False),
+        recently_active,
+    ).order_by(RoadmapTask.id).all()
+
+    current = {}
+    for task_id, user_id in rows:
+        current.setdefault(user_id, task_id)
+    if not current:
+        return []
+    planned = {row.roadmap_task_id for row in db.query(DailyTask.roadmap_task_id).filter(
+        DailyTask.roadmap_task_id.in_(list(current.values())), DailyTask.date == day
+    ).all()}
+    return [(task_id, user_id) for user_id, task_id in current.items() if task_id not in planned]
+
+
+def _materialize(task_id, user_id, day):
+    llm_usage.begin(LEASE_NAME)
+    llm_usage.set_user(user_id)
+    try:
+        if not task_pregen.prepare(task_id):
+            _count("failed")
+            return
+        db = SessionLocal()
+        try:
+            roadmap_task = db.query(RoadmapTask).filter(RoadmapTask.id == task_id).first()
+            already = db.query(DailyTask.id).filter(
+                DailyTask.user_id == user_id, DailyTask.roadmap_task_id == task_id, DailyTask.date == day
+            ).first()
+            data = task_pregen.content(roadmap_task) if roadmap_task else None
+            if roadmap_task is None or roadmap_task.status != "active" or already or data is None:
+                # Completed, or planned by /daily-plan, while we were generating
+                _count("skipped")
+                return
+            task = DailyTask(
+                user_id=user_id,
+                goal_id=roadmap_task.roadmap.goal_id,
+                roadmap_task_id=task_id,
+                topic=roadmap_task.title,
+                description=data["description"],
+                date=day
+            )
+            db.add(task)
+            db.flush()
+            task_pregen.attach(db, task_id, task.id)
+            db.commit()
+            _count("created")
+        finally:
+            db.close()
+    except Exception as e:
+        _count("failed")
+        logger.warning("Precomputing the daily task for roadmap task %s failed: %s", task_id, e)
+
+
+def run(day=None):
+    """
+    One precompute pass for `day` (default: the coming morning). Returns a
+    summary, or None if another replica holds the run or the day is done.
+    """
+    global _last_run
+    day = day or plan_day()
+    holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+    if not _acquire(holder, day):
+        _count("skipped_runs")
+        return None
+
+    _count("runs")
+    started = datetime.utcnow()
+    with _lock:
+        before = dict(_stats)
+    db = SessionLocal()
+    try:
+        tasks = pending_tasks(db, day)
+    finally:
+        db.close()
+    _count("planned", len(tasks))
+    logger.info("Nightly precompute for %s: %d daily tasks to prepare", day, len(tasks))
+
+    interval = 60 / NIGHTLY_PRECOMPUTE_RATE if NIGHTLY_PRECOMPUTE_RATE > 0 else 0
+    slots = threading.BoundedSemaphore(NIGHTLY_PRECOMPUTE_CONCURRENCY)
+    covered = True
+    renewed = time.monotonic()
+    with ThreadPoolExecutor(max_workers=NIGHTLY_PRECOMPUTE_CONCURRENCY, thread_name_prefix="nightly-precompute") as pool:
+        for task_id, user_id in tasks:
+            slots.acquire()
+            if time.monotonic() - renewed > NIGHTLY_PRECOMPUTE_LEASE / 3:
+                renewed = time.monotonic()
+                if not _renew(holder):
+                    # Lost the lease (we stalled): whoever has it now carries on
+                    slots.release()
+                    covered = False
+                    break
+            if _stop.is_set():
+                slots.release()
+                covered = False
+                break
+            future = pool.submit(_materialize, task_id, user_id, day)
+            future.add_done_callback(lambda _: slots.release())
+            if interval and _stop.wait(interval):
+                covered = False
+                break
+
+    if covered:
+        _update_lease(holder, {"holder": None, "lease_expires_at": None, "last_completed_for": day})
+        _count("completed_runs")
+    else:
+        # Interrupted: the next check (here or on another replica) resumes it
+        _update_lease(holder, {"holder": None, "lease_expires_at": None})
+
+    with _lock:
+        summary = {field: _stats[field] - before[field] for field in ("created", "failed", "skipped")}
+    summary.update({"day": str(day), "planned": len(tasks), "completed": covered,
+                    "started_at": started.isoformat(), "finished_at": datetime.utcnow().isoformat()})
+    with _lock:
+        _last_run = summary
+    logger.info("Nightly precompute for %s finished: %s", day, summary)
+    return summary
+
+
+def trigger(day=None):
+    """
+    Starts a run now in the background (ops, backfills).
+    """
+    threading.Thread(target=run, args=(day,), name="nightly-precompute-run", daemon=True).start()
+
+
+def _loop():
+    while not _stop.is_set():
+        if in_window():
+            try:
+                run()
+            except Exception as e:
+                logger.warning("Nightly precompute run failed: %s", e)
+        _stop.wait(CHECK_INTERVAL)
+
+
+def start():
+    """
+    Starts this replica's scheduler thread (no-op when disabled or running).
+    """
+    global _scheduler
+    if not NIGHTLY_PRECOMPUTE_ENABLED:
+        return
+    with _lock:
+        if _scheduler is None or not _scheduler.is_alive():
+            _stop.clear()
+            _scheduler = threading.Thread(target=_loop, name="nightly-precompute", daemon=True)
+            _scheduler.start()
+
+
+def stop():
+    """
+    Stops the scheduler; a run in progress stops starting tasks and is
+    resumed by the next replica to check.
+    """
+    with _lock:
+        if _scheduler is not None:
+            _stop.set()
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["last_run"] = _last_run
+    snapshot["enabled"] = NIGHTLY_PRECOMPUTE_ENABLED
+    snapshot["window"] = f"{NIGHTLY_PRECOMPUTE_HOUR:02d}:00+{NIGHTLY_PRECOMPUTE_WINDOW_HOURS}h"
+    return snapshot
@@ -0,0 +1,292 @@
+"""
+Durable background onboarding jobs.
+
+POST /onboarding/jobs stores the request as a row in `onboarding_jobs` and
+returns 202 straight away; a pool of workers running on the app's event loop
+claims queued jobs and runs the same pipeline as POST /onboarding, recording
+per-subject progress on the row for GET /onboarding/jobs/{id}. The database
+is the queue, so no broker is needed and every app process can run workers:
+
+- a job is claimed with a conditional UPDATE, so two workers (in this or
+  another process) never run the same job;
+- a running job holds a lease its worker keeps extending; if the process
+  dies, the lease runs out and another worker retries the job, up to
+  ONBOARDING_JOB_MAX_ATTEMPTS times. The pipeline saves everything in one
+  transaction, so a retried job never finds a half-saved onboarding;
+- a client retrying the same request while its job is still queued or
+  running gets the existing job back.
+
+    ONBOARDING_JOB_WORKERS=2
+    ONBOARDING_JOB_POLL_INTERVAL=2   # seconds between queue polls when idle
+    ONBOARDING_JOB_LEASE=60          # seconds a silent worker keeps its job
+    ONBOARDING_JOB_MAX_ATTEMPTS=3
+"""
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import or_, and_
+from fastapi.concurrency import run_in_threadpool
+from database import SessionLocal
+from models import OnboardingJob
+
+logger = logging.getLogger(__name__)
+
+ONBOARDING_JOB_WORKERS = int(os.getenv("ONBOARDING_JOB_WORKERS", "2"))
+ONBOARDING_JOB_POLL_INTERVAL = float(os.getenv("ONBOARDING_JOB_POLL_INTERVAL", "2"))
+ONBOARDING_JOB_LEASE = int(os.getenv("ONBOARDING_JOB_LEASE", "60"))
+ONBOARDING_JOB_MAX_ATTEMPTS = int(os.getenv("ONBOARDING_JOB_MAX_ATTEMPTS", "3"))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+_lock = threading.Lock()
+_stats = {"enqueued": 0, "deduplicated": 0, "claimed": 0, "retried": 0, "succeeded": 0, "failed": 0, "requeued": 0}
+_workers = []
+_loop = None
+_wake = None
+# Process-unique prefix so leases from different app instances never collide
+_instance = uuid.uuid4().hex[:8]
+
+
+def _count(field, delta=1):
+    with _lock:
+        _stats[field] += delta
+
+
+def request_hash(user_id, request):
+    payload = json.dumps(request, sort_keys=True, default=str)
+    return hashlib.sha256(f"{user_id}\n{payload}".encode()).hexdigest()
+
+
+def enqueue(db, user_id, email, request):
+    """
+    Stores a job for `request` (an OnboardingRequest as a dict). Returns
+    (job, created); an identical request from the same user that is still
+    queued or running is returned instead of queueing it twice.
+    """
+    digest = request_hash(user_id, request)
+    existing = db.query(OnboardingJob).filter(
+        OnboardingJob.user_id == user_id,
+        OnboardingJob.request_hash == digest,
+        OnboardingJob.status.in_(ACTIVE_STATUSES),
+    ).order_by(OnboardingJob.created_at.desc()).first()
+    if existing:
+        _count("deduplicated")
+        return existing, False
+
+    job = OnboardingJob(
+        id=uuid.uuid4().hex,
+        user_id=user_id,
+        email=email,
+        request=json.dumps(request, default=str),
+        request_hash=digest,
+        status="queued",
+        progress=json.dumps({subject: {"status": "queued"} for subject in request.get("subjects", [])}),
+        attempts=0,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _count("enqueued")
+    notify()
+    return job, True
+
+
+def get(db, job_id, user_id):
+    """
+    The user's job, or None (other users' jobs are not visible).
+    """
+    return db.query(OnboardingJob).filter(OnboardingJob.id == job_id, OnboardingJob.user_id == user_id).first()
+
+
+def to_dict(job):
+    progress = json.loads(job.progress) if job.progress else {}
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "subjects": [{"subject": subject, **state} for subject, state in progress.items()],
+        "result": json.loads(job.result) if job.result else None,
+        "error": job.error,
+        "attempts": job.attempts,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def _update(job_id, worker, values):
+    # Only the worker holding the job may write to it
+    db = SessionLocal()
+    try:
+        updated = db.query(OnboardingJob).filter(
+            OnboardingJob.id == job_id, OnboardingJob.worker == worker
+        ).update(values, synchronize_session=False)
+        db.commit()
+        return updated
+    finally:
+        db.close()
+
+
+def _progress_writer(job_id, worker):
+    def update_progress(subject, **state):
+        db = SessionLocal()
+        try:
+            job = db.query(OnboardingJob).filter(OnboardingJob.id == job_id, OnboardingJob.worker == worker).first()
+            if job is None:
+                return
+            progress = json.loads(job.progress) if job.progress else {}
+            progress[subject] = {**progress.get(subject, {}), **state}
+            job.progress = json.dumps(progress)
+            job.lease_expires_at = datetime.utcnow() + timedelta(seconds=ONBOARDING_JOB_LEASE)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning("Could not record progress for onboarding job %s: %s", job_id, e)
+        finally:
+            db.close()
+    return update_progress
+
+
+def _claim(worker):
+    """
+    Takes the oldest queued job, or a running one whose lease has expired.
+    Returns (id, user_id, email, request dict) or None.
+    """
+    now = datetime.utcnow()
+    expired = and_(OnboardingJob.status == "running", OnboardingJob.lease_expires_at < now)
+    db = SessionLocal()
+    try:
+        candidates = db.query(OnboardingJob.id, OnboardingJob.status, OnboardingJob.attempts).filter(
+            or_(OnboardingJob.status == "queued", expired)
+        ).order_by(OnboardingJob.created_at).limit(10).all()
+        for job_id, status, attempts in candidates:
+            # Still in the state we saw: a concurrent claim makes this match nothing
+            unchanged = OnboardingJob.status == "queued" if status == "queued" else expired
+            claimable = db.query(OnboardingJob).filter(OnboardingJob.id == job_id, unchanged)
+            if status == "running" and (attempts or 0) >= ONBOARDING_JOB_MAX_ATTEMPTS:
+                if claimable.update({
+                    "status": "failed", "error": "Onboarding did not finish after several attempts",
+                    "worker": None, "finished_at": now,
+                }, synchronize_session=False):
+                    _count("failed")
+                db.commit()
+                continue
+            claimed = claimable.update({
+                "status": "running",
+                "worker": worker,
+                "lease_expires_at": now + timedelta(seconds=ONBOARDING_JOB_LEASE),
+                "attempts": OnboardingJob.attempts + 1,
+                "started_at": now,
+            }, synchronize_session=False)
+            db.commit()
+            if claimed:
+                _count("claimed")
+                if status == "running":
+                    _count("retried")
+                job = db.query(OnboardingJob).filter(OnboardingJob.id == job_id).first()
+                return job.id, job.user_id, job.email, json.loads(job.request)
+        return None
+    finally:
+        db.close()
+
+
+async def _heartbeat(job_id, worker):
+    while True:
+        await asyncio.sleep(max(1, ONBOARDING_JOB_LEASE / 3))
+        try:
+            await run_in_threadpool(_update, job_id, worker, {
+                "lease_expires_at": datetime.utcnow() + timedelta(seconds=ONBOARDING_JOB_LEASE)
+            })
+        except Exception as e:
+            logger.warning("Could not extend the lease on onboarding job %s: %s", job_id, e)
+
+
+async def _run(runner, worker, job):
+    job_id, user_id, email, request = job
+    heartbeat = asyncio.create_task(_heartbeat(job_id, worker))
+    try:
+        result = await runner(job_id, user_id, email, request, _progress_writer(job_id, worker))
+    except asyncio.CancelledError:
+        # Shutting down: put it back for the next worker rather than waiting out the lease
+        await run_in_threadpool(_update, job_id, worker, {"status": "queued", "worker": None, "lease_expires_at": None})
+        _count("requeued")
+        raise
+    except Exception as e:
+        logger.exception("Onboarding job %s failed", job_id)
+        await run_in_threadpool(_update, job_id, worker, {
+            "status": "failed", "error": str(e) or type(e).__name__, "worker": None, "finished_at": datetime.utcnow(),
+        })
+        _count("failed")
+    else:
+        await run_in_threadpool(_update, job_id, worker, {
+            "status": "succeeded", "result": json.dumps(result, default=str), "worker": None,
+            "lease_expires_at": None, "finished_at": datetime.utcnow(),
+        })
+        _count("succeeded")
+    finally:
+        heartbeat.cancel()
+
+
+async def _work(runner, worker):
+    while True:
+        try:
+            job = await run_in_threadpool(_claim, worker)
+        except Exception as e:
+            logger.warning("Onboarding worker %s could not poll the queue: %s", worker, e)
+            job = None
+        if job is not None:
+            await _run(runner, worker, job)
+            continue
+        try:
+            await asyncio.wait_for(_wake.wait(), ONBOARDING_JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wake.clear()
+
+
+def start(runner):
+    """
+    Starts the worker pool on the running event loop (no-op if it is already
+    running there). `runner(job_id, user_id, email, request, progress)` runs
+    one job and returns its result; `progress(subject, **state)` records a
+    subject's state on the job.
+    """
+    global _loop, _wake
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if _loop is loop and any(not w.done() for w in _workers):
+            return
+        _loop, _wake = loop, asyncio.Event()
+        _workers[:] = [
+            loop.create_task(_work(runner, f"{_instance}-{i}")) for i in range(ONBOARDING_JOB_WORKERS)
+        ]
+
+
+def notify():
+    """
+    Wakes an idle worker (a new job was queued).
+    """
+    if _loop is not None and _wake is not None and not _loop.is_closed():
+        _loop.call_soon_threadsafe(_wake.set)
+
+
+async def stop():
+    with _lock:
+        workers = list(_workers)
+        _workers.clear()
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["workers"] = sum(1 for w in _workers if not w.done())
+    snapshot["lease_seconds"] = ONBOARDING_JOB_LEASE
+    snapshot["max_attempts"] = ONBOARDING_JOB_MAX_ATTEMPTS
+    return snapshot
@@ -0,0 +1,120 @@
+import os
+import json
+import asyncio
+import threading
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+OPENROUTER_URL = os.getenv("OPENROUTER_URL", "https://openrouter.ai/api/v1/chat/completions")
+
+# Pool configuration - one long-lived client per process keeps DNS/TCP/TLS
+# work off the per-prompt path.
+OPENROUTER_TIMEOUT = float(os.getenv("OPENROUTER_TIMEOUT", "120"))
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+OPENROUTER_MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+OPENROUTER_MAX_KEEPALIVE = int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "10"))
+OPENROUTER_KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "60"))
+
+try:
+    import h2  # noqa: F401 - only needed so httpx can negotiate HTTP/2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+OPENROUTER_HTTP2 = os.getenv("OPENROUTER_HTTP2", "true").lower() in ("1", "true", "yes") and HTTP2_AVAILABLE
+
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+_async_client_loop = None
+
+
+def _client_options():
+    return {
+        "http2": OPENROUTER_HTTP2,
+        "timeout": httpx.Timeout(OPENROUTER_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=OPENROUTER_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENROUTER_MAX_KEEPALIVE,
+            keepalive_expiry=OPENROUTER_KEEPALIVE_EXPIRY,
+        ),
+    }
+
+
+def get_client() -> httpx.Client:
+    """
+    Returns the shared, thread-safe sync client used by blocking callers.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        with _client_lock:
+            if _client is None or _client.is_closed:
+                _client = httpx.Client(**_client_options())
+    return _client
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Returns the shared async client for the running event loop.
+    An AsyncClient's connections belong to the loop that opened them, so a new
+    client is created if we are called from a different loop (e.g. in scripts).
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(**_client_options())
+        _async_client_loop = loop
+    return _async_client
+
+
+def close_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
+async def aclose_client():
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        _async_client_loop = None
+
+
+def post(url, headers, payload, timeout=None) -> httpx.Response:
+    kwargs = {"headers": headers, "json": payload}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return get_client().post(url, **kwargs)
+
+
+async def apost(url, headers, payload, timeout=None) -> httpx.Response:
+    kwargs = {"headers": headers, "json": payload}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    return await get_async_client().post(url, **kwargs)
+
+
+async def astream(url, headers, payload, timeout=None):
+    """
+    POSTs a `stream: true` chat completion and yields each decoded SSE chunk.
+    """
+    kwargs = {"headers": headers, "json": {**payload, "stream": True}}
+    if timeout is not None:
+        kwargs["timeout"] = timeout
+    async with get_async_client().stream("POST", url, **kwargs) as response:
+        if response.is_error:
+            await response.aread()  # so error handlers can log the body
+            response.raise_for_status()
+        async for line in response.aiter_lines():
+            # SSE: "data: {...}" lines, ": comment" keep-alives, blank separators
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            yield json.loads(data)
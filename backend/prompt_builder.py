@@ -0,0 +1,147 @@
+"""
+Prompt construction for ai_service: token estimates, input budgets and
+per-prompt size reporting.
+
+Templates are plain `str.format` strings (literal braces doubled, as in an
+f-string). `render` strips the template's source indentation and blank-line
+runs before filling it in, so user-supplied values (e.g. code in a
+submission) keep their own whitespace. Oversized user inputs are clipped to a
+per-field budget, keeping the beginning and the end, which is where the
+substance of a submission or question usually is.
+"""
+import os
+import re
+import json
+import math
+import textwrap
+import threading
+
+# Rough budgets (estimated tokens) for user-controlled / unbounded inputs.
+# Override with PROMPT_BUDGET_<FIELD>, e.g. PROMPT_BUDGET_SUBMISSION=3000.
+DEFAULT_BUDGETS = {
+    "submission": 1500,
+    "task_description": 300,
+    "question": 400,
+    "goal_context": 100,
+    "task_context": 250,
+    # /chat conversation memory (chat_memory.py): running summary and recent turns
+    "chat_summary": 200,
+    "history": 500,
+    "topics": 150,
+    "profile": 60,
+    # Module names of a roadmap outline, repeated in each module's prompt
+    "outline": 400,
+}
+
+CHARS_PER_TOKEN = 4
+CLIP_MARKER = "\n[... {omitted} characters omitted ...]\n"
+
+# Only what the model needs to reason about a resource; ids, validation
+# timestamps and rationales stay server-side.
+RESOURCE_PROMPT_FIELDS = ("title", "platform", "url")
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def estimate_tokens(text):
+    """
+    Cheap token estimate (~4 characters per token for English/code). Good
+    enough for budgeting; the provider's exact counts are in llm_usage.
+    """
+    if not text:
+        return 0
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def budget(field):
+    value = os.getenv(f"PROMPT_BUDGET_{field.upper()}")
+    if value:
+        return int(value)
+    return DEFAULT_BUDGETS[field]
+
+
+def clip(text, field):
+    """
+    Returns (text, clipped) with `text` cut down to the field's token budget.
+    Keeps the first two thirds and the last third of the allowance.
+    """
+    text = (text or "").strip()
+    limit = budget(field) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text, False
+    head = (limit * 2) // 3
+    tail = limit - head
+    omitted = len(text) - head - tail
+    return text[:head].rstrip() + CLIP_MARKER.format(omitted=omitted) + text[-tail:].lstrip(), True
+
+
+def compact_template(template):
+    template = textwrap.dedent(template).strip()
+    template = re.sub(r"[ \t]+\n", "\n", template)
+    return re.sub(r"\n{3,}", "\n\n", template)
+
+
+def prompt_resources(resources):
+    """
+    Resources as the model should see them: one line of compact JSON with
+    only the fields it needs, duplicates (same URL) removed.
+    """
+    seen = set()
+    compact = []
+    for resource in resources or []:
+        if not isinstance(resource, dict):
+            continue
+        url = resource.get("url")
+        if url in seen:
+            continue
+        seen.add(url)
+        compact.append({k: resource[k] for k in RESOURCE_PROMPT_FIELDS if resource.get(k)})
+    return json.dumps(compact, separators=(",", ":"), ensure_ascii=False)
+
+
+def render(prompt_type, template, system, clipped_fields=None, **values):
+    """
+    Builds the chat messages for a prompt and records its size.
+    Values named in `clipped_fields` ({value_name: budget_field}) are clipped
+    to their budget first.
+    """
+    truncated = []
+    saved = 0
+    for name, field in (clipped_fields or {}).items():
+        original = values.get(name) or ""
+        values[name], was_clipped = clip(original, field)
+        if was_clipped:
+            truncated.append(name)
+            saved += estimate_tokens(original) - estimate_tokens(values[name])
+
+    prompt = compact_template(template).format(**values)
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": prompt},
+    ]
+    _record(prompt_type, estimate_tokens(system) + estimate_tokens(prompt), truncated, saved)
+    return messages
+
+
+def _record(prompt_type, tokens, truncated, saved):
+    with _lock:
+        entry = _stats.setdefault(prompt_type or "unknown", {
+            "prompts": 0, "total_tokens": 0, "max_tokens": 0, "truncated": 0, "clipped_tokens": 0, "fields": {},
+        })
+        entry["prompts"] += 1
+        entry["total_tokens"] += tokens
+        entry["max_tokens"] = max(entry["max_tokens"], tokens)
+        entry["clipped_tokens"] += saved
+        if truncated:
+            entry["truncated"] += 1
+            for name in truncated:
+                entry["fields"][name] = entry["fields"].get(name, 0) + 1
+
+
+def stats():
+    with _lock:
+        snapshot = json.loads(json.dumps(_stats))
+    for entry in snapshot.values():
+        entry["avg_tokens"] = round(entry["total_tokens"] / entry["prompts"], 1) if entry["prompts"] else 0
+    return {"budgets": {field: budget(field) for field in DEFAULT_BUDGETS}, "by_prompt": snapshot}
@@ -0,0 +1,266 @@
+"""
+Fault handling for upstream LLM calls: retry with exponential backoff,
+hedged duplicate requests and a circuit breaker.
+
+- Retries: 429 / 5xx / transport errors are retried with exponential backoff
+  and jitter (Retry-After is honoured, capped).
+- Hedging: if a request is still running after the tier's recent p95
+  latency, a duplicate is sent and whichever answers first wins. Attempts
+  run on a bounded pool (AI_HEDGE_THREADS); while it is busy, calls run
+  unhedged on the caller's thread instead of queueing behind it.
+- Circuit breaker: after enough consecutive provider failures every call
+  fails fast (callers use their fallbacks) until a probe request succeeds.
+"""
+import os
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import httpx
+
+RETRY_ATTEMPTS = int(os.getenv("AI_RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("AI_RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("AI_RETRY_MAX_DELAY", "8"))
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+HEDGE_ENABLED = os.getenv("AI_HEDGE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Hedging doubles token spend for the hedged call, so keep it off the long tier by default
+HEDGE_TIERS = {t.strip() for t in os.getenv("AI_HEDGE_TIERS", "fast,standard").split(",") if t.strip()}
+HEDGE_MIN_SAMPLES = int(os.getenv("AI_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MIN_DELAY = float(os.getenv("AI_HEDGE_MIN_DELAY", "0.5"))
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("AI_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("AI_BREAKER_RECOVERY_TIMEOUT", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_lock = threading.Lock()
+_counters = {"retries": 0, "hedges_launched": 0, "hedges_won": 0, "hedges_skipped": 0}
+HEDGE_THREADS = int(os.getenv("AI_HEDGE_THREADS", "16"))
+_hedge_pool = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix="ai-hedge")
+# One per pool thread, held until the attempt finishes (losers included)
+_hedge_slots = threading.BoundedSemaphore(HEDGE_THREADS)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, failure_threshold=None, recovery_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or BREAKER_FAILURE_THRESHOLD
+        self.recovery_timeout = recovery_timeout or BREAKER_RECOVERY_TIMEOUT
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._probe_started = None
+        self.rejected = 0
+        self.times_opened = 0
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self.state = HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == HALF_OPEN:
+                # Let exactly one probe through; everyone else keeps failing fast.
+                # A probe that never reported back is given up on after recovery_timeout
+                now = time.monotonic()
+                if self._probe_in_flight and now - self._probe_started < self.recovery_timeout:
+                    self.rejected += 1
+                    return False
+                self._probe_in_flight = True
+                self._probe_started = now
+            return True
+
+    def release(self):
+        """
+        For a call let through that ended without an answer either way
+        (cancelled, timed out by its caller): frees the probe slot so the
+        next call can probe.
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def reset(self):
+        with self._lock:
+            self.state = CLOSED
+            self.consecutive_failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def status(self):
+        with self._lock:
+            retry_in = None
+            if self.state == OPEN:
+                retry_in = max(0.0, round(self.recovery_timeout - (time.monotonic() - self.opened_at), 1))
+            return {
+                "name": self.name,
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_timeout": self.recovery_timeout,
+                "retry_in_seconds": retry_in,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected,
+            }
+
+
+def is_provider_failure(error):
+    """
+    True for errors that say the provider is degraded (and are worth retrying).
+    Other 4xx responses mean the provider is up but didn't like our request.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code in RETRYABLE_STATUS
+    return isinstance(error, httpx.TransportError)
+
+
+def backoff_delay(attempt, error=None):
+    """
+    Delay before retry number `attempt` (1-based).
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        retry_after = error.response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                return min(float(retry_after), RETRY_MAX_DELAY)
+            except ValueError:
+                pass
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def count(field):
+    with _lock:
+        _counters[field] += 1
+
+
+def hedge_delay(tier, recent_p95, timeout):
+    """
+    Seconds to wait before sending a duplicate request, or None to not hedge.
+    """
+    if not HEDGE_ENABLED or tier not in HEDGE_TIERS or recent_p95 is None:
+        return None
+    delay = max(HEDGE_MIN_DELAY, recent_p95)
+    if timeout and delay >= timeout / 2:
+        return None
+    return delay
+
+
+def _submit_hedged(fn):
+    # None rather than queueing when every pool thread is taken
+    if not _hedge_slots.acquire(blocking=False):
+        return None
+    future = _hedge_pool.submit(fn)
+    future.add_done_callback(lambda _: _hedge_slots.release())
+    return future
+
+
+def hedged_call(fn, delay):
+    """
+    Runs fn(); if it hasn't finished after `delay` seconds, runs a second copy
+    and returns whichever succeeds first. Losing threads are left to finish.
+    When the pool is saturated the call isn't hedged: fn() runs on the
+    caller's thread, or the first attempt is simply waited for.
+    """
+    if delay is None:
+        return fn()
+
+    first = _submit_hedged(fn)
+    if first is None:
+        count("hedges_skipped")
+        return fn()
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    second = _submit_hedged(fn)
+    if second is None:
+        count("hedges_skipped")
+        return first.result()
+    count("hedges_launched")
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    count("hedges_won")
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def ahedged_call(fn, delay):
+    """
+    Async hedged_call: `fn` returns an awaitable; the loser is cancelled.
+    """
+    if delay is None:
+        return await fn()
+
+    first = asyncio.ensure_future(fn())
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+
+    count("hedges_launched")
+    second = asyncio.ensure_future(fn())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        count("hedges_won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def stats():
+    with _lock:
+        counters = dict(_counters)
+    return {
+        "retry": {"attempts": RETRY_ATTEMPTS, "base_delay": RETRY_BASE_DELAY, "max_delay": RETRY_MAX_DELAY, "retries": counters["retries"]},
+        "hedging": {
+            "enabled": HEDGE_ENABLED,
+            "tiers": sorted(HEDGE_TIERS),
+            "min_samples": HEDGE_MIN_SAMPLES,
+            "launched": counters["hedges_launched"],
+            "won": counters["hedges_won"],
+            "skipped": counters["hedges_skipped"],
+            "threads": HEDGE_THREADS,
+        },
+    }
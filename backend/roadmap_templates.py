@@ -0,0 +1,200 @@
+"""
+Library of canonical roadmaps built from past LLM generations.
+
+Every roadmap the model generates successfully is kept as the template for
+its normalized (subject, level, target_goal, learning_style). Onboarding a
+user with the same combination reuses the template, scaled to their target
+date and daily time, instead of running the long roadmap generation; when the
+model is unavailable, the closest template for the subject is used rather
+than the one-task fallback.
+
+    ROADMAP_TEMPLATES_ENABLED=true
+    ROADMAP_TEMPLATES_SERVE=true     # false: only use templates when generation fails
+    ROADMAP_TEMPLATE_MAX_AGE_DAYS=30 # older exact matches are regenerated (and refreshed)
+"""
+import os
+import re
+import copy
+import json
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from models import RoadmapTemplate
+import structured_output
+
+logger = logging.getLogger(__name__)
+
+ROADMAP_TEMPLATES_ENABLED = os.getenv("ROADMAP_TEMPLATES_ENABLED", "true").lower() in ("1", "true", "yes")
+ROADMAP_TEMPLATES_SERVE = os.getenv("ROADMAP_TEMPLATES_SERVE", "true").lower() in ("1", "true", "yes")
+ROADMAP_TEMPLATE_MAX_AGE_DAYS = int(os.getenv("ROADMAP_TEMPLATE_MAX_AGE_DAYS", "30"))
+
+MIN_TASK_MINUTES = 10
+
+_lock = threading.Lock()
+_stats = {"served": 0, "fallbacks": 0, "misses": 0, "stored": 0, "errors": 0}
+
+
+def _count(field):
+    with _lock:
+        _stats[field] += 1
+
+
+def normalize(value):
+    return " ".join(re.sub(r"[^a-z0-9+#]+", " ", (value or "").lower()).split())
+
+
+def template_key(subject, level, target_goal, learning_style):
+    return "|".join(normalize(v) for v in (subject, level, target_goal, learning_style))
+
+
+def remember(db, subject, level, target_goal, learning_style, roadmap_data, daily_time_minutes=None):
+    """
+    Stores a freshly generated roadmap as the template for its combination.
+    Only roadmaps that validate are kept. Adds to the caller's session; the
+    caller commits.
+    """
+    if not ROADMAP_TEMPLATES_ENABLED:
+        return
+    data, _ = structured_output.validate("roadmap", roadmap_data)
+    if data is None:
+        return
+    key = template_key(subject, level, target_goal, learning_style)
+    try:
+        template = db.query(RoadmapTemplate).filter(RoadmapTemplate.key == key).first()
+        if template is None:
+            template = RoadmapTemplate(
+                key=key, subject=normalize(subject), level=normalize(level),
+                target_goal=normalize(target_goal), learning_style=normalize(learning_style), generations=0, uses=0,
+            )
+            db.add(template)
+        template.roadmap = json.dumps(data)
+        template.task_count = sum(len(m["tasks"]) for p in data["phases"] for m in p["modules"])
+        template.daily_time_minutes = daily_time_minutes
+        template.generations = (template.generations or 0) + 1
+        template.updated_at = datetime.utcnow()
+        db.flush()
+        _count("stored")
+    except Exception as e:
+        _count("errors")
+        logger.warning("Could not store roadmap template %s: %s", key, e)
+
+
+def _closest(db, subject, level, target_goal, learning_style):
+    # Same subject: prefer the same level, then the same goal, then the same style
+    candidates = db.query(RoadmapTemplate).filter(RoadmapTemplate.subject == normalize(subject)).all()
+    if not candidates:
+        return None
+    wanted = (normalize(level), normalize(target_goal), normalize(learning_style))
+
+    def score(t):
+        return ((t.level == wanted[0]) * 4 + (t.target_goal == wanted[1]) * 2 + (t.learning_style == wanted[2]), t.updated_at)
+    return max(candidates, key=score)
+
+
+def find(db, subject, level, target_goal, learning_style, exact=True):
+    """
+    The template to build this user's roadmap from, or None. `exact=True`
+    (the fast path before generating) only accepts a fresh template for the
+    same combination; `exact=False` (generation failed) takes the closest
+    template for the subject, however old.
+    """
+    if not ROADMAP_TEMPLATES_ENABLED:
+        return None
+    try:
+        if exact:
+            if not ROADMAP_TEMPLATES_SERVE:
+                return None
+            template = db.query(RoadmapTemplate).filter(
+                RoadmapTemplate.key == template_key(subject, level, target_goal, learning_style)
+            ).first()
+            if template and template.updated_at < datetime.utcnow() - timedelta(days=ROADMAP_TEMPLATE_MAX_AGE_DAYS):
+                template = None
+        else:
+            template = _closest(db, subject, level, target_goal, learning_style)
+    except Exception as e:
+        _count("errors")
+        logger.warning("Roadmap template lookup failed: %s", e)
+        return None
+
+    if template is None:
+        if exact:
+            _count("misses")
+        return None
+    template.uses = (template.uses or 0) + 1
+    _count("served" if exact else "fallbacks")
+    return template
+
+
+def _spread(count, keep):
+    # `keep` evenly spaced indices out of range(count), always including the first
+    if keep >= count:
+        return list(range(count))
+    if keep <= 1:
+        return [0]
+    return sorted({round(i * (count - 1) / (keep - 1)) for i in range(keep)})
+
+
+def _module_quotas(sizes, budget):
+    # Largest-remainder split of `budget` tasks across modules, one each first
+    if budget < len(sizes):
+        chosen = set(_spread(len(sizes), budget))
+        return [1 if i in chosen else 0 for i in range(len(sizes))]
+    total = sum(sizes)
+    quotas = [1] * len(sizes)
+    extra = budget - len(sizes)
+    shares = [(size - 1) * extra / max(1, total - len(sizes)) for size in sizes]
+    for i, share in enumerate(shares):
+        quotas[i] += int(share)
+    leftover = budget - sum(quotas)
+    for i in sorted(range(len(sizes)), key=lambda i: shares[i] - int(shares[i]), reverse=True)[:leftover]:
+        quotas[i] += 1
+    return [min(q, size) for q, size in zip(quotas, sizes)]
+
+
+def scale(roadmap_data, target_date, daily_time_minutes, source_daily_minutes=None, today=None):
+    """
+    Fits a template roadmap to a user's schedule, one task per study day:
+    - task times are rescaled from the template's daily time to the user's
+      and capped at it, so every task fits in one session;
+    - if there are more tasks than days until the target date, tasks are
+      dropped evenly within each module (every module keeps at least one
+      while there are days for it), keeping the curriculum's order and span.
+    """
+    roadmap = copy.deepcopy(roadmap_data)
+    today = today or date.today()
+    modules = [module for phase in roadmap["phases"] for module in phase["modules"]]
+    sizes = [len(module["tasks"]) for module in modules]
+
+    days = (target_date - today).days if target_date else None
+    if days is not None and sum(sizes) > max(1, days):
+        for module, quota in zip(modules, _module_quotas(sizes, max(1, days))):
+            module["tasks"] = [module["tasks"][i] for i in _spread(len(module["tasks"]), quota)] if quota else []
+        for phase in roadmap["phases"]:
+            phase["modules"] = [m for m in phase["modules"] if m["tasks"]]
+        roadmap["phases"] = [p for p in roadmap["phases"] if p["modules"]]
+
+    factor = daily_time_minutes / source_daily_minutes if daily_time_minutes and source_daily_minutes else 1.0
+    for module in modules:
+        for task in module["tasks"]:
+            minutes = round((task.get("estimated_time") or 30) * factor)
+            if daily_time_minutes:
+                minutes = min(minutes, daily_time_minutes)
+            task["estimated_time"] = max(MIN_TASK_MINUTES, minutes)
+    return roadmap
+
+
+def instantiate(template, target_date, daily_time_minutes, today=None):
+    """
+    The user's roadmap built from a template.
+    """
+    return scale(json.loads(template.roadmap), target_date, daily_time_minutes, template.daily_time_minutes, today)
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+    snapshot["enabled"] = ROADMAP_TEMPLATES_ENABLED
+    snapshot["serve"] = ROADMAP_TEMPLATES_SERVE
+    lookups = snapshot["served"] + snapshot["misses"]
+    snapshot["hit_rate"] = round(snapshot["served"] / lookups, 3) if lookups else 0.0
+    return snapshot
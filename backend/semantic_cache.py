@@ -0,0 +1,258 @@
+"""
+In-process semantic cache for mentor chat answers.
+
+Students working on the same topic ask the same handful of questions in
+slightly different words. Answers are indexed per (subject, topic) scope under
+a hashed n-gram TF-IDF vector of the question; a new question whose cosine
+similarity to a cached one reaches the threshold gets that answer without an
+LLM call.
+
+Questions are reduced to their content words (filler such as "what is" or
+"can you explain" dropped, plurals folded), and the features are word
+unigrams and bigrams plus character trigrams of each word (so a typo still
+partly matches), hashed into a fixed number of buckets. IDF weights come from the questions cached in the same scope, so
+words every question in a topic shares count for little. The question word
+is not a feature but a condition: "why use closures" and "when should I use
+closures" share every content word yet want different answers, so only
+questions of the same kind (see question_kind) are compared.
+
+    SEMANTIC_CACHE_ENABLED=true
+    SEMANTIC_CACHE_THRESHOLD=0.85
+    SEMANTIC_CACHE_TTL=604800          # seconds an answer stays servable
+    SEMANTIC_CACHE_MAX_PER_TOPIC=200   # least recently used entries go first
+    SEMANTIC_CACHE_MAX_ENTRIES=5000
+"""
+import os
+import re
+import math
+import time
+import zlib
+import threading
+from collections import Counter, OrderedDict
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+SEMANTIC_CACHE_MAX_PER_TOPIC = int(os.getenv("SEMANTIC_CACHE_MAX_PER_TOPIC", "200"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "5000"))
+
+FEATURE_BUCKETS = 1 << 18
+_WORD = re.compile(r"[a-z0-9+#']+")
+# Question filler that says nothing about what is being asked
+_STOPWORDS = frozenset("""
+    a an the is are was were be been am do does did to of in on at for and or
+    it this that these those i my me you your we us can could would should will
+    please explain tell show what how why when which who whats about with
+    """.split())
+# First word that says what kind of answer is wanted; "what" (and no question
+# word at all, as in "explain closures") asks for an explanation
+_QUESTION_KINDS = {
+    "what": None, "how": "how", "why": "why", "when": "when", "where": "where", "which": "which",
+    "who": "who", "whom": "who", "whose": "who", "should": "should",
+}
+_CONTRACTIONS = {
+    "what's": "what is", "how's": "how is", "it's": "it is", "i'm": "i am",
+    "don't": "do not", "doesn't": "does not", "can't": "can not", "isn't": "is not",
+}
+
+_lock = threading.Lock()
+# scope -> OrderedDict(question -> _Entry), least recently used first
+_topics = OrderedDict()
+_size = 0
+_stats = {"lookups": 0, "hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+
+class _Entry:
+    __slots__ = ("features", "kind", "answer", "created", "hits")
+
+    def __init__(self, features, kind, answer):
+        self.features = features
+        self.kind = kind
+        self.answer = answer
+        self.created = time.time()
+        self.hits = 0
+
+
+def _hash(feature):
+    return zlib.crc32(feature.encode()) % FEATURE_BUCKETS
+
+
+def _stem(word):
+    # Just enough to match plurals and -ing forms ("closures", "looping")
+    if len(word) > 6 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _words(text):
+    words = []
+    for word in _WORD.findall((text or "").lower()):
+        words += _CONTRACTIONS.get(word, word.replace("'", "")).split()
+    return words
+
+
+def question_kind(text):
+    """
+    What a question asks for: "how", "why", "when", "where", "which", "who",
+    "should" (advice), or None for what-is / explain questions.
+    """
+    for word in _words(text):
+        if word in _QUESTION_KINDS:
+            return _QUESTION_KINDS[word]
+    return None
+
+
+def features(text, ignore=()):
+    """
+    Hashed n-gram term counts for a question. Words in `ignore` (the scope's
+    subject, implied by every question in it) are dropped.
+    """
+    words = _words(text)
+    content = [_stem(w) for w in words if w not in _STOPWORDS and w not in ignore]
+    # A question made only of filler still needs something to compare
+    words = content or [_stem(w) for w in words]
+    grams = list(words)
+    grams += [f"{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"<{word}>"
+        grams += [f"#{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return Counter(_hash(g) for g in grams)
+
+
+def _scope_words(scope):
+    # Only the subject: a topic word ("closures") may be what's being asked about
+    return frozenset(_words(scope[0]))
+
+
+def scope_key(subject, topic):
+    """
+    Normalised (subject, topic) scope, or None when there's nothing to scope
+    by (questions without a goal or task are never shared).
+    """
+    subject = " ".join((subject or "").lower().split())
+    topic = " ".join((topic or "").lower().split())
+    if not subject or not topic:
+        return None
+    return subject, topic
+
+
+def _idf(entries, query):
+    # Smoothed IDF over the scope's cached questions plus the query
+    docs = [e.features for e in entries] + [query]
+    df = Counter()
+    for doc in docs:
+        df.update(doc.keys())
+    n = len(docs)
+    return {f: math.log((1 + n) / (1 + count)) + 1 for f, count in df.items()}
+
+
+def _weights(counts, idf):
+    vector = {f: (1 + math.log(c)) * idf[f] for f, c in counts.items()}
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    return {f: w / norm for f, w in vector.items()} if norm else {}
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b[f] for f, w in a.items() if f in b)
+
+
+def _expire(entries, now):
+    global _size
+    stale = [q for q, e in entries.items() if now - e.created > SEMANTIC_CACHE_TTL]
+    for question in stale:
+        del entries[question]
+    _size -= len(stale)
+    _stats["expired"] += len(stale)
+
+
+def lookup(scope, question):
+    """
+    Returns the cached answer for the most similar question in the scope, or
+    None if nothing reaches the threshold.
+    """
+    if not SEMANTIC_CACHE_ENABLED or scope is None:
+        return None
+    query = features(question, _scope_words(scope))
+    kind = question_kind(question)
+    with _lock:
+        _stats["lookups"] += 1
+        entries = _topics.get(scope)
+        if entries:
+            _expire(entries, time.time())
+        if not entries or not query:
+            _stats["misses"] += 1
+            return None
+
+        idf = _idf(entries.values(), query)
+        query_vector = _weights(query, idf)
+        best, best_score = None, 0.0
+        for cached_question, entry in entries.items():
+            if entry.kind != kind:
+                continue
+            score = cosine(query_vector, _weights(entry.features, idf))
+            if score > best_score:
+                best, best_score = cached_question, score
+
+        if best is None or best_score < SEMANTIC_CACHE_THRESHOLD:
+            _stats["misses"] += 1
+            return None
+        entry = entries[best]
+        entry.hits += 1
+        entries.move_to_end(best)
+        _topics.move_to_end(scope)
+        _stats["hits"] += 1
+        return entry.answer
+
+
+def store(scope, question, answer):
+    global _size
+    if not SEMANTIC_CACHE_ENABLED or scope is None or not answer:
+        return
+    counts = features(question, _scope_words(scope))
+    if not counts:
+        return
+    key = " ".join(question.lower().split())
+    with _lock:
+        entries = _topics.setdefault(scope, OrderedDict())
+        _topics.move_to_end(scope)
+        if key not in entries:
+            _size += 1
+        entries[key] = _Entry(counts, question_kind(question), answer)
+        entries.move_to_end(key)
+        _stats["stores"] += 1
+
+        while len(entries) > SEMANTIC_CACHE_MAX_PER_TOPIC:
+            entries.popitem(last=False)
+            _size -= 1
+            _stats["evictions"] += 1
+        # Over the global cap: take from the least recently used topics
+        while _size > SEMANTIC_CACHE_MAX_ENTRIES:
+            oldest_scope, oldest = next(iter(_topics.items()))
+            if oldest:
+                oldest.popitem(last=False)
+                _size -= 1
+                _stats["evictions"] += 1
+            if not oldest:
+                del _topics[oldest_scope]
+
+
+def clear():
+    global _size
+    with _lock:
+        _topics.clear()
+        _size = 0
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["entries"] = _size
+        snapshot["topics"] = len(_topics)
+    snapshot["enabled"] = SEMANTIC_CACHE_ENABLED
+    snapshot["threshold"] = SEMANTIC_CACHE_THRESHOLD
+    snapshot["hit_rate"] = round(snapshot["hits"] / snapshot["lookups"], 3) if snapshot["lookups"] else 0.0
+    return snapshot
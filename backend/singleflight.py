@@ -0,0 +1,125 @@
+"""
+Per-process single-flight coalescing.
+
+Concurrent callers asking for the same key share one upstream call: the first
+caller (the leader) runs it and everyone else waits for its result. Errors
+raised by the leader are re-raised in every waiter.
+"""
+import asyncio
+import threading
+
+_groups = {}
+_groups_lock = threading.Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Group:
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._async_calls = {}
+        self._stats = {"calls": 0, "executions": 0, "deduplicated": 0, "shared_errors": 0}
+        with _groups_lock:
+            _groups[name] = self
+
+    def _count(self, field):
+        with self._lock:
+            self._stats[field] += 1
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Blocking variant for threadpool callers.
+        """
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executions"] += 1
+
+        if not leader:
+            call.event.wait()
+            self._count("deduplicated")
+            if call.error is not None:
+                self._count("shared_errors")
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key, fn, *args, **kwargs):
+        """
+        Async variant. `fn` must return an awaitable. Calls are only shared
+        between callers on the same event loop.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._stats["calls"] += 1
+            future = self._async_calls.get(key)
+            leader = future is None or future.get_loop() is not loop
+            if leader:
+                future = loop.create_future()
+                self._async_calls[key] = future
+                self._stats["executions"] += 1
+
+        if not leader:
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The leader was cancelled (e.g. client went away) - do the work ourselves
+                return await fn(*args, **kwargs)
+            except BaseException:
+                self._count("deduplicated")
+                self._count("shared_errors")
+                raise
+            self._count("deduplicated")
+            return result
+
+        try:
+            result = await fn(*args, **kwargs)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved so lone leaders don't log warnings
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                if self._async_calls.get(key) is future:
+                    del self._async_calls[key]
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["in_flight"] = len(self._calls) + len(self._async_calls)
+        return snapshot
+
+
+def stats():
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.stats() for group in groups}
@@ -0,0 +1,212 @@
+"""
+Typed, schema-enforced outputs for the JSON prompts in ai_service.
+
+Each JSON prompt type has a pydantic model. Its JSON schema is sent as
+`response_format` so providers that support structured outputs constrain
+generation to it, and every completion is validated against the model. A
+completion that doesn't validate gets one repair round-trip (the error is
+shown to the model) before the caller's fallback kicks in.
+
+    AI_RESPONSE_FORMAT=json_schema   # default; "json_object" or "off" for providers that reject it
+"""
+import os
+import re
+import json
+import threading
+from typing import List, Literal, Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, field_validator
+
+RESPONSE_FORMAT = os.getenv("AI_RESPONSE_FORMAT", "json_schema").lower()
+
+
+class _Output(BaseModel):
+    # Models often add harmless extra keys (e.g. "rationale"); keep them
+    model_config = ConfigDict(extra="allow")
+
+
+class LevelResult(_Output):
+    level: Literal["Beginner", "Intermediate", "Advanced"]
+    message: str
+
+    @field_validator("level", mode="before")
+    @classmethod
+    def _title_case(cls, value):
+        return value.strip().title() if isinstance(value, str) else value
+
+
+class Resource(_Output):
+    title: str
+    url: str
+    platform: str = ""
+    resource_type: str = ""
+    rationale: str = ""
+
+
+class ResourceList(_Output):
+    resources: List[Resource]
+
+
+class DailyTask(_Output):
+    topic: str
+    description: str
+
+
+class Evaluation(_Output):
+    score: int = Field(ge=0, le=100)
+    feedback: str
+
+
+class GradedSubmission(Evaluation):
+    id: int
+
+
+class EvaluationBatch(_Output):
+    results: List[GradedSubmission]
+
+
+class RoadmapTask(_Output):
+    title: str
+    description: str = ""
+    estimated_time: int = 30
+    output_deliverable: str = ""
+    resource_type: str = ""
+
+    @field_validator("estimated_time", mode="before")
+    @classmethod
+    def _minutes(cls, value):
+        # "45 minutes" / "45 min" -> 45; not worth a repair round-trip
+        if isinstance(value, str):
+            match = re.match(r"\s*(\d+)", value)
+            return int(match.group(1)) if match else 30
+        return value
+
+
+class RoadmapModule(_Output):
+    name: str
+    tasks: List[RoadmapTask]
+
+
+class RoadmapPhase(_Output):
+    name: str
+    modules: List[RoadmapModule]
+
+
+class Roadmap(_Output):
+    title: str
+    phases: List[RoadmapPhase] = Field(min_length=1)
+
+
+class RoadmapSkeletonModule(_Output):
+    name: str
+    focus: str = ""
+    task_count: int = 3
+
+    @field_validator("task_count", mode="before")
+    @classmethod
+    def _count(cls, value):
+        # "5 tasks" -> 5
+        if isinstance(value, str):
+            match = re.match(r"\s*(\d+)", value)
+            return int(match.group(1)) if match else 3
+        return value
+
+
+class RoadmapSkeletonPhase(_Output):
+    name: str
+    modules: List[RoadmapSkeletonModule] = Field(min_length=1)
+
+
+class RoadmapSkeleton(_Output):
+    title: str
+    phases: List[RoadmapSkeletonPhase] = Field(min_length=1)
+
+
+class RoadmapModuleTasks(_Output):
+    tasks: List[RoadmapTask] = Field(min_length=1)
+
+
+class ChatAction(_Output):
+    type: str
+    new_link: Optional[str] = None
+    reason: Optional[str] = None
+
+
+class ChatAnswer(_Output):
+    answer: str
+    action: Optional[ChatAction] = None
+
+
+SCHEMAS = {
+    "detect_level": LevelResult,
+    "curated_resources": ResourceList,
+    "daily_task": DailyTask,
+    "evaluation": Evaluation,
+    "evaluation_batch": EvaluationBatch,
+    "roadmap": Roadmap,
+    "roadmap_skeleton": RoadmapSkeleton,
+    "roadmap_module": RoadmapModuleTasks,
+    "chat": ChatAnswer,
+}
+
+_lock = threading.Lock()
+_stats = {}
+
+
+def response_format(prompt_type):
+    """
+    The `response_format` request field for a prompt type, or None.
+    """
+    schema = SCHEMAS.get(prompt_type)
+    if schema is None or RESPONSE_FORMAT == "off":
+        return None
+    if RESPONSE_FORMAT == "json_object":
+        return {"type": "json_object"}
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": prompt_type, "schema": schema.model_json_schema()},
+    }
+
+
+def validate(prompt_type, raw):
+    """
+    Validates already-parsed JSON (`raw`, None if the reply wasn't JSON).
+    Returns (data, error): the output as a plain dict, or None and a short
+    description of what was wrong with it.
+    """
+    if raw is None:
+        return None, "response is not valid JSON"
+    try:
+        return SCHEMAS[prompt_type].model_validate(raw).model_dump(), None
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(str(p) for p in err['loc']) or 'root'}: {err['msg']}" for err in e.errors()[:5])
+        return None, f"JSON does not match the schema ({problems})"
+
+
+def repair_messages(messages, bad_response, error, prompt_type):
+    schema = json.dumps(SCHEMAS[prompt_type].model_json_schema(), separators=(",", ":"))
+    return messages + [
+        {"role": "assistant", "content": bad_response or ""},
+        {"role": "user", "content": (
+            f"Your previous reply could not be used: {error}. "
+            f"Reply again with ONLY a JSON object matching this schema, no prose or code fences:\n{schema}"
+        )},
+    ]
+
+
+def record(prompt_type, outcome):
+    """
+    outcome: "ok" (valid first time), "repaired" or "failed".
+    """
+    with _lock:
+        entry = _stats.setdefault(prompt_type, {"ok": 0, "repaired": 0, "failed": 0})
+        entry[outcome] += 1
+
+
+def stats():
+    with _lock:
+        snapshot = {k: dict(v) for k, v in _stats.items()}
+    for entry in snapshot.values():
+        total = entry["ok"] + entry["repaired"] + entry["failed"]
+        # A "parse failure" is any completion that didn't validate first time
+        entry["parse_failure_rate"] = round((entry["repaired"] + entry["failed"]) / total, 3) if total else 0.0
+    return {"response_format": RESPONSE_FORMAT, "by_prompt": snapshot}
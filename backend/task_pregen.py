@@ -0,0 +1,261 @@
+"""
+Look-ahead pre-generation of daily task content.
+
+Turning a roadmap task into the day's task takes a YouTube search and two
+LLM calls (unless another user's generation is in the content catalog). Instead of doing that on the first /daily-plan after the task
+unlocks, the next TASK_PREGEN_AHEAD tasks of a roadmap are enriched in the
+background whenever a task unlocks (onboarding, submission, completion).
+The content is stored on the roadmap task itself: the description and links
+as JSON in `RoadmapTask.resource_links`, the resources as TaskResource rows
+with `roadmap_task_id` set. /daily-plan then only has to read it, attaching
+those rows to the DailyTask it creates.
+
+    TASK_PREGEN_ENABLED=true
+    TASK_PREGEN_AHEAD=3          # tasks enriched ahead of the one just unlocked
+    TASK_PREGEN_CONCURRENCY=2    # generations in flight at once
+    TASK_PREGEN_WAIT=15          # seconds /daily-plan waits for one already in flight
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import ai_service
+import content_catalog
+import llm_usage
+from database import SessionLocal
+from models import RoadmapTask, TaskResource
+
+logger = logging.getLogger(__name__)
+
+TASK_PREGEN_ENABLED = os.getenv("TASK_PREGEN_ENABLED", "true").lower() in ("1", "true", "yes")
+TASK_PREGEN_AHEAD = int(os.getenv("TASK_PREGEN_AHEAD", "3"))
+TASK_PREGEN_CONCURRENCY = int(os.getenv("TASK_PREGEN_CONCURRENCY", "2"))
+TASK_PREGEN_WAIT = float(os.getenv("TASK_PREGEN_WAIT", "15"))
+
+_lock = threading.Lock()
+_stats = {"scheduled": 0, "generated": 0, "cataloged": 0, "failed": 0, "served": 0, "missed": 0, "waited": 0}
+# roadmap task id -> Event set when its generation finishes
+_inflight = {}
+_executor = None
+
+
+def _count(field, delta=1):
+    with _lock:
+        _stats[field] += delta
+
+
+def _ensure_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=TASK_PREGEN_CONCURRENCY, thread_name_prefix="task-pregen")
+        return _executor
+
+
+def new_task_resource(res, daily_task_id=None, roadmap_task_id=None):
+    """
+    TaskResource row for one resource dict from generate_daily_task_content.
+    """
+    confidence = res.get("video_confidence", "fallback")
+    return TaskResource(
+        daily_task_id=daily_task_id,
+        roadmap_task_id=roadmap_task_id,
+        title=res.get("title"),
+        url=res.get("url", ""),
+        platform=res.get("platform"),
+        resource_type=res.get("resource_type"),
+        rationale=res.get("rationale"),
+        video_confidence=confidence,
+        validated=res.get("is_embeddable", False),
+        fallback_used=(confidence == "fallback"),
+        video_id=res.get("video_id"),
+        validated_at=datetime.fromisoformat(res["validated_at"]) if res.get("validated_at") else None,
+        is_embeddable=res.get("is_embeddable", False)
+    )
+
+
+def resource_links(description, resources):
+    """
+    The `RoadmapTask.resource_links` value for generated content; its
+    presence marks the task as enriched.
+    """
+    return json.dumps({
+        "description": description,
+        "links": [r.get("url", "") for r in resources],
+        "generated_at": datetime.utcnow().isoformat(),
+    })
+
+
+def content(roadmap_task):
+    """
+    The task's pre-generated {"description", "links", ...}, or None.
+    """
+    if not roadmap_task.resource_links:
+        return None
+    try:
+        data = json.loads(roadmap_task.resource_links)
+    except (TypeError, ValueError):
+        return None
+    return data if isinstance(data, dict) and data.get("description") else None
+
+
+def load(db, roadmap_task):
+    """
+    Pre-generated content for a task that is about to become the day's task,
+    waiting up to TASK_PREGEN_WAIT if its generation is in flight. Blocking;
+    run it in the threadpool.
+    """
+    data = content(roadmap_task)
+    if data is None:
+        with _lock:
+            event = _inflight.get(roadmap_task.id)
+        if event is not None:
+            _count("waited")
+            if event.wait(TASK_PREGEN_WAIT):
+                db.refresh(roadmap_task)
+                data = content(roadmap_task)
+    _count("served" if data else "missed")
+    return data
+
+
+def attach(db, roadmap_task_id, daily_task_id):
+    """
+    Links a roadmap task's pre-generated resources to the DailyTask made from
+    it; if an earlier day's task already has them (the task carried over),
+    that day's set is copied. The caller commits.
+    """
+    attached = db.query(TaskResource).filter(
+        TaskResource.roadmap_task_id == roadmap_task_id,
+        TaskResource.daily_task_id.is_(None)
+    ).update({"daily_task_id": daily_task_id}, synchronize_session=False)
+    if attached:
+        return
+    rows = db.query(TaskResource).filter(TaskResource.roadmap_task_id == roadmap_task_id).order_by(TaskResource.id).all()
+    first_day = rows[0].daily_task_id if rows else None
+    for row in rows:
+        if row.daily_task_id == first_day:
+            db.add(TaskResource(**{
+                column.name: getattr(row, column.name) for column in TaskResource.__table__.columns
+                if column.name not in ("id", "daily_task_id", "created_at")
+            }, daily_task_id=daily_task_id))
+
+
+def prepare(task_id):
+    """
+    Makes sure a roadmap task has content, taking it from the shared catalog
+    or generating it now. Returns whether it has. Blocking; safe to race
+    with the background look-ahead (only one result is kept).
+    """
+    db = SessionLocal()
+    try:
+        task = db.query(RoadmapTask).filter(RoadmapTask.id == task_id).first()
+        goal = task.roadmap.goal if task and task.roadmap else None
+        if task is None or goal is None:
+            return False
+        if task.resource_links:
+            return True
+        args = (goal.subject, goal.exam_or_skill, goal.detected_level or "Beginner", task.title, goal.daily_time_minutes)
+        catalog_args = (goal.subject, task.title, goal.detected_level or "Beginner", goal.daily_time_minutes)
+        fallback_description = task.description
+        cataloged = content_catalog.find(db, *catalog_args)
+        db.commit()
+    finally:
+        # Nothing held open across the model calls
+        db.close()
+
+    if cataloged:
+        resources, description = cataloged["resources"], cataloged["description"]
+    else:
+        ai_data_str = ai_service.generate_daily_task_content(*args)
+        if not ai_data_str:
+            _count("failed")
+            return False
+        ai_data = json.loads(ai_data_str)
+        resources = ai_data.get("resources", [])
+        description = ai_data.get("description") or fallback_description
+
+    db = SessionLocal()
+    try:
+        # Prepared elsewhere meanwhile (look-ahead, /daily-plan): keep that content
+        updated = db.query(RoadmapTask).filter(
+            RoadmapTask.id == task_id, RoadmapTask.resource_links.is_(None)
+        ).update({"resource_links": resource_links(description, resources)}, synchronize_session=False)
+        if updated:
+            for res in resources:
+                db.add(new_task_resource(res, roadmap_task_id=task_id))
+        if not cataloged:
+            content_catalog.remember(db, *catalog_args, description, resources)
+        db.commit()
+    finally:
+        db.close()
+    _count("cataloged" if cataloged else "generated")
+    return True
+
+
+def _generate(task_id, endpoint, user_id, event):
+    # Attributed to the request that unlocked the task
+    llm_usage.begin(endpoint)
+    llm_usage.set_user(user_id)
+    try:
+        prepare(task_id)
+    except Exception as e:
+        _count("failed")
+        logger.warning("Pre-generating content for roadmap task %s failed: %s", task_id, e)
+    finally:
+        with _lock:
+            _inflight.pop(task_id, None)
+        event.set()
+
+
+def _schedule(roadmap_id, from_order, endpoint, user_id):
+    db = SessionLocal()
+    try:
+        task_ids = [row.id for row in db.query(RoadmapTask.id).filter(
+            RoadmapTask.roadmap_id == roadmap_id,
+            RoadmapTask.order_index >= from_order,
+            RoadmapTask.status.in_(("pending", "active")),
+        ).order_by(RoadmapTask.order_index).limit(TASK_PREGEN_AHEAD).all()]
+        pending = {row.id for row in db.query(RoadmapTask.id).filter(
+            RoadmapTask.id.in_(task_ids), RoadmapTask.resource_links.is_(None)
+        ).all()} if task_ids else set()
+    except Exception as e:
+        logger.warning("Could not plan pre-generation for roadmap %s: %s", roadmap_id, e)
+        return
+    finally:
+        db.close()
+
+    for task_id in task_ids:
+        if task_id not in pending:
+            continue
+        with _lock:
+            if task_id in _inflight:
+                continue
+            event = _inflight[task_id] = threading.Event()
+            _stats["scheduled"] += 1
+        _executor.submit(_generate, task_id, endpoint, user_id, event)
+
+
+def schedule(roadmap_id, from_order):
+    """
+    Enriches the next TASK_PREGEN_AHEAD pending or active tasks of a roadmap,
+    starting at `from_order`, in the background. Returns immediately; call it
+    after the unlock is committed.
+    """
+    if not TASK_PREGEN_ENABLED or TASK_PREGEN_AHEAD < 1:
+        return
+    endpoint, user_id = llm_usage.current()
+    _ensure_executor().submit(_schedule, roadmap_id, from_order, endpoint, user_id)
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+        snapshot["in_flight"] = len(_inflight)
+    snapshot["enabled"] = TASK_PREGEN_ENABLED
+    snapshot["ahead"] = TASK_PREGEN_AHEAD
+    lookups = snapshot["served"] + snapshot["missed"]
+    snapshot["hit_rate"] = round(snapshot["served"] / lookups, 3) if lookups else 0.0
+    return snapshot
@@ -0,0 +1,137 @@
+import asyncio
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import httpx
+import pytest
+
+import ai_limits
+import main
+
+
+class SlowChatHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub that takes a while to answer.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(0.5)
+        payload = json.dumps({"choices": [{"message": {"content": '{"answer": "Take it step by step.", "action": null}'}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_per_user_limit_and_queue():
+    async def scenario():
+        limiter = ai_limits.Limiter(max_concurrency=2, per_user=2, max_queue=1, queue_timeout=0.2)
+        a1 = await limiter.acquire("a")
+        a2 = await limiter.acquire("a")
+        try:
+            await limiter.acquire("a")
+            assert False, "third request for the same user was admitted"
+        except ai_limits.Overloaded as e:
+            assert e.status == 429 and e.retry_after >= 1
+
+        # Pool is full: one request may queue, the next is shed straight away
+        waiting = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0.01)
+        try:
+            await limiter.acquire("c")
+            assert False, "request admitted past a full queue"
+        except ai_limits.Overloaded as e:
+            assert e.status == 503
+
+        # A released slot goes straight to the queued request
+        a1.release()
+        b = await waiting
+        assert limiter.stats()["active"] == 2 and limiter.stats()["waiting"] == 0
+
+        # Nobody releases in time: the queued request gives up with a 503
+        try:
+            await limiter.acquire("d")
+            assert False, "queued request never timed out"
+        except ai_limits.Overloaded as e:
+            assert e.status == 503
+        assert limiter.stats()["rejected_timeout"] == 1
+
+        a2.release()
+        b.release()
+        b.release()  # idempotent
+        stats = limiter.stats()
+        assert stats["active"] == 0 and stats["users_in_flight"] == 0
+
+        async with limiter.slot("e"):
+            assert limiter.stats()["active"] == 1
+        assert limiter.stats()["active"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_frees_its_place():
+    async def scenario():
+        limiter = ai_limits.Limiter(max_concurrency=1, per_user=0, max_queue=5, queue_timeout=5)
+        held = await limiter.acquire("a")
+        waiting = asyncio.create_task(limiter.acquire("b"))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        held.release()
+        stats = limiter.stats()
+        assert stats["active"] == 0 and stats["waiting"] == 0 and stats["users_in_flight"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_lease_collected_while_limiter_is_locked():
+    async def scenario():
+        limiter = ai_limits.Limiter(max_concurrency=1, per_user=0, max_queue=5, queue_timeout=5)
+        lease = await limiter.acquire("a")
+        # The collector can drop a lease in the middle of the limiter's own locked code
+        with limiter._locked():
+            del lease
+            assert limiter._active == 1
+        stats = limiter.stats()
+        assert stats["active"] == 0 and stats["users_in_flight"] == 0
+
+        # Collected with the lock free, the slot is freed straight away
+        lease = await limiter.acquire("b")
+        del lease
+        assert limiter._active == 0 and not limiter._users
+
+    asyncio.run(scenario())
+
+
+def test_chat_sheds_load_with_retry_after(openrouter_stub, auth_headers, monkeypatch):
+    openrouter_stub(SlowChatHandler)
+    monkeypatch.setattr(ai_limits, "limiter", ai_limits.Limiter(max_concurrency=8, per_user=1, max_queue=8, queue_timeout=5))
+
+    async def scenario():
+        headers = auth_headers("busy-user")
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            first, second = await asyncio.gather(
+                client.post("/chat", json={"message": "how do loops work?"}, headers=headers),
+                client.post("/chat", json={"message": "what is recursion?"}, headers=headers),
+            )
+            # The user's next request is admitted once the first has finished
+            third = await client.post("/chat", json={"message": "what is a set?"}, headers=headers)
+        return sorted([first, second], key=lambda r: r.status_code) + [third]
+
+    ok, shed, later = asyncio.run(scenario())
+    assert ok.status_code == 200 and ok.json()["response"] == "Take it step by step."
+    assert shed.status_code == 429 and int(shed.headers["Retry-After"]) >= 1
+    assert later.status_code == 200
+    assert ai_limits.stats()["rejected_user"] == 1 and ai_limits.stats()["active"] == 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
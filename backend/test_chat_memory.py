@@ -0,0 +1,110 @@
+import json
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import chat_memory
+import main
+from database import SessionLocal
+from models import ChatMessage, DailyTask, Goal, User
+
+chat_prompts = []
+summary_prompts = []
+
+
+class MentorHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the chat and conversation summary prompts.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        if "running summary" in prompt:
+            summary_prompts.append(prompt)
+            content = f"Summary {len(summary_prompts)}: the student is learning list comprehensions."
+        else:
+            chat_prompts.append(prompt)
+            content = json.dumps({"answer": f"Answer {len(chat_prompts)}. " + "Details. " * 150, "action": None})
+        payload = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def _tasks(user_id):
+    db = SessionLocal()
+    try:
+        db.add(User(id=user_id, email=f"{user_id}@example.com"))
+        goal = Goal(user_id=user_id, subject="Python", exam_or_skill="Job ready", daily_time_minutes=30,
+                    target_date=date.today() + timedelta(days=30), detected_level="Beginner")
+        db.add(goal)
+        db.flush()
+        tasks = [DailyTask(user_id=user_id, goal_id=goal.id, topic=topic, description="d", date=date.today())
+                 for topic in ("List Comprehensions", "Generators")]
+        db.add_all(tasks)
+        db.commit()
+        return [t.id for t in tasks]
+    finally:
+        db.close()
+
+
+def test_chat_remembers_recent_turns_and_summarizes_older_ones(openrouter_stub, auth_headers, monkeypatch):
+    openrouter_stub(MentorHandler)
+    monkeypatch.setattr(chat_memory, "CHAT_MEMORY_RECENT_MESSAGES", 2)
+    monkeypatch.setattr(chat_memory, "CHAT_MEMORY_COMPACT_BATCH", 2)
+    headers = auth_headers("memory-user")
+    client = TestClient(main.app)
+    task_id, other_task_id = _tasks("memory-user")
+
+    def ask(message, task=task_id):
+        response = client.post("/chat", json={"message": message, "task_id": task}, headers=headers)
+        assert response.status_code == 200
+        return chat_prompts[-1]
+
+    assert "Recent messages" not in ask("What is a list comprehension?")
+    follow_up = ask("Can you show the filtered one again?")
+    assert "Student: What is a list comprehension?" in follow_up and "Mentor: Answer 1." in follow_up
+
+    # Four messages: the oldest exchange is folded into the summary off the request path
+    _wait_for(lambda: chat_memory.stats()["compactions"] >= 1 and chat_memory.stats()["in_flight"] == 0)
+    third = ask("And nested ones?")
+    assert "Earlier in this conversation: Summary 1" in third
+    assert "What is a list comprehension?" not in third and "Student: Can you show the filtered one again?" in third
+    assert "Student: What is a list comprehension?" in summary_prompts[0]
+
+    # Another task is another conversation
+    assert "Recent messages" not in ask("What is yield?", task=other_task_id)
+
+    # However long it gets, the prompt stays within its budgets
+    for i in range(10):
+        ask(f"Question {i}: " + "why does this happen? " * 100)
+    _wait_for(lambda: chat_memory.stats()["in_flight"] == 0)
+    sizes = [len(p) for p in chat_prompts[-6:]]
+    assert max(sizes) < 7000, sizes
+    db = SessionLocal()
+    try:
+        kept = db.query(ChatMessage).count()
+        assert kept <= 2 * (chat_memory.CHAT_MEMORY_RECENT_MESSAGES + chat_memory.CHAT_MEMORY_COMPACT_BATCH)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
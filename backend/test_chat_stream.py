@@ -0,0 +1,133 @@
+import asyncio
+import json
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import ai_service
+import main
+from database import SessionLocal
+from models import DailyTask, Goal, User
+
+# Each streamed completion is handed out as its list of deltas, in order
+replies = []
+
+
+class StreamingHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub that streams the queued completions as SSE chunks.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        chunks = [f"data: {json.dumps({'choices': [{'delta': {'content': delta}}]})}\n\n" for delta in replies.pop(0)]
+        payload = "".join(chunks + ["data: [DONE]\n\n"]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(openrouter_stub):
+    openrouter_stub(StreamingHandler)
+    replies.clear()
+
+
+def _feed(chunks):
+    parser = ai_service.ChatStreamParser()
+    sent = [parser.feed(chunk) for chunk in chunks]
+    return sent, parser.finish()
+
+
+def _task(user_id):
+    db = SessionLocal()
+    try:
+        db.add(User(id=user_id, email=f"{user_id}@example.com"))
+        goal = Goal(user_id=user_id, subject="Python", exam_or_skill="Job ready", daily_time_minutes=30,
+                    target_date=date.today() + timedelta(days=30), detected_level="Beginner")
+        db.add(goal)
+        db.flush()
+        task = DailyTask(user_id=user_id, goal_id=goal.id, topic="Decorators", description="d", date=date.today(),
+                         resource_link="https://example.com/old")
+        db.add(task)
+        db.commit()
+        return task.id
+    finally:
+        db.close()
+
+
+def _sse_events(text):
+    events = []
+    for block in text.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_split_action_marker_is_held_back():
+    action = '{"type": "update_resource", "new_link": "https://example.com/new", "reason": "clearer"}'
+    sent, (remaining, ai_data) = _feed(["Try this video.\n[", "[ACT", "ION]] ", action])
+    # The marker's first characters wait until it is clear they are the marker
+    assert sent == ["Try this video.\n", "", "", ""]
+    assert remaining == ""
+    assert ai_data == {"answer": "Try this video.", "action": json.loads(action)}
+
+    # Something that only starts like the marker is released once it isn't one
+    sent, (remaining, ai_data) = _feed(["Lists use [", "[1, 2]] ", "brackets [["])
+    assert sent == ["Lists use ", "[[1, 2]] ", "brackets "]
+    assert remaining == "[[" and ai_data == {"answer": "Lists use [[1, 2]] brackets [[", "action": None}
+
+
+def test_raw_json_reply_is_unwrapped():
+    sent, (remaining, ai_data) = _feed(['  {"answer": "A closure keeps', ' its scope.", "action": ', "null}"])
+    # None of the JSON reaches the user; the answer is sent once it is complete
+    assert sent == ["", "", ""]
+    assert remaining == "A closure keeps its scope."
+    assert ai_data == {"answer": "A closure keeps its scope.", "action": None}
+
+
+def test_astream_answer_question_sends_only_the_answer(stub):
+    async def collect():
+        return [event async for event in ai_service.astream_answer_question("What is a decorator?")]
+
+    replies.append(["A decorator wraps", " a function.[[ACT", 'ION]] {"type": "update_resource", "new_link": "https://example.com/new"}'])
+    events = asyncio.run(collect())
+    assert "".join(text for kind, text in events if kind == "token") == "A decorator wraps a function."
+    assert events[-1] == ("done", {"answer": "A decorator wraps a function.", "action": {"type": "update_resource", "new_link": "https://example.com/new"}})
+
+
+def test_chat_stream_reports_the_action_taken(stub, auth_headers):
+    task_id = _task("stream-chat-user")
+    replies.append([
+        "Here is a clearer ", "walkthrough.\n[[", "ACTION]] ",
+        '{"type": "update_resource", "new_link": "https://example.com/new", "reason": "clearer"}',
+    ])
+    client = TestClient(main.app)
+    response = client.post("/chat/stream", json={"message": "Can I get a better video?", "task_id": task_id},
+                           headers=auth_headers("stream-chat-user"))
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+
+    events = _sse_events(response.text)
+    tokens = [data["text"] for kind, data in events if kind == "token"]
+    assert "".join(tokens) == "Here is a clearer walkthrough.\n" and not any("[" in t for t in tokens)
+    assert [kind for kind, _ in events][-1] == "done"
+    assert events[-1][1] == {"response": "Here is a clearer walkthrough.", "action_taken": "update_resource", "task_updated": task_id}
+
+    db = SessionLocal()
+    try:
+        assert db.query(DailyTask).filter(DailyTask.id == task_id).one().resource_link == "https://example.com/new"
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,129 @@
+import json
+import re
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import content_catalog
+import main
+import nightly_precompute
+import task_pregen
+import youtube_service
+from database import SessionLocal
+from models import ContentCatalogEntry, Goal, Roadmap, RoadmapTask, User
+
+calls = []
+
+
+class CatalogHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the resource and daily task prompts; every
+    call gives different links.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt_type = body["response_format"]["json_schema"]["name"]
+        calls.append(prompt_type)
+        if prompt_type == "curated_resources":
+            content = {"resources": [{"title": "Guide", "url": f"https://example.com/guide-{len(calls)}", "platform": "Web", "resource_type": "docs"}]}
+        else:
+            topic = re.search(r"Topic: (.+)", body["messages"][-1]["content"]).group(1).strip()
+            content = {"topic": topic, "description": f"Study {topic} (#{len(calls)})"}
+        payload = json.dumps({"choices": [{"message": {"content": json.dumps(content)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _video_search(query, limit=2):
+    n = len(calls)
+    return [{"title": "Video", "url": f"https://www.youtube.com/embed/v{n}", "views": 10, "video_id": f"v{n}",
+             "is_embeddable": True, "validated_at": "2026-01-01T00:00:00"}]
+
+
+def _learner(user_id, level="Beginner"):
+    db = SessionLocal()
+    try:
+        db.add(User(id=user_id, email=f"{user_id}@example.com"))
+        goal = Goal(user_id=user_id, subject="  Scala ", exam_or_skill="Job ready", daily_time_minutes=50,
+                    target_date=date.today() + timedelta(days=30), detected_level=level)
+        db.add(goal)
+        db.flush()
+        roadmap = Roadmap(user_id=user_id, goal_id=goal.id, title="Scala")
+        db.add(roadmap)
+        db.flush()
+        db.add(RoadmapTask(roadmap_id=roadmap.id, phase="P", module="M", title="Pattern Matching", description="d",
+                           estimated_time_minutes=30, order_index=0, status="active"))
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_keys_and_quality():
+    assert content_catalog.catalog_key("Data Science", "Pandas: GroupBy!", "Beginner", 30) == \
+        content_catalog.catalog_key(" data  science", "pandas groupby", "beginner", 40) == "data science|pandas groupby|beginner|short"
+    assert content_catalog.time_bucket(60) == "standard" and content_catalog.time_bucket(120) == "long"
+    video = {"platform": "YouTube", "is_embeddable": True, "video_confidence": "high"}
+    fallback = {"platform": "YouTube", "is_embeddable": False, "video_confidence": "fallback"}
+    link = {"platform": "MDN"}
+    assert content_catalog.quality([video, link]) == 0.875
+    # YouTube search was down: not worth keeping
+    assert content_catalog.quality([fallback, link]) < content_catalog.CONTENT_CATALOG_MIN_QUALITY
+
+
+def test_second_user_is_served_from_the_catalog(openrouter_stub, auth_headers, monkeypatch):
+    openrouter_stub(CatalogHandler)
+    monkeypatch.setattr(youtube_service, "search_and_validate_videos", _video_search)
+    # Only the catalog is exercised here
+    monkeypatch.setattr(task_pregen, "TASK_PREGEN_ENABLED", False)
+    monkeypatch.setattr(nightly_precompute, "NIGHTLY_PRECOMPUTE_ENABLED", False)
+    client = TestClient(main.app)
+    for user in ("catalog-a", "catalog-b"):
+        _learner(user)
+    _learner("catalog-expert", level="Advanced")
+
+    first = client.get("/daily-plan", headers=auth_headers("catalog-a")).json()[0]
+    generated = len(calls)
+    assert generated == 2
+
+    # Same subject, topic and level: no YouTube search, no LLM call
+    second = client.get("/daily-plan", headers=auth_headers("catalog-b")).json()[0]
+    assert len(calls) == generated
+    assert second["description"] == first["description"]
+    assert [r["url"] for r in second["resources"]] == [r["url"] for r in first["resources"]]
+    assert second["resources"][0]["id"] != first["resources"][0]["id"]
+
+    # Another level is another key
+    client.get("/daily-plan", headers=auth_headers("catalog-expert"))
+    assert len(calls) == generated + 2
+
+    # Asking for variety: no other variant yet, so one is generated (and kept)...
+    fresh = client.post(f"/task/{second['id']}/regenerate-resources", headers=auth_headers("catalog-b")).json()["resources"]
+    assert len(calls) == generated + 4
+    assert not {r["url"] for r in fresh} & {r["url"] for r in second["resources"]}
+
+    # ...and handed to the next user who asks, without generating
+    other = client.post(f"/task/{first['id']}/regenerate-resources", headers=auth_headers("catalog-a")).json()["resources"]
+    assert len(calls) == generated + 4
+    assert [r["url"] for r in other] == [r["url"] for r in fresh]
+
+    db = SessionLocal()
+    try:
+        entries = db.query(ContentCatalogEntry).filter(ContentCatalogEntry.subject == "scala").all()
+        assert sorted((e.level, e.time_bucket) for e in entries) == [("advanced", "standard"), ("beginner", "standard"), ("beginner", "standard")]
+        assert all(e.quality == 0.875 for e in entries)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
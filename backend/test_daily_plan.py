@@ -1,3 +1,4 @@
+import asyncio
 from main import get_daily_plan
 from database import SessionLocal
 import traceback
@@ -11,7 +12,7 @@ def test_daily_plan():
     try:
         # Mock dependency injection by passing db explicitly
         # user_id is passed as str directly because Depends is handled by FastAPI
-        results = get_daily_plan(user_id=user_id, db=db)
+        results = asyncio.run(get_daily_plan(user_id=user_id, db=db))
         print("SUCCESS! Results found:", len(results))
         for task in results:
             print(f"- Task: {task.get('topic')}")
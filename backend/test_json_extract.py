@@ -0,0 +1,80 @@
+import codecs
+import json
+import random
+import time
+
+import json_stream
+from bench_json_extract import load_corpus
+
+
+def test_corpus():
+    for case in load_corpus():
+        assert json_stream.extract_json(case["text"]) == case["expected"], case["name"]
+
+
+def test_every_value_and_kind_filter():
+    text = 'Notes: [1, 2]\n```json\n{"a": 1}\n```\nAlso {"b": {"c": [3]}}'
+    assert list(json_stream.iter_json_values(text)) == [[1, 2], {"a": 1}, {"b": {"c": [3]}}]
+    assert json_stream.extract_json(text, dict) == {"a": 1}
+
+
+def test_code_fences():
+    # Code samples are skipped while there is JSON outside them...
+    assert json_stream.extract_json('```python\nd = {"x": 1}\n```\n{"y": 2}') == {"y": 2}
+    # ...but a mislabelled fence is still used if it is all there is
+    assert json_stream.extract_json('```javascript\n{"x": 1}\n```') == {"x": 1}
+
+
+def test_pathological_input_is_linear():
+    started = time.perf_counter()
+    assert json_stream.extract_json('Use {"x ' * 20000) is None
+    assert json_stream.extract_json("[" * 50000) is None
+    assert time.perf_counter() - started < 1.0
+
+
+ROADMAP_TEXT = 'Sure!\n```json\n' + json.dumps({
+    "title": "Caf\u00e9 \"Go\" {basics}",
+    "phases": [
+        {"name": "Start", "modules": [{"name": "Intro", "tasks": [{"title": "a\\b, [c]", "estimated_time": 30}, {"title": "\u00fcber"}]}]},
+        {"modules": [{"tasks": [{"title": "x"}], "name": "Late"}], "name": "Later"},
+    ],
+}, ensure_ascii=False) + "\n```"
+ROADMAP_PATTERNS = [("title",), ("phases", "*", "name"), ("phases", "*", "modules", "*", "name"), ("phases", "*", "modules", "*", "tasks", "*")]
+
+
+def _parse(chunks):
+    parser = json_stream.IncrementalJSONParser(ROADMAP_PATTERNS)
+    events = [event for chunk in chunks for event in parser.feed(chunk)]
+    return events, parser.result()
+
+
+def test_incremental_parser_any_split():
+    whole, data = _parse([ROADMAP_TEXT])
+    assert data == json.loads(ROADMAP_TEXT[ROADMAP_TEXT.index("{"):ROADMAP_TEXT.rindex("}") + 1])
+    assert [path for path, _ in whole] == [
+        ("title",), ("phases", 0, "name"), ("phases", 0, "modules", 0, "name"),
+        ("phases", 0, "modules", 0, "tasks", 0), ("phases", 0, "modules", 0, "tasks", 1),
+        ("phases", 1, "modules", 0, "tasks", 0), ("phases", 1, "modules", 0, "name"), ("phases", 1, "name"),
+    ]
+    assert whole[0][1] == 'Caf\u00e9 "Go" {basics}' and whole[3][1]["title"] == "a\\b, [c]"
+
+    # Cut anywhere, including inside escapes and multi-byte characters on the wire
+    for cut in range(1, len(ROADMAP_TEXT)):
+        assert _parse([ROADMAP_TEXT[:cut], ROADMAP_TEXT[cut:]]) == (whole, data), cut
+    raw = ROADMAP_TEXT.encode()
+    rng = random.Random(7)
+    for _ in range(200):
+        cuts = sorted(rng.sample(range(1, len(raw)), rng.randint(2, 40)))
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        chunks = [decoder.decode(raw[a:b]) for a, b in zip([0] + cuts, cuts + [len(raw)])]
+        assert _parse(chunks) == (whole, data), cuts
+    assert _parse(list(ROADMAP_TEXT)) == (whole, data)
+
+
+if __name__ == "__main__":
+    test_corpus()
+    test_every_value_and_kind_filter()
+    test_code_fences()
+    test_pathological_input_is_linear()
+    test_incremental_parser_any_split()
+    print("JSON extraction tests passed!")
@@ -0,0 +1,53 @@
+import pytest
+
+import llm_cache
+
+MESSAGES = [
+    {"role": "system", "content": "You are Zuno."},
+    {"role": "user", "content": "\n    Create a roadmap for   Python.\n    "},
+]
+
+
+def test_hit_after_store_ignores_whitespace():
+    llm_cache.clear()
+    assert llm_cache.get("model-a", MESSAGES, "roadmap") is None
+
+    llm_cache.put("model-a", MESSAGES, "roadmap", '{"title": "Python"}')
+    reformatted = [
+        {"role": "system", "content": "You are Zuno."},
+        {"role": "user", "content": "Create a roadmap for Python."},
+    ]
+    assert llm_cache.get("model-a", reformatted, "roadmap") == '{"title": "Python"}'
+
+    # Different model => different key
+    assert llm_cache.get("model-b", MESSAGES, "roadmap") is None
+
+
+def test_bypass_for_uncacheable_prompts():
+    llm_cache.clear()
+    llm_cache.put("model-a", MESSAGES, "evaluation", '{"score": 90}')
+    assert llm_cache.get("model-a", MESSAGES, "evaluation") is None
+
+    llm_cache.put("model-a", MESSAGES, "roadmap", '{"title": "Python"}')
+    assert llm_cache.get("model-a", MESSAGES, "roadmap", use_cache=False) is None
+
+
+def test_lru_eviction():
+    llm_cache.clear()
+    original_max = llm_cache.LLM_CACHE_MAX_ENTRIES
+    llm_cache.LLM_CACHE_MAX_ENTRIES = 2
+    try:
+        first = [{"role": "user", "content": "first"}]
+        llm_cache.put("m", first, "roadmap", "{}")
+        llm_cache.put("m", [{"role": "user", "content": "second"}], "roadmap", "{}")
+        assert llm_cache.get("m", first, "roadmap") == "{}"  # touch -> most recently used
+        llm_cache.put("m", [{"role": "user", "content": "third"}], "roadmap", "{}")
+
+        assert llm_cache.get("m", first, "roadmap") == "{}"
+        assert llm_cache.get("m", [{"role": "user", "content": "second"}], "roadmap") is None
+    finally:
+        llm_cache.LLM_CACHE_MAX_ENTRIES = original_max
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,75 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import llm_usage
+import main
+from database import SessionLocal
+from models import LLMUsage
+
+
+class UsageReportingHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub that reports token usage and cost.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        assert body["usage"] == {"include": True}
+        payload = json.dumps({
+            "choices": [{"message": {"content": '{"answer": "Use a dict.", "action": null}'}}],
+            "usage": {"prompt_tokens": 120, "completion_tokens": 30, "total_tokens": 150, "cost": 0.0004},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_usage_is_attributed_to_endpoint_and_user(openrouter_stub, auth_headers, monkeypatch):
+    openrouter_stub(UsageReportingHandler)
+    monkeypatch.setattr(main, "ADMIN_API_TOKEN", "admin")
+    client = TestClient(main.app)
+    response = client.post("/chat", json={"message": "how do I count words?"}, headers=auth_headers("user-42"))
+    assert response.json()["response"] == "Use a dict."
+
+    llm_usage.flush()
+    db = SessionLocal()
+    try:
+        row = db.query(LLMUsage).filter(LLMUsage.user_id == "user-42").one()
+    finally:
+        db.close()
+    assert (row.endpoint, row.prompt_type, row.prompt_tokens, row.completion_tokens) == ("/chat", "chat", 120, 30)
+    assert row.cost == 0.0004 and row.ok and not row.cached
+
+    assert client.get("/ai/usage").status_code == 403
+    by_user = client.get("/ai/usage", params={"group_by": "user_id"}, headers={"X-Admin-Token": "admin"}).json()
+    assert by_user["rows"][0]["user_id"] == "user-42"
+    assert by_user["rows"][0]["total_tokens"] == 150
+    assert client.get("/ai/usage", params={"group_by": "email"}, headers={"X-Admin-Token": "admin"}).status_code == 400
+
+    assert llm_usage.stats()["endpoint"]["/chat"]["prompt_tokens"] >= 120
+
+
+def test_calls_outside_a_request_are_unattributed():
+    llm_usage.record("roadmap", "long", "some/model", {"prompt_tokens": 5, "completion_tokens": 7}, 0.2)
+    llm_usage.flush()
+    db = SessionLocal()
+    try:
+        rows = llm_usage.summary(db, "prompt_type")
+    finally:
+        db.close()
+    roadmap = next(r for r in rows if r["prompt_type"] == "roadmap")
+    assert roadmap["total_tokens"] == 12
+    assert "unknown" in llm_usage.stats()["endpoint"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,102 @@
+import json
+
+from fastapi.testclient import TestClient
+
+import ai_service
+import mock_openrouter
+import structured_output
+
+client = TestClient(mock_openrouter.app)
+
+RESOURCES = [{"title": "Loops", "url": "https://example.com/loops", "platform": "YouTube"}]
+PROMPTS = {
+    "detect_level": ai_service._level_messages("Python", "Job ready", 45, "2027-01-01"),
+    "curated_resources": ai_service._extra_resources_messages("Python", "Loops", "Beginner", "Job ready", 2),
+    "daily_task": ai_service._daily_task_messages("Python", "Beginner", "Loops", 45, RESOURCES),
+    "evaluation": ai_service._evaluation_messages("Write a loop", "for i in range(3): print(i)", "Beginner"),
+    "evaluation_batch": ai_service._evaluation_batch_messages([("Write a loop", "for i in range(3): print(i)", "Beginner")] * 2),
+    "roadmap": ai_service._roadmap_messages("Python", "Beginner", "Job ready", 45, "2027-01-01", "Mixed"),
+    "roadmap_skeleton": ai_service._roadmap_skeleton_messages("Python", "Beginner", "Job ready", 45, "2027-01-01", "Mixed"),
+    "roadmap_module": ai_service._roadmap_module_messages(
+        "Python", "Beginner", "Job ready", 45, "Mixed", "- Phase 1: Basics; Loops", "Phase 1", {"name": "Loops", "task_count": 4}
+    ),
+    "chat": ai_service._question_messages("What is a loop?", None, None),
+}
+
+
+def _instant():
+    mock_openrouter.config.latency = "fixed:0"
+    mock_openrouter.config.tokens_per_sec = 0
+    mock_openrouter.config.error_rate = 0
+    mock_openrouter.config.malformed_rate = 0
+
+
+def _post(messages, prompt_type, **extra):
+    body = {"model": "mock/model", "messages": messages, "response_format": structured_output.response_format(prompt_type), **extra}
+    return client.post("/api/v1/chat/completions", json=body)
+
+
+def test_canned_replies_match_every_prompt_schema():
+    _instant()
+    for prompt_type, messages in PROMPTS.items():
+        response = _post(messages, prompt_type)
+        assert response.status_code == 200
+        body = response.json()
+        data, error = ai_service._parse_output(prompt_type, body["choices"][0]["message"]["content"])
+        assert error is None, (prompt_type, error)
+        assert body["usage"]["total_tokens"] == body["usage"]["prompt_tokens"] + body["usage"]["completion_tokens"]
+
+    # Also recognised from the prompt text alone (response_format turned off)
+    response = client.post("/v1/chat/completions", json={"model": "m", "messages": PROMPTS["roadmap"]})
+    assert ai_service._parse_output("roadmap", response.json()["choices"][0]["message"]["content"])[0]["phases"]
+    response = client.post("/v1/chat/completions", json={"model": "m", "messages": PROMPTS["roadmap_module"]})
+    tasks = ai_service._parse_output("roadmap_module", response.json()["choices"][0]["message"]["content"])[0]["tasks"]
+    assert [t["title"] for t in tasks] == [f"Loops: lesson {i}" for i in range(1, 5)]
+
+
+def test_streaming_chat_with_usage():
+    _instant()
+    messages = ai_service._question_stream_messages("What is a loop?", None, None)
+    text, usage = "", None
+    with client.stream("POST", "/api/v1/chat/completions", json={"model": "m", "messages": messages, "stream": True}) as response:
+        for line in response.iter_lines():
+            if not line.startswith("data:") or line == "data: [DONE]":
+                continue
+            chunk = json.loads(line[5:])
+            usage = chunk.get("usage") or usage
+            for choice in chunk["choices"]:
+                text += choice["delta"].get("content") or ""
+    assert text.startswith("Break the problem") and "{" not in text
+    assert usage["completion_tokens"] > 0
+
+
+def test_errors_and_failing_models():
+    _instant()
+    mock_openrouter.config.error_rate = 1.0
+    mock_openrouter.config.error_statuses = [429]
+    try:
+        response = _post(PROMPTS["evaluation"], "evaluation")
+        assert response.status_code == 429 and response.headers["Retry-After"] == "1"
+    finally:
+        mock_openrouter.config.error_rate = 0
+
+    mock_openrouter.config.fail_models = {"down/model"}
+    try:
+        assert _post(PROMPTS["evaluation"], "evaluation", model="down/model").status_code == 503
+    finally:
+        mock_openrouter.config.fail_models = set()
+    assert client.get("/stats").json()["status:503"] >= 1
+
+
+def test_latency_distributions():
+    assert mock_openrouter.sample_latency("fixed:250") == 0.25
+    assert 0.1 <= mock_openrouter.sample_latency("uniform:100:200") <= 0.2
+    assert mock_openrouter.sample_latency("lognormal:800:0.5") > 0
+
+
+if __name__ == "__main__":
+    test_canned_replies_match_every_prompt_schema()
+    test_streaming_chat_with_usage()
+    test_errors_and_failing_models()
+    test_latency_distributions()
+    print("Mock OpenRouter tests passed!", client.get("/stats").json())
@@ -0,0 +1,66 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import ai_service
+import model_routing
+
+requested_models = []
+
+
+class FlakyPrimaryHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub: the primary model is down, fallbacks answer.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        requested_models.append((body["model"], body.get("max_tokens")))
+        if body["model"] == "primary/model":
+            payload, status = b'{"error": "overloaded"}', 503
+        else:
+            payload = json.dumps({"choices": [{"message": {"content": '{"level": "Beginner", "message": "hi"}'}}]}).encode()
+            status = 200
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_prompt_tiers_and_env_overrides(monkeypatch):
+    assert model_routing.tier_for("detect_level") == "fast"
+    assert model_routing.tier_for("roadmap") == "long"
+    assert model_routing.tier_for("something_new") == "standard"
+
+    monkeypatch.setenv("AI_PROMPT_TIER_CHAT", "fast")
+    monkeypatch.setenv("AI_TIER_FAST_MAX_TOKENS", "123")
+    monkeypatch.setenv("AI_TIER_FAST_FALLBACKS", "a/model, b/model")
+    route = model_routing.route("chat")
+    assert route.tier == "fast"
+    assert route.max_tokens == 123
+    assert route.models == [route.model, "a/model", "b/model"]
+
+
+def test_falls_back_to_next_model(openrouter_stub, monkeypatch):
+    openrouter_stub(FlakyPrimaryHandler)
+    monkeypatch.setenv("AI_TIER_FAST_MODEL", "primary/model")
+    monkeypatch.setenv("AI_TIER_FAST_FALLBACKS", "backup/model")
+    requested_models.clear()
+    response = ai_service.call_openrouter([{"role": "user", "content": "level?"}], prompt_type="evaluation")
+    assert json.loads(response)["level"] == "Beginner"
+    fast = model_routing.route("evaluation")
+    assert requested_models == [("primary/model", fast.max_tokens), ("backup/model", fast.max_tokens)]
+
+    latency = model_routing.stats()["latency"]["fast"]
+    assert latency["fallbacks"] >= 1
+    assert latency["models"]["primary/model"]["errors"] >= 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
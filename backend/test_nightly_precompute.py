@@ -0,0 +1,141 @@
+import json
+import re
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import nightly_precompute
+import task_pregen
+import youtube_service
+from database import SessionLocal
+from models import DailyTask, Goal, Roadmap, RoadmapTask, SchedulerLease, User
+
+topics_seen = []
+
+
+class TaskContentHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the resource and daily task prompts.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt_type = body["response_format"]["json_schema"]["name"]
+        if prompt_type == "curated_resources":
+            content = {"resources": [{"title": "Guide", "url": "https://example.com/guide", "platform": "Web", "resource_type": "docs"}]}
+        else:
+            topic = re.search(r"Topic: (.+)", body["messages"][-1]["content"]).group(1).strip()
+            topics_seen.append(topic)
+            content = {"topic": topic, "description": f"Tonight's prep: {topic}"}
+        payload = json.dumps({"choices": [{"message": {"content": json.dumps(content)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _learner(user_id, created_days_ago=0, planned_for=None):
+    # A user with a three-task roadmap whose first task is active
+    db = SessionLocal()
+    try:
+        db.add(User(id=user_id, email=f"{user_id}@example.com"))
+        goal = Goal(user_id=user_id, subject="Elixir", exam_or_skill="Job ready", daily_time_minutes=30,
+                    target_date=date.today() + timedelta(days=30), detected_level="Beginner")
+        db.add(goal)
+        db.flush()
+        roadmap = Roadmap(user_id=user_id, goal_id=goal.id, title="Elixir",
+                          created_at=datetime.utcnow() - timedelta(days=created_days_ago))
+        db.add(roadmap)
+        db.flush()
+        tasks = [RoadmapTask(roadmap_id=roadmap.id, phase="P", module="M", title=f"Nightly Lesson {user_id}-{i}", description="d",
+                             estimated_time_minutes=30, order_index=i, status="active" if i == 0 else "pending") for i in range(3)]
+        db.add_all(tasks)
+        db.flush()
+        if planned_for:
+            db.add(DailyTask(user_id=user_id, goal_id=goal.id, roadmap_task_id=tasks[0].id, topic=tasks[0].title, description="d", date=planned_for))
+        db.commit()
+    finally:
+        db.close()
+
+
+def _daily_tasks(user_id):
+    db = SessionLocal()
+    try:
+        return [(t.date, t.description, len(t.resources)) for t in db.query(DailyTask).filter(DailyTask.user_id == user_id)]
+    finally:
+        db.close()
+
+
+def _set_lease(**values):
+    db = SessionLocal()
+    try:
+        db.query(SchedulerLease).filter(SchedulerLease.name == nightly_precompute.LEASE_NAME).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_window_and_plan_day(monkeypatch):
+    monkeypatch.setattr(nightly_precompute, "NIGHTLY_PRECOMPUTE_HOUR", 23)
+    assert nightly_precompute.in_window(datetime(2026, 3, 1, 23, 30))
+    assert nightly_precompute.in_window(datetime(2026, 3, 2, 2, 59))
+    assert not nightly_precompute.in_window(datetime(2026, 3, 2, 3, 0))
+    # The coming morning: tomorrow late in the evening, today after midnight
+    assert nightly_precompute.plan_day(datetime(2026, 3, 1, 23, 0)) == date(2026, 3, 2)
+    assert nightly_precompute.plan_day(datetime(2026, 3, 2, 3, 0)) == date(2026, 3, 2)
+
+
+def test_precompute_prepares_active_users_once(openrouter_stub, auth_headers, monkeypatch):
+    openrouter_stub(TaskContentHandler)
+    monkeypatch.setattr(youtube_service, "search_and_validate_videos", lambda query, limit=2: [])
+    monkeypatch.setattr(task_pregen, "TASK_PREGEN_ENABLED", False)
+    monkeypatch.setattr(nightly_precompute, "NIGHTLY_PRECOMPUTE_RATE", 0)
+    today = date.today()
+    _learner("night-new")
+    _learner("night-dormant", created_days_ago=30)
+    _learner("night-done", planned_for=today)
+
+    # Another replica is running it: nothing happens here
+    db = SessionLocal()
+    db.add(SchedulerLease(name=nightly_precompute.LEASE_NAME, holder="other-replica",
+                          lease_expires_at=datetime.utcnow() + timedelta(minutes=5)))
+    db.commit()
+    db.close()
+    assert nightly_precompute.run(today) is None
+    assert _daily_tasks("night-new") == []
+
+    # ...until it stops renewing its lease; the run picks up what is still missing
+    _set_lease(lease_expires_at=datetime.utcnow() - timedelta(seconds=1))
+    summary = nightly_precompute.run(today)
+    assert summary["completed"] and summary["created"] == 1
+    assert _daily_tasks("night-new") == [(today, "Tonight's prep: Nightly Lesson night-new-0", 2)]
+    assert _daily_tasks("night-dormant") == [] and len(_daily_tasks("night-done")) == 1
+
+    # The day is done: later checks in the window don't run it again
+    assert nightly_precompute.run(today) is None
+
+    # The morning's /daily-plan is a read
+    before = len(topics_seen)
+    plan = TestClient(main.app).get("/daily-plan", headers=auth_headers("night-new")).json()
+    assert len(topics_seen) == before
+    assert plan[0]["description"] == "Tonight's prep: Nightly Lesson night-new-0" and len(plan[0]["resources"]) == 2
+
+    # Not finished today: tomorrow's task reuses the content and gets its own copy of the resources
+    tomorrow = today + timedelta(days=1)
+    assert nightly_precompute.run(tomorrow)["completed"]
+    assert topics_seen[before:].count("Nightly Lesson night-new-0") == 0
+    assert len(_daily_tasks("night-done")) == 2
+    assert sorted(_daily_tasks("night-new")) == [(today, "Tonight's prep: Nightly Lesson night-new-0", 2),
+                                                  (tomorrow, "Tonight's prep: Nightly Lesson night-new-0", 2)]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
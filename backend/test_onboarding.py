@@ -1,3 +1,4 @@
+import asyncio
 from main import onboarding, OnboardingRequest
 from database import SessionLocal
 from datetime import date
@@ -18,7 +19,7 @@ def test_onboarding():
     try:
         # We need to mock get_current_user_id since it's a dependency
         # But here we just call the function directly
-        result = onboarding(req, claims={"sub": user_id, "email": "test@example.com"}, db=db)
+        result = asyncio.run(onboarding(req, claims={"sub": user_id, "email": "test@example.com"}, db=db))
         print("SUCCESS:", result)
     except Exception as e:
         import traceback
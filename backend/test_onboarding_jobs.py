@@ -0,0 +1,327 @@
+import asyncio
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+import nightly_precompute
+import onboarding_jobs
+import task_pregen
+from database import SessionLocal
+from models import OnboardingJob, Roadmap, RoadmapTask, User
+
+# Seconds the stub takes per call
+delay = 0
+
+
+class OnboardingHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the level and roadmap prompts.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(delay)
+        prompt_type = body["response_format"]["json_schema"]["name"]
+        if prompt_type == "roadmap_skeleton":
+            content = json.dumps({"title": "Roadmap", "phases": [{"name": "Phase 1", "modules": [{"name": "Basics", "task_count": 3}]}]})
+        elif prompt_type == "roadmap_module":
+            content = json.dumps({"tasks": [
+                {"title": f"Lesson {i}", "description": "d", "estimated_time": 30, "output_deliverable": "o", "resource_type": "Mixed"}
+                for i in range(3)
+            ]})
+        else:
+            content = json.dumps({"level": "Beginner", "message": "Welcome"})
+        payload = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(openrouter_stub, monkeypatch):
+    global delay
+    openrouter_stub(OnboardingHandler)
+    # Only onboarding is stubbed here
+    monkeypatch.setattr(task_pregen, "TASK_PREGEN_ENABLED", False)
+    monkeypatch.setattr(nightly_precompute, "NIGHTLY_PRECOMPUTE_ENABLED", False)
+    yield
+    delay = 0
+
+
+def _body(subjects):
+    return {
+        "subjects": subjects, "exam_or_skill": "Job ready", "daily_time_minutes": 45,
+        "target_date": str(date.today() + timedelta(days=60)), "target_goal": "Job Ready", "learning_style": "Mixed",
+    }
+
+
+
+
+
+def _add_job(status, attempts=0, lease_expires_at=None):
+    db = SessionLocal()
+    try:
+        job = OnboardingJob(
+            id=uuid.uuid4().hex, user_id=None, request=json.dumps({"subjects": ["Go"]}), request_hash=uuid.uuid4().hex,
+            status=status, attempts=attempts, worker="gone" if status == "running" else None,
+            lease_expires_at=lease_expires_at, created_at=datetime.utcnow() - timedelta(days=1),
+        )
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+def _job(job_id):
+    db = SessionLocal()
+    try:
+        return db.query(OnboardingJob).filter(OnboardingJob.id == job_id).one()
+    finally:
+        db.close()
+
+
+def test_job_is_claimed_once_and_expired_leases_are_retried():
+    queued = _add_job("queued")
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(onboarding_jobs._claim(f"test-{i}"))) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    claimed = [r for r in results if r and r[0] == queued]
+    assert len(claimed) == 1
+    assert _job(queued).status == "running" and _job(queued).attempts == 1
+
+    # Its worker died: once the lease runs out, another worker takes it over
+    past = datetime.utcnow() - timedelta(seconds=1)
+    db = SessionLocal()
+    db.query(OnboardingJob).filter(OnboardingJob.id == queued).update({"lease_expires_at": past})
+    db.commit()
+    db.close()
+    assert onboarding_jobs._claim("test-rescue")[0] == queued
+    assert _job(queued).worker == "test-rescue" and _job(queued).attempts == 2
+
+    # Out of attempts: failed instead of retried forever
+    exhausted = _add_job("running", attempts=onboarding_jobs.ONBOARDING_JOB_MAX_ATTEMPTS, lease_expires_at=past)
+    onboarding_jobs._claim("test-late")
+    assert _job(exhausted).status == "failed"
+
+    db = SessionLocal()
+    db.query(OnboardingJob).filter(OnboardingJob.id.in_([queued, exhausted])).delete(synchronize_session=False)
+    db.commit()
+    db.close()
+
+
+def test_onboarding_job_runs_in_background_with_progress(stub, auth_headers):
+    body = _body(["Gleam", "Pony"])
+    with TestClient(main.app) as client:
+        response = client.post("/onboarding/jobs", json=body, headers=auth_headers("job-user"))
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert response.json()["status_url"] == f"/onboarding/jobs/{job_id}"
+
+        # A client retrying the same request gets the same job
+        retry = client.post("/onboarding/jobs", json=body, headers=auth_headers("job-user"))
+        assert retry.status_code == 202 and retry.json()["job_id"] == job_id
+
+        deadline = time.monotonic() + 20
+        while True:
+            job = client.get(f"/onboarding/jobs/{job_id}", headers=auth_headers("job-user")).json()
+            if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+                break
+            time.sleep(0.1)
+
+        assert job["status"] == "succeeded", job
+        assert [(s["subject"], s["status"], s["tasks_saved"]) for s in job["subjects"]] == [("Gleam", "done", 3), ("Pony", "done", 3)]
+        assert [g["subject"] for g in job["result"]["goals"]] == ["Gleam", "Pony"]
+        assert client.get(f"/onboarding/jobs/{job_id}", headers=auth_headers("someone-else")).status_code == 404
+
+    db = SessionLocal()
+    try:
+        roadmaps = db.query(Roadmap).filter(Roadmap.user_id == "job-user").all()
+        assert len(roadmaps) == 2
+        assert db.query(RoadmapTask).filter(RoadmapTask.roadmap_id.in_([r.id for r in roadmaps])).count() == 6
+    finally:
+        db.close()
+    assert onboarding_jobs.stats()["succeeded"] >= 1 and onboarding_jobs.stats()["workers"] == 0
+
+
+@pytest.fixture
+def foreign_keys(fresh_database):
+    # Enforced like Postgres does; SQLite leaves them off unless asked
+    event.listen(fresh_database, "connect", lambda connection, _: connection.execute("PRAGMA foreign_keys=ON"))
+    fresh_database.dispose()
+
+
+def test_first_time_user_job_with_foreign_keys_enforced(foreign_keys, stub, auth_headers):
+    with TestClient(main.app) as client:
+        response = client.post("/onboarding/jobs", json=_body(["Hare"]), headers=auth_headers("new-job-user"))
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+
+        deadline = time.monotonic() + 20
+        while True:
+            job = client.get(f"/onboarding/jobs/{job_id}", headers=auth_headers("new-job-user")).json()
+            if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+                break
+            time.sleep(0.1)
+    assert job["status"] == "succeeded", job
+
+    db = SessionLocal()
+    try:
+        assert db.query(User).filter(User.id == "new-job-user").one().email == "new-job-user@example.com"
+        assert db.query(Roadmap).filter(Roadmap.user_id == "new-job-user").count() == 1
+    finally:
+        db.close()
+
+
+def test_subjects_are_onboarded_concurrently(stub, auth_headers):
+    global delay
+    delay = 0.4
+    client = TestClient(main.app)
+    started = time.monotonic()
+    response = client.post("/onboarding", json=_body(["Crystal", "Racket", "Haxe"]), headers=auth_headers("parallel-user"))
+    elapsed = time.monotonic() - started
+    assert response.status_code == 200
+    assert [g["subject"] for g in response.json()["goals"]] == ["Crystal", "Racket", "Haxe"]
+    # Level, outline and module per subject: about three calls' worth, not nine
+    assert elapsed < 5 * delay, elapsed
+
+    db = SessionLocal()
+    try:
+        subjects = [r.goal.subject for r in db.query(Roadmap).filter(Roadmap.user_id == "parallel-user").order_by(Roadmap.id)]
+        assert subjects == ["Crystal", "Racket", "Haxe"]
+    finally:
+        db.close()
+
+
+def _sse_events(text):
+    events = []
+    for block in text.split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_streaming_onboarding_event_order(stub, auth_headers):
+    response = TestClient(main.app).post("/onboarding/stream", json=_body(["Elm"]), headers=auth_headers("stream-order-user"))
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/event-stream")
+    events = _sse_events(response.text)
+
+    # `ready` as soon as the first task is saved, not once the whole roadmap is
+    assert [kind for kind, _ in events] == [
+        "subject_started", "level", "task", "ready", "task", "task", "module_done", "roadmap_ready", "subject_done", "done",
+    ]
+    assert [d["order_index"] for kind, d in events if kind == "task"] == [0, 1, 2]
+    assert events[1][1]["roadmap_id"] and events[6][1] == {"subject": "Elm", "phase": "Phase 1", "module": "Basics"}
+    assert events[8][1]["tasks_saved"] == 3
+    assert events[3][1]["goals"] == events[9][1]["goals"] == [{"subject": "Elm", "detected_level": "Beginner", "message": "Welcome"}]
+
+
+class SlowLaterModuleHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub whose roadmap has a quick first module and a slow
+    second one.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt_type = body["response_format"]["json_schema"]["name"]
+        if prompt_type == "roadmap_skeleton":
+            content = {"title": "Roadmap", "phases": [{"name": "Phase 1", "modules": [
+                {"name": "First", "task_count": 2}, {"name": "Later", "task_count": 2},
+            ]}]}
+        elif prompt_type == "roadmap_module":
+            module = re.search(r"Module: (\w+)", body["messages"][-1]["content"]).group(1)
+            if module == "Later":
+                time.sleep(0.5)
+            content = {"tasks": [
+                {"title": f"{module} {i}", "description": "d", "estimated_time": 30, "output_deliverable": "o", "resource_type": "Mixed"}
+                for i in range(2)
+            ]}
+        else:
+            content = {"level": "Beginner", "message": "Welcome"}
+        payload = json.dumps({"choices": [{"message": {"content": json.dumps(content)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_streaming_onboarding_saves_first_task_before_later_modules(openrouter_stub, monkeypatch):
+    openrouter_stub(SlowLaterModuleHandler)
+    monkeypatch.setattr(task_pregen, "TASK_PREGEN_ENABLED", False)
+    saved_at = {}
+
+    def saved_titles():
+        db = SessionLocal()
+        try:
+            return [t.title for t in db.query(RoadmapTask).join(Roadmap).filter(Roadmap.user_id == "early-user").order_by(RoadmapTask.order_index)]
+        finally:
+            db.close()
+
+    def emit(event, data):
+        # What another request would see at this point of the stream
+        if event in ("ready", "module_done", "done"):
+            saved_at.setdefault(event if event != "module_done" else data["module"], saved_titles())
+
+    request = main.OnboardingRequest(**_body(["Io"]))
+    asyncio.run(main._run_streaming_onboarding(request, "early-user", "early@example.com", emit))
+
+    # The first task can be opened while the later module is still being written
+    assert saved_at["ready"] == ["First 0"]
+    assert saved_at["First"] == ["First 0", "First 1"]
+    assert saved_at["Later"] == saved_at["done"] == ["First 0", "First 1", "Later 0", "Later 1"]
+
+
+def test_streaming_onboarding_plans_subjects_concurrently(stub, auth_headers):
+    global delay
+    delay = 0.4
+    client = TestClient(main.app)
+    started = time.monotonic()
+    response = client.post("/onboarding/stream", json=_body(["Zig", "Nim", "OCaml"]), headers=auth_headers("stream-parallel-user"))
+    elapsed = time.monotonic() - started
+    events = _sse_events(response.text)
+    # Level, outline and module per subject: about three calls' worth, not nine
+    assert elapsed < 5 * delay, elapsed
+
+    kinds = [kind for kind, _ in events]
+    assert kinds.count("roadmap_ready") == 3 and kinds.count("task") == 9 and kinds.count("ready") == 1
+    # Ready with the first saved task, long before every subject is done
+    assert kinds.index("ready") < kinds.index("subject_done") and kinds[-1] == "done"
+    assert sorted((d["subject"], d["tasks_saved"]) for kind, d in events if kind == "subject_done") == [("Nim", 3), ("OCaml", 3), ("Zig", 3)]
+    assert [g["subject"] for g in events[-1][1]["goals"]] == ["Zig", "Nim", "OCaml"]
+
+    db = SessionLocal()
+    try:
+        roadmaps = db.query(Roadmap).filter(Roadmap.user_id == "stream-parallel-user").all()
+        assert sorted(r.goal.subject for r in roadmaps) == ["Nim", "OCaml", "Zig"]
+        assert db.query(RoadmapTask).filter(RoadmapTask.roadmap_id.in_([r.id for r in roadmaps])).count() == 9
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,59 @@
+import json
+
+import prompt_builder
+
+RESOURCE = {
+    "title": "Loops in Python",
+    "url": "https://www.youtube.com/watch?v=abc",
+    "platform": "YouTube",
+    "resource_type": "video",
+    "video_id": "abc",
+    "validated_at": "2026-01-01T00:00:00",
+}
+
+
+def test_render_dedents_template_but_not_values():
+    code = "def f():\n    return 1"
+    messages = prompt_builder.render(
+        "evaluation", """
+        Submission:
+        {code}
+
+        Respond in JSON: {{"score": 0}}
+        """, "system", code=code,
+    )
+    assert messages[0] == {"role": "system", "content": "system"}
+    assert messages[1]["content"] == 'Submission:\ndef f():\n    return 1\n\nRespond in JSON: {"score": 0}'
+
+
+def test_oversized_input_is_clipped_to_budget():
+    text = "start " + "x" * 50000 + " end"
+    messages = prompt_builder.render("evaluation", "{user_text}", "", {"user_text": "submission"}, user_text=text)
+    content = messages[1]["content"]
+    assert content.startswith("start ") and content.endswith(" end")
+    assert "characters omitted" in content
+    assert prompt_builder.estimate_tokens(content) <= prompt_builder.budget("submission") + 20
+
+    stats = prompt_builder.stats()["by_prompt"]["evaluation"]
+    assert stats["truncated"] >= 1 and stats["fields"]["user_text"] >= 1
+    assert stats["clipped_tokens"] > 10000
+
+
+def test_prompt_resources_are_compact_and_unique():
+    compact = json.loads(prompt_builder.prompt_resources([RESOURCE, dict(RESOURCE), None]))
+    assert compact == [{"title": "Loops in Python", "platform": "YouTube", "url": "https://www.youtube.com/watch?v=abc"}]
+
+
+def test_daily_task_prompt_lists_resources_once():
+    import ai_service
+    messages = ai_service._daily_task_messages("Python", "Beginner", "Loops", 30, [RESOURCE])
+    assert messages[1]["content"].count(RESOURCE["url"]) == 1
+    assert "validated_at" not in messages[1]["content"]
+
+
+if __name__ == "__main__":
+    test_render_dedents_template_but_not_values()
+    test_oversized_input_is_clipped_to_budget()
+    test_prompt_resources_are_compact_and_unique()
+    test_daily_task_prompt_lists_resources_once()
+    print("Prompt builder tests passed!", prompt_builder.stats()["by_prompt"])
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import ai_service
+import model_routing
+import resilience
+
+# Each entry is (status, delay_seconds) for the next request; empty -> 200 right away
+faults = []
+faults_lock = threading.Lock()
+hits = []
+
+
+class FaultInjectingHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub that replays the queued faults in order.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with faults_lock:
+            status, delay = faults.pop(0) if faults else (200, 0)
+            hits.append(status)
+        time.sleep(delay)
+        if status == 200:
+            payload = json.dumps({"choices": [{"message": {"content": '{"score": 8}'}}]}).encode()
+        else:
+            payload = b'{"error": "injected"}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(openrouter_stub, monkeypatch):
+    openrouter_stub(FaultInjectingHandler)
+    monkeypatch.setattr(resilience, "RETRY_BASE_DELAY", 0.01)
+    ai_service.openrouter_breaker.reset()
+    faults.clear()
+    hits.clear()
+    yield
+    ai_service.openrouter_breaker.reset()
+
+
+def _ask(text):
+    # use_cache=False: evaluation is never cached anyway, but be explicit
+    return ai_service.call_openrouter([{"role": "user", "content": text}], prompt_type="evaluation", use_cache=False)
+
+
+def test_retries_transient_errors(stub):
+    before = resilience.stats()["retry"]["retries"]
+    faults.extend([(503, 0), (429, 0)])
+    assert json.loads(_ask("retry me"))["score"] == 8
+    assert hits == [503, 429, 200]
+    assert resilience.stats()["retry"]["retries"] - before == 2
+    assert ai_service.openrouter_breaker.status()["state"] == "closed"
+
+
+def test_breaker_opens_and_recovers(stub, monkeypatch):
+    breaker = ai_service.openrouter_breaker
+    monkeypatch.setattr(breaker, "failure_threshold", 3)
+    monkeypatch.setattr(breaker, "recovery_timeout", 0.2)
+    faults.extend([(500, 0)] * 3)
+    assert _ask("down") is None
+    assert breaker.status()["state"] == "open"
+
+    # Open: fails fast without touching the provider
+    seen = len(hits)
+    assert _ask("still down?") is None
+    assert len(hits) == seen
+    assert breaker.status()["rejected"] >= 1
+
+    # After the recovery timeout one probe goes through and closes it again
+    time.sleep(0.25)
+    assert json.loads(_ask("back?"))["score"] == 8
+    assert breaker.status()["state"] == "closed"
+
+
+def test_auth_error_probe_settles_breaker(stub, monkeypatch):
+    breaker = ai_service.openrouter_breaker
+    monkeypatch.setattr(breaker, "failure_threshold", 3)
+    monkeypatch.setattr(breaker, "recovery_timeout", 0.2)
+    faults.extend([(500, 0)] * 3)
+    assert _ask("down") is None
+    assert breaker.status()["state"] == "open"
+
+    # The probe hits a bad key: the provider answered, so the breaker closes
+    time.sleep(0.25)
+    faults.append((401, 0))
+    _ask("bad key?")
+    assert hits[-1] == 401
+    assert breaker.status()["state"] == "closed"
+    assert json.loads(_ask("next"))["score"] == 8
+
+
+def test_cancelled_probe_frees_the_breaker(stub, monkeypatch):
+    breaker = ai_service.openrouter_breaker
+    monkeypatch.setattr(breaker, "failure_threshold", 3)
+    monkeypatch.setattr(breaker, "recovery_timeout", 0.2)
+    faults.extend([(500, 0)] * 3)
+    assert _ask("down") is None
+    time.sleep(0.25)
+
+    # The probe outlives its caller's deadline and is cancelled mid-request
+    faults.append((200, 1.0))
+    messages = [{"role": "user", "content": "probe"}]
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(asyncio.wait_for(ai_service.acall_openrouter(messages, prompt_type="evaluation", use_cache=False), 0.1))
+    assert breaker.status()["state"] == "half_open"
+    # ...so the next call may probe instead of failing fast forever
+    assert json.loads(_ask("probe again"))["score"] == 8
+    assert breaker.status()["state"] == "closed"
+
+
+def test_unanswered_probe_expires():
+    breaker = resilience.CircuitBreaker("test", failure_threshold=1, recovery_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+    assert breaker.allow_request()
+    # The probe never reports back: others fail fast, but only for recovery_timeout
+    assert not breaker.allow_request()
+    time.sleep(0.15)
+    assert breaker.allow_request()
+    breaker.release()
+    assert breaker.allow_request() and breaker.status()["state"] == "half_open"
+
+
+def test_hedges_slow_requests(stub, monkeypatch):
+    monkeypatch.setattr(model_routing, "recent_percentile", lambda tier, fraction, min_samples=1: 0.05)
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY", 0.05)
+    before = resilience.stats()["hedging"]["won"]
+    faults.append((200, 1.0))
+    started = time.perf_counter()
+    assert json.loads(_ask("slow"))["score"] == 8
+    assert time.perf_counter() - started < 0.9
+    assert resilience.stats()["hedging"]["won"] - before == 1
+
+    faults.append((200, 1.0))
+    started = time.perf_counter()
+    response = asyncio.run(ai_service.acall_openrouter([{"role": "user", "content": "slow async"}], prompt_type="evaluation", use_cache=False))
+    assert json.loads(response)["score"] == 8
+    assert time.perf_counter() - started < 0.9
+    assert resilience.stats()["hedging"]["won"] - before == 2
+
+
+def test_saturated_hedge_pool_is_not_queued_behind(monkeypatch):
+    def slow():
+        time.sleep(0.2)
+        return threading.current_thread().name
+
+    before = resilience.stats()["hedging"]
+    # One free thread: the first attempt gets it, the duplicate is skipped
+    monkeypatch.setattr(resilience, "_hedge_slots", threading.BoundedSemaphore(1))
+    assert resilience.hedged_call(slow, 0.01).startswith("ai-hedge")
+    # None free: the call runs unhedged on the caller's thread
+    monkeypatch.setattr(resilience, "_hedge_slots", threading.BoundedSemaphore(1))
+    resilience._hedge_slots.acquire()
+    assert resilience.hedged_call(slow, 0.01) == threading.current_thread().name
+
+    after = resilience.stats()["hedging"]
+    assert after["skipped"] - before["skipped"] == 2
+    assert after["launched"] == before["launched"]
+
+
+def test_hedge_delay_rules():
+    assert resilience.hedge_delay("long", 1.0, 120) is None
+    assert resilience.hedge_delay("fast", None, 20) is None
+    assert resilience.hedge_delay("fast", 15, 20) is None
+    assert resilience.hedge_delay("fast", 2.0, 20) == 2.0
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
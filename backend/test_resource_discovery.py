@@ -0,0 +1,89 @@
+import asyncio
+import json
+import time
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import ai_service
+import youtube_service
+
+# Seconds each branch takes
+delay = 0.4
+
+VIDEO = {"title": "Loops in Python", "url": "https://www.youtube.com/embed/abc", "views": 1000,
+         "video_id": "abc", "is_embeddable": True, "validated_at": "2026-01-01T00:00:00"}
+
+
+class ResourcesHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the curated resources prompt.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        time.sleep(delay)
+        content = {"resources": [{"title": f"Doc {i}", "url": f"https://example.com/{i}", "platform": "Web",
+                                  "resource_type": "docs"} for i in range(2)]}
+        payload = json.dumps({"choices": [{"message": {"content": json.dumps(content)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload)
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _slow_search(videos):
+    def search(query, limit=2):
+        time.sleep(delay)
+        return videos
+    return search
+
+
+def _generate(topic, use_async):
+    if use_async:
+        return asyncio.run(ai_service.agenerate_curated_resources("Python", topic, use_cache=False))
+    return ai_service.generate_curated_resources("Python", topic, use_cache=False)
+
+
+def test_branches_run_concurrently_and_are_merged(openrouter_stub, monkeypatch):
+    openrouter_stub(ResourcesHandler)
+    monkeypatch.setattr(youtube_service, "search_and_validate_videos", _slow_search([VIDEO]))
+    for use_async in (False, True):
+        started = time.monotonic()
+        resources = _generate("Loops", use_async)
+        elapsed = time.monotonic() - started
+        # Both branches' worth of work in about one branch's time
+        assert elapsed < 1.8 * delay, elapsed
+        assert [r["url"] for r in resources] == [VIDEO["url"], "https://example.com/0", "https://example.com/1"]
+
+
+def test_a_late_branch_is_dropped_and_the_other_kept(openrouter_stub, monkeypatch):
+    openrouter_stub(ResourcesHandler)
+    # YouTube too slow: its search link stands in, the AI resources are kept
+    monkeypatch.setattr(youtube_service, "search_and_validate_videos", _slow_search([VIDEO]))
+    monkeypatch.setattr(ai_service, "RESOURCE_YOUTUBE_TIMEOUT", delay / 4)
+    for use_async in (False, True):
+        resources = _generate("Loops", use_async)
+        assert resources[0]["video_confidence"] == "fallback"
+        assert [r["url"] for r in resources[1:]] == ["https://example.com/0", "https://example.com/1"]
+
+    # The model too slow: the videos alone
+    monkeypatch.setattr(ai_service, "RESOURCE_YOUTUBE_TIMEOUT", 10)
+    monkeypatch.setattr(ai_service, "RESOURCE_AI_TIMEOUT", delay / 4)
+    for use_async in (False, True):
+        started = time.monotonic()
+        resources = _generate("Loops", use_async)
+        assert time.monotonic() - started < 1.8 * delay
+        assert [r["url"] for r in resources] == [VIDEO["url"]]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,151 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import ai_service
+
+# Module name -> seconds its completion takes
+MODULE_DELAYS = {"Intro": 0.6, "Core": 0.4, "Wrap-up": 0.2}
+requests_seen = Counter()
+_seen_lock = threading.Lock()
+
+
+def _task(title):
+    return {"title": title, "description": "d", "estimated_time": 30, "output_deliverable": "o", "resource_type": "Mixed"}
+
+
+class RoadmapHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the roadmap outline and module prompts. The
+    subject picks the scenario: "Flaky ..." fails some modules, "Broken ..."
+    never returns an outline.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt_type = body["response_format"]["json_schema"]["name"]
+        prompt = body["messages"][1]["content"]
+        subject = re.search(r"Subject: (.+)", prompt).group(1).strip()
+        if prompt_type == "roadmap_skeleton":
+            content = {"title": f"{subject} Roadmap", "phases": [
+                {"name": "Foundations", "modules": [{"name": "Intro", "focus": "setup", "task_count": 2}, {"name": "Core", "task_count": "4 tasks"}]},
+                {"name": "Practice", "modules": [{"name": "Wrap-up", "focus": "a project", "task_count": 1}]},
+            ]} if not subject.startswith("Broken") else {"oops": True}
+        elif prompt_type == "roadmap_module":
+            module = re.search(r"Module: (.+)", prompt).group(1).strip()
+            count = int(re.search(r"Tasks: (\d+)", prompt).group(1))
+            with _seen_lock:
+                requests_seen[(subject, module)] += 1
+                seen = requests_seen[(subject, module)]
+            if subject.startswith("Flaky") and (module == "Wrap-up" or (module == "Core" and seen <= 2)):
+                # Core's first attempt (and its repair) fails, Wrap-up never works
+                content = {"oops": True}
+            else:
+                if not subject.startswith("Flaky"):
+                    time.sleep(MODULE_DELAYS[module])
+                content = {"tasks": [_task(f"{module} {i}") for i in range(count)]}
+        elif body.get("stream"):
+            # Streamed whole roadmap, each module's name only after its tasks
+            content = {"title": "Single", "phases": [{"name": "P", "modules": [
+                {"tasks": [_task("Late 0"), _task("Late 1")], "name": "Late"}, {"tasks": [_task("Early 0")], "name": "Early"},
+            ]}]}
+        else:
+            content = {"title": "Single", "phases": [{"name": "P", "modules": [{"name": "M", "tasks": [_task("Whole 0")]}]}]}
+        if body.get("stream"):
+            text = json.dumps(content)
+            # Small uneven pieces, so names and tasks are cut mid-way
+            chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+            payload = "".join(f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}\n\n" for c in chunks + [""])
+            payload = (payload + "data: [DONE]\n\n").encode()
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps({"choices": [{"message": {"content": json.dumps(content)}}]}).encode()
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(openrouter_stub):
+    openrouter_stub(RoadmapHandler)
+    requests_seen.clear()
+
+
+def _titles(roadmap):
+    return [t["title"] for p in roadmap["phases"] for m in p["modules"] for t in m["tasks"]]
+
+
+EXPECTED = ["Intro 0", "Intro 1", "Core 0", "Core 1", "Core 2", "Core 3", "Wrap-up 0"]
+
+
+def test_modules_are_written_in_parallel_and_merged_in_outline_order(stub):
+    started = time.monotonic()
+    roadmap = asyncio.run(ai_service.agenerate_full_roadmap("Go", "Beginner", "Job ready", 45, "2027-01-01", "Mixed"))
+    elapsed = time.monotonic() - started
+    # As long as the largest module (0.6s), not all of them (1.2s)
+    assert elapsed < 0.95, elapsed
+    # Wrap-up finished first and Intro last; the order is still the outline's
+    assert _titles(roadmap) == EXPECTED
+    assert [m["name"] for p in roadmap["phases"] for m in p["modules"]] == ["Intro", "Core", "Wrap-up"]
+    assert "incomplete_modules" not in roadmap
+
+
+def test_failed_modules_are_retried_alone_then_kept_as_outline(stub):
+    roadmap = ai_service.generate_full_roadmap("Flaky Go", "Beginner", "Job ready", 45, "2027-01-01", "Mixed")
+    # Core's second attempt worked; only Core and Wrap-up were asked again
+    assert _titles(roadmap)[:6] == EXPECTED[:6]
+    assert requests_seen[("Flaky Go", "Intro")] == 1 and requests_seen[("Flaky Go", "Core")] == 3
+    assert requests_seen[("Flaky Go", "Wrap-up")] == 2 * ai_service.ROADMAP_MODULE_ATTEMPTS
+    # Wrap-up never came back: its outline stands in, and the roadmap says so
+    wrap_up = roadmap["phases"][1]["modules"][0]["tasks"]
+    assert [(t["title"], t["description"]) for t in wrap_up] == [("Wrap-up", "a project")]
+    assert roadmap["incomplete_modules"] == 1
+
+
+def test_stream_releases_modules_in_order_and_single_completion_without_outline(stub):
+    async def collect(subject):
+        return [event async for event in ai_service.astream_full_roadmap(subject, "Beginner", "Job ready", 45, "2027-01-01", "Mixed")]
+
+    events = asyncio.run(collect("Rust"))
+    assert events[0] == ("title", "Rust Roadmap")
+    assert [e[3]["title"] for e in events if e[0] == "task"] == EXPECTED
+    assert [e[2] for e in events if e[0] == "module_done"] == ["Intro", "Core", "Wrap-up"]
+    # A module's tasks, then its module_done
+    assert [e[0] for e in events[1:5]] == ["task", "task", "module_done", "task"]
+    assert events[-1][0] == "done" and _titles(events[-1][1]) == EXPECTED
+
+    # No usable outline: the whole roadmap comes from one completion
+    roadmap = asyncio.run(ai_service.agenerate_full_roadmap("Broken Rust", "Beginner", "Job ready", 45, "2027-01-01", "Mixed"))
+    assert _titles(roadmap) == ["Whole 0"]
+
+
+def test_single_stream_holds_tasks_until_their_module_is_named(stub):
+    async def collect():
+        return [event async for event in ai_service.astream_full_roadmap("Broken Go", "Beginner", "Job ready", 45, "2027-01-01", "Mixed")]
+
+    events = asyncio.run(collect())
+    assert events[0] == ("title", "Single")
+    # The tasks came before "name": they are released under it, not a placeholder
+    assert [(e[0], e[2], e[3]["title"] if e[0] == "task" else None) for e in events[1:-1]] == [
+        ("task", "Late", "Late 0"), ("task", "Late", "Late 1"), ("module_done", "Late", None),
+        ("task", "Early", "Early 0"), ("module_done", "Early", None),
+    ]
+    assert all(e[1] == "P" for e in events[1:-1])
+    assert events[-1][0] == "done" and _titles(events[-1][1]) == ["Late 0", "Late 1", "Early 0"]
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,130 @@
+import json
+import re
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import roadmap_templates
+import task_pregen
+from database import SessionLocal
+from models import Roadmap, RoadmapTask
+
+
+def _roadmap(modules, tasks_per_module, minutes=60):
+    return {"title": "Your Personalized Python Roadmap", "phases": [{"name": "Phase 1", "modules": [
+        {"name": f"Module {m}", "tasks": [
+            {"title": f"Lesson {m}.{t}", "description": "d", "estimated_time": minutes, "output_deliverable": "o", "resource_type": "Mixed"}
+            for t in range(tasks_per_module)
+        ]} for m in range(modules)
+    ]}]}
+
+
+prompts_seen = []
+
+
+class OnboardingHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the level and roadmap prompts.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt_type = body["response_format"]["json_schema"]["name"]
+        prompts_seen.append(prompt_type)
+        if prompt_type == "roadmap_skeleton":
+            content = json.dumps({"title": "Python", "phases": [{"name": "Phase 1", "modules": [
+                {"name": f"Module {m}", "task_count": 5} for m in range(4)
+            ]}]})
+        elif prompt_type == "roadmap_module":
+            m = int(re.search(r"Module: Module (\d+)", body["messages"][-1]["content"]).group(1))
+            content = json.dumps({"tasks": _roadmap(4, 5)["phases"][0]["modules"][m]["tasks"]})
+        else:
+            content = json.dumps({"level": "Beginner", "message": "Welcome"})
+        payload = json.dumps({"choices": [{"message": {"content": content}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_scale_fits_tasks_to_days_and_daily_time():
+    today = date(2026, 1, 1)
+    roadmap = _roadmap(4, 5)
+
+    # Plenty of days: everything kept, times rescaled from 60 to 30 minute sessions
+    scaled = roadmap_templates.scale(roadmap, today + timedelta(days=60), 30, source_daily_minutes=60, today=today)
+    tasks = [t for m in scaled["phases"][0]["modules"] for t in m["tasks"]]
+    assert len(tasks) == 20 and {t["estimated_time"] for t in tasks} == {30}
+
+    # 10 days: every module keeps its first lesson and the order is preserved
+    scaled = roadmap_templates.scale(roadmap, today + timedelta(days=10), 90, source_daily_minutes=60, today=today)
+    modules = scaled["phases"][0]["modules"]
+    titles = [t["title"] for m in modules for t in m["tasks"]]
+    assert len(titles) == 10 and titles == sorted(titles)
+    assert [m["tasks"][0]["title"] for m in modules] == ["Lesson 0.0", "Lesson 1.0", "Lesson 2.0", "Lesson 3.0"]
+    assert all(m["tasks"][-1]["title"].endswith(".4") for m in modules)
+    assert {t["estimated_time"] for m in modules for t in m["tasks"]} == {90}
+
+    # Fewer days than modules: modules are sampled across the whole curriculum
+    scaled = roadmap_templates.scale(roadmap, today + timedelta(days=2), 45, today=today)
+    assert [m["name"] for m in scaled["phases"][0]["modules"]] == ["Module 0", "Module 3"]
+
+    # The template itself is never modified
+    assert len(roadmap["phases"][0]["modules"][0]["tasks"]) == 5
+
+
+def test_closest_template_when_generation_fails():
+    db = SessionLocal()
+    try:
+        roadmap_templates.remember(db, "Rust", "Beginner", "Job ready", "Videos", _roadmap(2, 2), 45)
+        roadmap_templates.remember(db, "Rust", "Advanced", "Job ready", "Mixed", _roadmap(3, 3), 45)
+        roadmap_templates.remember(db, "Rust", "Beginner", "Job ready", "Mixed", {"title": "bad"}, 45)  # invalid: not kept
+        db.commit()
+
+        assert roadmap_templates.find(db, "rust ", "beginner", "job-ready", "mixed") is None
+        closest = roadmap_templates.find(db, "Rust", "Beginner", "Exam prep", "Mixed", exact=False)
+        assert closest.level == "beginner" and closest.task_count == 4
+        assert roadmap_templates.find(db, "Go", "Beginner", "Job ready", "Mixed", exact=False) is None
+    finally:
+        db.close()
+
+
+def test_onboarding_reuses_template_for_same_combination(openrouter_stub, auth_headers, monkeypatch):
+    openrouter_stub(OnboardingHandler)
+    # Only onboarding is stubbed here
+    monkeypatch.setattr(task_pregen, "TASK_PREGEN_ENABLED", False)
+    client = TestClient(main.app)
+
+    def onboard(user, days):
+        body = {
+            "subjects": ["Python"], "exam_or_skill": "Job ready", "daily_time_minutes": 45,
+            "target_date": str(date.today() + timedelta(days=days)), "target_goal": "Job Ready", "learning_style": "Mixed",
+        }
+        assert client.post("/onboarding", json=body, headers=auth_headers(user)).status_code == 200
+        db = SessionLocal()
+        try:
+            roadmap = db.query(Roadmap).filter(Roadmap.user_id == user).one()
+            return db.query(RoadmapTask).filter(RoadmapTask.roadmap_id == roadmap.id).count()
+        finally:
+            db.close()
+
+    prompts_seen.clear()
+    assert onboard("template-user-1", 90) == 20
+    assert prompts_seen.count("roadmap_skeleton") == 1 and prompts_seen.count("roadmap_module") == 4
+
+    # Same subject/level/goal/style with less time: no generation, template scaled down
+    assert onboard("template-user-2", 8) == 8
+    assert prompts_seen.count("roadmap_skeleton") == 1
+    assert roadmap_templates.stats()["served"] >= 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,119 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import ai_service
+import semantic_cache
+
+SCOPE = semantic_cache.scope_key("Python", "Functions and Closures")
+requests_seen = []
+reply = {"answer": "A closure is a function that remembers variables from its enclosing scope.", "action": None}
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub answering every chat prompt with `reply`.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        requests_seen.append(body)
+        payload = json.dumps({"choices": [{"message": {"content": json.dumps(reply)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(openrouter_stub):
+    openrouter_stub(ChatHandler)
+    requests_seen.clear()
+    semantic_cache.clear()
+
+
+def test_paraphrases_hit_and_different_questions_miss():
+    semantic_cache.clear()
+    semantic_cache.store(SCOPE, "What is a closure?", {"answer": "closure"})
+    semantic_cache.store(SCOPE, "How do I read a file line by line?", {"answer": "files"})
+
+    for question in ("what's a closure", "What are closures?", "Can you explain closures in Python?"):
+        assert semantic_cache.lookup(SCOPE, question) == {"answer": "closure"}, question
+    for question in ("What is a lambda?", "How do I write a file line by line?", "What is a closure?x decorator"):
+        assert semantic_cache.lookup(SCOPE, question) is None, question
+
+    # Answers never cross topics, and unscoped questions are never shared
+    assert semantic_cache.lookup(semantic_cache.scope_key("Python", "Decorators"), "What is a closure?") is None
+    assert semantic_cache.scope_key("Python", None) is None
+
+
+def test_different_question_words_miss():
+    semantic_cache.clear()
+    semantic_cache.store(SCOPE, "Why do we use closures?", {"answer": "why"})
+    semantic_cache.store(SCOPE, "What is a closure?", {"answer": "what"})
+
+    # Same content words, different question: never the cached answer
+    for question in ("How do we use closures?", "When should I use closures?", "Should I use closures?", "Where do we use closures?"):
+        assert semantic_cache.lookup(SCOPE, question) is None, question
+    assert semantic_cache.lookup(SCOPE, "why do we use closures") == {"answer": "why"}
+    assert semantic_cache.lookup(SCOPE, "Explain closures") == {"answer": "what"}
+    assert semantic_cache.question_kind("What happens when a closure is called?") is None
+
+
+def test_eviction_and_expiry():
+    semantic_cache.clear()
+    saved = (semantic_cache.SEMANTIC_CACHE_MAX_PER_TOPIC, semantic_cache.SEMANTIC_CACHE_MAX_ENTRIES, semantic_cache.SEMANTIC_CACHE_TTL)
+    semantic_cache.SEMANTIC_CACHE_MAX_PER_TOPIC, semantic_cache.SEMANTIC_CACHE_MAX_ENTRIES = 2, 3
+    try:
+        before = semantic_cache.stats()["evictions"]
+        semantic_cache.store(SCOPE, "What is a closure?", {"answer": "closure"})
+        semantic_cache.store(SCOPE, "What is a generator?", {"answer": "generator"})
+        assert semantic_cache.lookup(SCOPE, "What is a closure?")  # closure is now most recently used
+        semantic_cache.store(SCOPE, "What is recursion?", {"answer": "recursion"})
+        assert semantic_cache.lookup(SCOPE, "What is a generator?") is None
+        assert semantic_cache.lookup(SCOPE, "What is a closure?") == {"answer": "closure"}
+
+        other = semantic_cache.scope_key("SQL", "Joins")
+        semantic_cache.store(other, "What is an inner join?", {"answer": "inner"})
+        semantic_cache.store(other, "What is a left join?", {"answer": "left"})
+        stats = semantic_cache.stats()
+        assert stats["entries"] == 3 and stats["evictions"] == before + 2
+
+        semantic_cache.SEMANTIC_CACHE_TTL = -1
+        assert semantic_cache.lookup(other, "What is a left join?") is None
+        assert semantic_cache.stats()["expired"] >= 2
+    finally:
+        semantic_cache.SEMANTIC_CACHE_MAX_PER_TOPIC, semantic_cache.SEMANTIC_CACHE_MAX_ENTRIES, semantic_cache.SEMANTIC_CACHE_TTL = saved
+
+
+def test_answer_question_serves_near_duplicates_from_cache(stub):
+    assert ai_service.answer_question("What is a closure?", cache_scope=SCOPE)["answer"] == reply["answer"]
+    assert ai_service.answer_question("what are closures?", cache_scope=SCOPE)["answer"] == reply["answer"]
+    assert len(requests_seen) == 1
+
+    # Without a scope nothing is cached or shared
+    ai_service.answer_question("What is a closure?")
+    assert len(requests_seen) == 2
+    assert semantic_cache.stats()["hit_rate"] > 0
+
+
+def test_answers_with_actions_are_not_shared(stub):
+    global reply
+    saved = reply
+    reply = {"answer": "Here is a better video.", "action": {"type": "update_resource", "new_link": "https://example.com/v"}}
+    try:
+        ai_service.answer_question("Give me a better video on closures", cache_scope=SCOPE)
+        ai_service.answer_question("Give me a better video on closures", cache_scope=SCOPE)
+        assert len(requests_seen) == 2
+    finally:
+        reply = saved
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
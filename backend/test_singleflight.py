@@ -0,0 +1,86 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import singleflight
+
+
+def test_concurrent_calls_share_one_execution():
+    group = singleflight.Group("test_sync")
+    upstream_calls = []
+
+    def slow_search(query):
+        upstream_calls.append(query)
+        time.sleep(0.2)
+        return [query.upper()]
+
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        results = list(pool.map(lambda _: group.do("python", slow_search, "python"), range(5)))
+
+    assert results == [["PYTHON"]] * 5
+    assert len(upstream_calls) == 1
+    stats = group.stats()
+    assert stats["executions"] == 1
+    assert stats["deduplicated"] == 4
+    assert stats["in_flight"] == 0
+
+
+def test_errors_reach_every_waiter():
+    group = singleflight.Group("test_sync_errors")
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.2)
+        raise RuntimeError("upstream down")
+
+    errors = []
+
+    def call():
+        try:
+            group.do("key", failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    waiters = [threading.Thread(target=call) for _ in range(3)]
+    for t in waiters:
+        t.start()
+    for t in [leader] + waiters:
+        t.join()
+
+    assert errors == ["upstream down"] * 4
+    assert group.stats()["shared_errors"] == 3
+
+
+def test_async_calls_share_one_execution():
+    group = singleflight.Group("test_async")
+    upstream_calls = []
+
+    async def completion(prompt):
+        upstream_calls.append(prompt)
+        await asyncio.sleep(0.1)
+        if prompt == "bad":
+            raise ValueError("bad prompt")
+        return f"answer to {prompt}"
+
+    async def run():
+        results = await asyncio.gather(*(group.ado("p", completion, "p") for _ in range(4)))
+        assert results == ["answer to p"] * 4
+
+        failures = await asyncio.gather(*(group.ado("bad", completion, "bad") for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(f, ValueError) for f in failures)
+
+    asyncio.run(run())
+    assert upstream_calls == ["p", "bad"]
+    assert group.stats()["deduplicated"] == 5
+
+
+if __name__ == "__main__":
+    test_concurrent_calls_share_one_execution()
+    test_errors_reach_every_waiter()
+    test_async_calls_share_one_execution()
+    print("Single-flight tests passed!", singleflight.stats())
@@ -0,0 +1,77 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+import ai_service
+import structured_output
+
+# Completions handed out in order; requests are recorded for inspection
+replies = []
+requests_seen = []
+
+
+class ScriptedHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub that answers with the queued completions.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        requests_seen.append(body)
+        payload = json.dumps({"choices": [{"message": {"content": replies.pop(0)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub(openrouter_stub):
+    openrouter_stub(ScriptedHandler)
+    replies.clear()
+    requests_seen.clear()
+
+
+def test_validation_coerces_and_rejects():
+    data, error = structured_output.validate("detect_level", {"level": "beginner", "message": "hi"})
+    assert error is None and data["level"] == "Beginner"
+
+    data, error = structured_output.validate("roadmap", {"title": "t", "phases": [{"name": "p", "modules": [{"name": "m", "tasks": [{"title": "x", "estimated_time": "45 minutes"}]}]}]})
+    assert data["phases"][0]["modules"][0]["tasks"][0]["estimated_time"] == 45
+
+    data, error = structured_output.validate("evaluation", {"score": 140, "feedback": "ok"})
+    assert data is None and "score" in error
+
+
+def test_invalid_reply_gets_one_repair_round_trip(stub):
+    before = structured_output.stats()["by_prompt"].get("evaluation", {}).get("repaired", 0)
+    replies.extend(['Sure! {"feedback": "Nice work"}', '{"score": 88, "feedback": "Nice work"}'])
+    result = json.loads(ai_service.evaluate_submission_content("Write a loop", "for i in range(3): print(i)"))
+    assert result["score"] == 88
+
+    first, repair = requests_seen
+    assert first["response_format"]["type"] == "json_schema"
+    assert "score" in first["response_format"]["json_schema"]["schema"]["properties"]
+    assert repair["messages"][-2] == {"role": "assistant", "content": 'Sure! {"feedback": "Nice work"}'}
+    assert "score" in repair["messages"][-1]["content"]
+
+    stats = structured_output.stats()["by_prompt"]["evaluation"]
+    assert stats["repaired"] == before + 1
+    assert stats["parse_failure_rate"] > 0
+
+
+def test_unrepairable_reply_returns_none(stub):
+    replies.extend(["I can't answer that.", '{"answer": 42}'])
+    assert ai_service.answer_question("what is a closure?") is None
+    assert len(requests_seen) == 2
+    assert structured_output.stats()["by_prompt"]["chat"]["failed"] >= 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
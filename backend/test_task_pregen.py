@@ -0,0 +1,124 @@
+import json
+import re
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import task_pregen
+import youtube_service
+from database import SessionLocal
+from models import DailyTask, Roadmap, RoadmapTask, TaskResource
+
+prepared_topics = []
+_seen_lock = threading.Lock()
+
+
+class MentorHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the onboarding and daily task prompts.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt_type = body["response_format"]["json_schema"]["name"]
+        prompt = body["messages"][-1]["content"]
+        if prompt_type == "roadmap_skeleton":
+            content = {"title": "Haskell Roadmap", "phases": [{"name": "Phase 1", "modules": [{"name": "Basics", "task_count": 6}]}]}
+        elif prompt_type == "roadmap_module":
+            content = {"tasks": [
+                {"title": f"Haskell Lesson {i}", "description": "d", "estimated_time": 30, "output_deliverable": "o", "resource_type": "Mixed"}
+                for i in range(6)
+            ]}
+        elif prompt_type == "curated_resources":
+            content = {"resources": [{"title": "Docs", "url": "https://haskell.org/docs", "platform": "Web", "resource_type": "docs"}]}
+        elif prompt_type == "daily_task":
+            topic = re.search(r"Haskell Lesson \d", prompt).group(0)
+            with _seen_lock:
+                prepared_topics.append(topic)
+            content = {"topic": topic, "description": f"Prepared: {topic}"}
+        else:
+            content = {"level": "Beginner", "message": "Welcome"}
+        payload = json.dumps({"choices": [{"message": {"content": json.dumps(content)}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _wait_for(condition, timeout=20):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.05)
+
+
+def _enriched(user):
+    db = SessionLocal()
+    try:
+        tasks = db.query(RoadmapTask).join(Roadmap).filter(Roadmap.user_id == user).order_by(RoadmapTask.order_index).all()
+        return [t.order_index for t in tasks if t.resource_links]
+    finally:
+        db.close()
+
+
+def test_unlocked_tasks_are_prepared_ahead_of_daily_plan(openrouter_stub, auth_headers, monkeypatch):
+    openrouter_stub(MentorHandler)
+    monkeypatch.setattr(youtube_service, "search_and_validate_videos", lambda query, limit=2: [])
+    headers = auth_headers("pregen-user", "p@example.com")
+    client = TestClient(main.app)
+    body = {
+        "subjects": ["Haskell"], "exam_or_skill": "Job ready", "daily_time_minutes": 45,
+        "target_date": str(date.today() + timedelta(days=60)), "target_goal": "Job Ready", "learning_style": "Mixed",
+    }
+    assert client.post("/onboarding", json=body, headers=headers).status_code == 200
+
+    # Onboarding unlocked the first task: it and the next ones are prepared in the background
+    ahead = task_pregen.TASK_PREGEN_AHEAD
+    _wait_for(lambda: _enriched("pregen-user") == list(range(ahead)))
+
+    # The dashboard only reads what was prepared
+    served = task_pregen.stats()["served"]
+    plan = client.get("/daily-plan", headers=headers).json()
+    assert task_pregen.stats()["served"] == served + 1
+    assert plan[0]["description"] == "Prepared: Haskell Lesson 0"
+    assert "https://haskell.org/docs" in [r["url"] for r in plan[0]["resources"]]
+
+    # ...and moves the look-ahead window on by one; nothing was generated twice
+    _wait_for(lambda: _enriched("pregen-user") == list(range(ahead + 1)))
+    _wait_for(lambda: task_pregen.stats()["in_flight"] == 0)
+    assert sorted(prepared_topics) == [f"Haskell Lesson {i}" for i in range(ahead + 1)]
+
+    # Completing the task unlocks one that is already prepared
+    client.patch(f"/roadmap/task/{plan[0]['roadmap_task_id']}/complete", headers=headers)
+    plan = client.get("/daily-plan", headers=headers).json()
+    assert plan[0]["description"] == "Prepared: Haskell Lesson 1"
+    _wait_for(lambda: _enriched("pregen-user") == list(range(ahead + 2)))
+    db = SessionLocal()
+    try:
+        # Resources are kept once per task, then handed to the day's task
+        prepared = db.query(TaskResource).join(RoadmapTask, TaskResource.roadmap_task_id == RoadmapTask.id).join(Roadmap).filter(
+            Roadmap.user_id == "pregen-user"
+        ).all()
+        assert len({r.roadmap_task_id for r in prepared}) == ahead + 2
+        assert len({r.daily_task_id for r in prepared if r.daily_task_id}) == 2
+        # ...and the day's tasks have no resources of their own
+        daily = db.query(TaskResource).join(DailyTask, TaskResource.daily_task_id == DailyTask.id).filter(
+            DailyTask.user_id == "pregen-user"
+        ).all()
+        assert daily and all(r.roadmap_task_id is not None for r in daily)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
@@ -0,0 +1,104 @@
+import json
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import weekly_summary
+from database import SessionLocal
+from models import DailyTask, Goal, Submission, User
+
+prompts = []
+
+
+class SummaryHandler(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible stub for the week summary prompt.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompts.append(body["messages"][-1]["content"])
+        payload = json.dumps({"choices": [{"message": {"content": f"Summary #{len(prompts)}"}}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _add_task(db, user_id, goal_id, day, topic, score=None):
+    task = DailyTask(user_id=user_id, goal_id=goal_id, topic=topic, description="d", date=day, is_completed=score is not None)
+    db.add(task)
+    db.flush()
+    if score is not None:
+        db.add(Submission(task_id=task.id, text="t", score=score, submitted_at=datetime.combine(day, datetime.min.time())))
+    return task
+
+
+def test_stats_cover_only_the_last_seven_days():
+    today = date.today()
+    db = SessionLocal()
+    try:
+        db.add(User(id="week-stats", email="w@example.com"))
+        goal = Goal(user_id="week-stats", subject="Go", exam_or_skill="Job ready", daily_time_minutes=30,
+                    target_date=today + timedelta(days=30), detected_level="Intermediate")
+        db.add(goal)
+        db.flush()
+        _add_task(db, "week-stats", goal.id, today - timedelta(days=20), "Old Topic", score=10)
+        _add_task(db, "week-stats", goal.id, today - timedelta(days=6), "Slices", score=6)
+        _add_task(db, "week-stats", goal.id, today - timedelta(days=1), "Maps", score=9)
+        _add_task(db, "week-stats", goal.id, today, "Goroutines")
+        db.commit()
+
+        stats = weekly_summary.compute(db, "week-stats", today)
+        assert stats == {"week": weekly_summary.iso_week(today), "completed_count": 2, "avg_score": 7.5,
+                         "level": "Intermediate", "topics": "Goroutines, Maps, Slices"}
+    finally:
+        db.close()
+    assert weekly_summary.iso_week(date(2026, 10, 18)) == "2026-W42"
+
+
+def test_summary_is_only_regenerated_when_stats_change(openrouter_stub, auth_headers):
+    openrouter_stub(SummaryHandler)
+    headers = auth_headers("week-user", "u@example.com")
+    client = TestClient(main.app)
+    today = date.today()
+    db = SessionLocal()
+    db.add(User(id="week-user", email="u@example.com"))
+    goal = Goal(user_id="week-user", subject="Go", exam_or_skill="Job ready", daily_time_minutes=30,
+                target_date=today + timedelta(days=30), detected_level="Beginner")
+    db.add(goal)
+    db.flush()
+    goal_id = goal.id
+    _add_task(db, "week-user", goal_id, today - timedelta(days=2), "Structs", score=8)
+    db.commit()
+    db.close()
+
+    first = client.get("/weekly-summary", headers=headers).json()
+    assert first["mentor_summary_text"] == "Summary #1" and "Tasks Completed: 1" in prompts[-1]
+
+    # Repeat visits read the stored summary
+    for _ in range(3):
+        assert client.get("/weekly-summary", headers=headers).json() == first
+    assert len(prompts) == 1
+
+    # New work this week changes the stats: written again, then cached again
+    db = SessionLocal()
+    _add_task(db, "week-user", goal_id, today, "Interfaces", score=10)
+    db.commit()
+    db.close()
+    assert client.get("/weekly-summary", headers=headers).json()["mentor_summary_text"] == "Summary #2"
+    assert "Tasks Completed: 2" in prompts[-1] and "Average Score: 9.0" in prompts[-1]
+    assert client.get("/weekly-summary", headers=headers).json()["mentor_summary_text"] == "Summary #2"
+    assert len(prompts) == 2
+
+
+if __name__ == "__main__":
+    raise SystemExit(pytest.main(["-q", __file__]))
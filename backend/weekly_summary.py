@@ -0,0 +1,103 @@
+"""
+Weekly check-in stats and the cached mentor summary written from them.
+
+Stats cover the past 7 days (today included) and are computed with SQL
+aggregates. The generated summary is stored per user and ISO week together
+with a fingerprint of the stats it was written for; a visit whose stats
+match gets the stored text, and the model is only asked again once the
+stats change (a task completed, a new score, tasks leaving the window).
+"""
+import json
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from models import DailyTask, Goal, Submission, WeeklySummary
+
+logger = logging.getLogger(__name__)
+
+WINDOW_DAYS = 7
+TOPICS = 5
+
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stored": 0}
+
+
+def _count(field):
+    with _lock:
+        _stats[field] += 1
+
+
+def iso_week(day):
+    year, week, _ = day.isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def compute(db, user_id, today):
+    """
+    The user's stats for the 7 days ending `today`.
+    """
+    start = today - timedelta(days=WINDOW_DAYS - 1)
+    in_window = (DailyTask.user_id == user_id, DailyTask.date >= start, DailyTask.date <= today)
+
+    completed = db.query(func.count(DailyTask.id)).filter(*in_window, DailyTask.is_completed == True).scalar()
+    avg_score = db.query(func.avg(Submission.score)).join(DailyTask).filter(
+        DailyTask.user_id == user_id,
+        Submission.submitted_at >= datetime.combine(start, datetime.min.time()),
+    ).scalar()
+    topics = [row.topic for row in db.query(DailyTask.topic).filter(*in_window).order_by(
+        DailyTask.date.desc(), DailyTask.id.desc()
+    ).limit(TOPICS)]
+    level = db.query(Goal.detected_level).filter(Goal.user_id == user_id).order_by(Goal.id).limit(1).scalar()
+
+    return {
+        "week": iso_week(today),
+        "completed_count": completed or 0,
+        "avg_score": round(float(avg_score), 1) if avg_score is not None else 0,
+        "level": level or "Beginner",
+        "topics": ", ".join(topics),
+    }
+
+
+def fingerprint(stats):
+    return hashlib.sha256(json.dumps(stats, sort_keys=True).encode()).hexdigest()
+
+
+def cached(db, user_id, stats):
+    """
+    The summary already written for exactly these stats this week, or None.
+    """
+    row = db.query(WeeklySummary).filter(WeeklySummary.user_id == user_id, WeeklySummary.week == stats["week"]).first()
+    if row is not None and row.fingerprint == fingerprint(stats):
+        _count("hits")
+        return row.summary
+    _count("misses")
+    return None
+
+
+def store(db, user_id, stats, summary):
+    """
+    Keeps `summary` as this week's text for `stats`, replacing an older one.
+    """
+    try:
+        db.merge(WeeklySummary(
+            user_id=user_id, week=stats["week"], fingerprint=fingerprint(stats), summary=summary, created_at=datetime.utcnow()
+        ))
+        db.commit()
+        _count("stored")
+    except IntegrityError:
+        # A concurrent visit stored it first
+        db.rollback()
+    except Exception as e:
+        db.rollback()
+        logger.warning("Could not store the weekly summary for %s: %s", user_id, e)
+
+
+def stats():
+    with _lock:
+        snapshot = dict(_stats)
+    lookups = snapshot["hits"] + snapshot["misses"]
+    snapshot["hit_rate"] = round(snapshot["hits"] / lookups, 3) if lookups else 0.0
+    return snapshot
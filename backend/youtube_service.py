@@ -2,11 +2,14 @@ import yt_dlp
 import logging
 from typing import List, Dict, Optional
 from datetime import datetime
+import singleflight
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+_search_flight = singleflight.Group("youtube_search")
+
 class YouTubeService:
     """
     Service for searching and validating YouTube videos using yt-dlp.
@@ -23,6 +26,7 @@ class YouTubeService:
     def search_videos(self, query: str, limit: int = 5) -> List[Dict]:
         """
         Search YouTube for videos and return validated, embeddable results.
+        Concurrent identical searches share a single yt-dlp run.
         
         Args:
             query: Search query string
@@ -31,6 +35,10 @@ class YouTubeService:
         Returns:
             List of validated video dictionaries with metadata
         """
+        results = _search_flight.do((query, limit), self._search_videos, query, limit)
+        return list(results)
+    
+    def _search_videos(self, query: str, limit: int) -> List[Dict]:
         logger.info(f"Searching YouTube for: {query}")
         
         try:
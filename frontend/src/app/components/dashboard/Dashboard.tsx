@@ -122,11 +122,30 @@ export function Dashboard() {
     setIsTyping(true);
 
     try {
-      const res = await api.post('/chat', {
+      let started = false;
+      // Append tokens to the last (assistant) message as they stream in
+      const appendToReply = (text: string, replace = false) => {
+        setChatHistory(prev => {
+          const last = prev[prev.length - 1];
+          return [...prev.slice(0, -1), { ...last, content: replace ? text : last.content + text }];
+        });
+      };
+
+      await api.stream('/chat/stream', {
         message: messageToSend,
         task_id: dailyTasks[0]?.id
+      }, (event, data) => {
+        if (!started) {
+          started = true;
+          setIsTyping(false);
+          setChatHistory(prev => [...prev, { role: 'assistant', content: '' }]);
+        }
+        if (event === 'token') {
+          appendToReply(data.text);
+        } else if (event === 'done') {
+          appendToReply(data.response, true);
+        }
       });
-      setChatHistory(prev => [...prev, { role: 'assistant', content: res.response }]);
     } catch (err) {
       setChatHistory(prev => [...prev, { role: 'assistant', content: "Sorry, I'm having trouble connecting right now." }]);
     } finally {
@@ -64,9 +64,11 @@ export function Onboarding() {
     } else if (step === 4) {
       // Submit data to backend before moving to step 5
       setLoading(true);
+      // Roadmaps keep generating server-side after 'ready', so the user can move on early
+      let ready = false;
       try {
         const filteredSkills = skills.filter(s => s.trim() !== '');
-        const result = await api.post('/onboarding', {
+        await api.stream('/onboarding/stream', {
           subjects: filteredSkills,
           full_name: fullName,
           exam_or_skill: "General Mastery", // Defaulting for simple UI
@@ -74,12 +76,24 @@ export function Onboarding() {
           target_date: targetDate || new Date(Date.now() + 90 * 24 * 60 * 60 * 1000).toISOString().split('T')[0], // Default 90 days
           target_goal: targetGoal,
           learning_style: learningStyle
+        }, (event, data) => {
+          if (event === 'ready' || event === 'done') {
+            ready = true;
+            setOnboardingResult(data);
+            setStep(5);
+            setLoading(false);
+          } else if (event === 'subject_done') {
+            setOnboardingResult((prev: any) => ({
+              ...prev,
+              goals: [...(prev?.goals || []).filter((g: any) => g.subject !== data.subject), data]
+            }));
+          } else if (event === 'error') {
+            throw new Error(data.detail);
+          }
         });
-        setOnboardingResult(result);
-        setStep(5);
       } catch (error) {
         console.error("Onboarding failed", error);
-        alert("Failed to save goals. Please try again.");
+        if (!ready) alert("Failed to save goals. Please try again.");
       } finally {
         setLoading(false);
       }
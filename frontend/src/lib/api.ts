@@ -65,6 +65,62 @@ const makeRequest = async (endpoint: string, options: RequestInit = {}) => {
     return res.json();
 };
 
+// Server-Sent Events over POST (EventSource only supports GET)
+const streamRequest = async (endpoint: string, body: any, onEvent: (event: string, data: any) => void) => {
+    const token = await getSessionToken();
+
+    if (!token) {
+        console.error("No auth token available - redirecting to login");
+        await handle401Error();
+        throw new Error('Authentication required');
+    }
+
+    const res = await fetch(`${BACKEND_URL}${endpoint}`, {
+        method: 'POST',
+        headers: {
+            'Authorization': `Bearer ${token}`,
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+        },
+        body: JSON.stringify(body),
+    });
+
+    if (res.status === 401) {
+        console.error('401 Unauthorized response from backend');
+        await handle401Error();
+        throw new Error('Session expired or invalid token');
+    }
+
+    if (!res.ok || !res.body) {
+        throw new Error(`Request failed with status ${res.status}`);
+    }
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const rawEvent = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+
+            let event = 'message';
+            let data = '';
+            for (const line of rawEvent.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+};
+
 export const api = {
     get: async (endpoint: string) => {
         return makeRequest(endpoint, { method: 'GET' });
@@ -95,6 +151,10 @@ export const api = {
         return makeRequest(endpoint, { method: 'DELETE' });
     },
 
+    stream: async (endpoint: string, body: any, onEvent: (event: string, data: any) => void) => {
+        return streamRequest(endpoint, body, onEvent);
+    },
+
     // Logout function to clear session
     logout: async () => {
         await supabase.auth.signOut();